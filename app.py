@@ -1,58 +1,200 @@
-
-from flask import Flask, render_template, Response, jsonify, request, redirect, url_for, flash, send_from_directory
-import cv2
-import threading
 import time
+_module_started = time.perf_counter()
+from flask import Flask, Blueprint, current_app, render_template, Response, jsonify, request, redirect, url_for, flash, send_file, abort, session
 import json
-import numpy as np
 from datetime import datetime, date
 import os
 import csv
+import secrets
+import re
+import mimetypes
 from io import StringIO
-import requests
 from dotenv import load_dotenv
+import click
+from flask_sock import Sock
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
+from sqlalchemy.orm import aliased, configure_mappers, contains_eager, joinedload
+from werkzeug.local import LocalProxy
+from ingest import IngestRequest
 
 load_dotenv()
-app = Flask(__name__)
-
-# Database and authentication setup
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-database_url = os.getenv('SUPABASE_DATABASE_URL', os.getenv('DATABASE_URL', 'sqlite:///attendance.db'))
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# PostgreSQL specific configuration for Supabase
-if database_url.startswith('postgresql'):
-    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-        'pool_pre_ping': True,
-        'pool_recycle': 300,
-    }
-
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Rutas y comandos de la app; create_app los registra en cada instancia
+bp = Blueprint('main', __name__, cli_group=None)
+# WebSocket para la transcripción en tiempo real
+sock = Sock()
+
+from models import db, User, Department, Position, Shift, Attendance, Evidence, SystemLog, migrate_csv_data, upgrade_schema
+from schedule import shift_schedule
+from user_cache import user_cache
+from refdata import department_cache, position_cache
+from provisioning import provision_users
+from evidence_storage import EvidenceStorage
+from circuit_breaker import ServiceUnavailable
+from evidence_derivatives import DerivativePipeline, derivative_name, pick_derivative
+from subsystems import LazySubsystem, record_timing, startup_timings
+from state_store import create_store
+import upload_layout
+import cache_sync
 
-# Ensure upload folder exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-from models import db, User, Department, Position, Attendance, Evidence, SystemLog, migrate_csv_data
-
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
-# Configuración desde variables de entorno
-ASSEMBLYAI_API_KEY = os.getenv('ASSEMBLYAI_API_KEY')
+login_manager.login_view = 'main.login'
 FLASK_ENV = os.getenv('FLASK_ENV', 'production')
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 
+def env_flag(name, default='False'):
+    return os.getenv(name, default).lower() == 'true'
+
+def app_service(name):
+    """Servicio de la app de la petición en curso (ver AppServices)"""
+    return LocalProxy(lambda: getattr(current_app.extensions['asistencia'], name))
+
+# Cada app tiene los suyos; en las rutas se usan a través de estos proxies
+state_store = app_service('state_store')
+evidence_storage = app_service('evidence_storage')
+derivative_pipeline = app_service('derivative_pipeline')
+vision = app_service('vision')
+face_detector = app_service('face_detector')
+transcription = app_service('transcription')
+
+def create_app(config=None):
+    """Crear y configurar una instancia nueva de la aplicación.
+
+    `config` se aplica sobre la configuración del entorno antes de montar
+    nada, así que cada llamada tiene su propia base de datos, carpeta de
+    subidas y almacén de estado (tests, CLI). Solo se monta lo que necesita
+    cualquier proceso (Flask, SQLAlchemy, login): la cámara, OpenCV y la
+    transcripción se crean al usarse por primera vez, o al arrancar con
+    START_VIDEO_CAPTURE / PRELOAD_TRANSCRIPTION.
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    # Las subidas se vuelcan por bloques a un temporal (hash y tipo al vuelo)
+    app.request_class = IngestRequest
+
+    # Database and authentication setup
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
+    database_url = os.getenv('SUPABASE_DATABASE_URL', os.getenv('DATABASE_URL', 'sqlite:///attendance.db'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # PostgreSQL specific configuration for Supabase
+    if database_url.startswith('postgresql'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_pre_ping': True,
+            'pool_recycle': 300,
+        }
+
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['INGEST_LIMITS'] = {
+        'image': 16 * 1024 * 1024,
+        'audio': 10 * 1024 * 1024,
+        'csv': 8 * 1024 * 1024,  # Alta masiva de usuarios
+        'other': 1 * 1024 * 1024,
+    }
+    # Entrega de archivos por el proxy tras comprobar el login (opcional)
+    app.config['UPLOAD_ACCEL_REDIRECT'] = os.getenv('UPLOAD_ACCEL_REDIRECT')  # p. ej. /protected-uploads/ en nginx
+    app.config['USE_X_SENDFILE'] = env_flag('USE_X_SENDFILE')
+    app.config['EVIDENCE_DERIVATIVE_WORKERS'] = int(os.getenv('EVIDENCE_DERIVATIVE_WORKERS', 2))
+    # Recompresión del original al subir: reduce tamaño y elimina EXIF (GPS, etc.)
+    app.config['EVIDENCE_RECOMPRESS'] = env_flag('EVIDENCE_RECOMPRESS')
+    app.config['EVIDENCE_MAX_SIDE'] = int(os.getenv('EVIDENCE_MAX_SIDE', 2048))
+    app.config['EVIDENCE_QUALITY'] = int(os.getenv('EVIDENCE_QUALITY', 82))
+    app.config['EVIDENCE_RECOMPRESS_FORMAT'] = os.getenv('EVIDENCE_RECOMPRESS_FORMAT', 'jpeg')  # jpeg o webp
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 60))
+
+    # AssemblyAI (se usa al montar el subsistema de transcripción)
+    app.config['ASSEMBLYAI_API_KEY'] = os.getenv('ASSEMBLYAI_API_KEY')
+    app.config['ASSEMBLYAI_BASE_URL'] = os.getenv('ASSEMBLYAI_BASE_URL', 'https://api.assemblyai.com')
+    app.config['ASSEMBLYAI_STREAMING_URL'] = os.getenv('ASSEMBLYAI_STREAMING_URL', 'wss://streaming.assemblyai.com/v3/ws')
+    app.config['ASSEMBLYAI_STREAMING_MODEL'] = os.getenv('ASSEMBLYAI_STREAMING_MODEL', 'universal-streaming-multilingual')
+    # URL pública de /api/assemblyai/webhook; sin ella se usa solo polling
+    app.config['ASSEMBLYAI_WEBHOOK_URL'] = os.getenv('ASSEMBLYAI_WEBHOOK_URL')
+    app.config['ASSEMBLYAI_WEBHOOK_SECRET'] = os.getenv('ASSEMBLYAI_WEBHOOK_SECRET')
+    if app.config['ASSEMBLYAI_WEBHOOK_URL'] and not app.config['ASSEMBLYAI_WEBHOOK_SECRET']:
+        # Un secreto aleatorio sería distinto en cada worker y se rechazarían los avisos
+        app.config['ASSEMBLYAI_WEBHOOK_URL'] = None
+        print("❌ ASSEMBLYAI_WEBHOOK_URL sin ASSEMBLYAI_WEBHOOK_SECRET: webhooks desactivados, se usa solo polling")
+    app.config['AUDIO_PREPROCESS'] = env_flag('AUDIO_PREPROCESS', 'True')
+    app.config['TRANSCRIPTION_CACHE_SIZE'] = int(os.getenv('TRANSCRIPTION_CACHE_SIZE', 256))
+    app.config['TRANSCRIPTION_CACHE_TTL'] = int(os.getenv('TRANSCRIPTION_CACHE_TTL', 86400))
+    app.config['TRANSCRIPTION_CACHE_PATH'] = os.getenv('TRANSCRIPTION_CACHE_PATH')  # p. ej. instance/transcripciones.db
+    app.config['TRANSCRIBE_UPLOAD_WORKERS'] = int(os.getenv('TRANSCRIBE_UPLOAD_WORKERS', 2))
+    app.config['TRANSCRIBE_TIMEOUT'] = int(os.getenv('TRANSCRIBE_TIMEOUT', 120))
+    app.config['TRANSCRIBE_FALLBACK_POLL'] = float(os.getenv('TRANSCRIBE_FALLBACK_POLL', 15))
+    app.config['TRANSCRIBE_MAX_IN_FLIGHT'] = int(os.getenv('TRANSCRIBE_MAX_IN_FLIGHT', 16))
+    app.config['REALTIME_MAX_SESSIONS'] = int(os.getenv('REALTIME_MAX_SESSIONS', 2))
+    app.config['ASSEMBLYAI_BREAKER_WINDOW'] = int(os.getenv('ASSEMBLYAI_BREAKER_WINDOW', 60))
+    app.config['ASSEMBLYAI_BREAKER_MIN_CALLS'] = int(os.getenv('ASSEMBLYAI_BREAKER_MIN_CALLS', 5))
+    app.config['ASSEMBLYAI_BREAKER_FAILURE_RATE'] = float(os.getenv('ASSEMBLYAI_BREAKER_FAILURE_RATE', 0.5))
+    app.config['ASSEMBLYAI_BREAKER_RESET'] = int(os.getenv('ASSEMBLYAI_BREAKER_RESET', 30))
+
+    # Estado de cada kiosco: memory (un solo worker), sqlite (varios workers en
+    # la misma máquina; en /dev/shm queda en memoria compartida) o redis
+    app.config['STATE_BACKEND'] = os.getenv('STATE_BACKEND', 'memory')
+    app.config['STATE_PATH'] = os.getenv('STATE_PATH', 'instance/state.db')
+    app.config['STATE_URL'] = os.getenv('STATE_URL')  # p. ej. redis://localhost:6379/0
+    app.config['STATE_TTL'] = int(os.getenv('STATE_TTL', 43200))
+    # Cada cuántos segundos mira cada worker si otro cambió usuarios, turnos o
+    # catálogos (lo que tarda un cambio en verse en todos los workers)
+    app.config['CACHE_SYNC_INTERVAL'] = float(os.getenv('CACHE_SYNC_INTERVAL', 1.0))
+
+    # Con varios workers, un solo proceso abre la cámara y publica los frames
+    # en memoria compartida (ver camera_process.py; necesita estado compartido)
+    app.config['CAMERA_PROCESS'] = env_flag('CAMERA_PROCESS')
+    app.config['CAMERA_SHM_NAME'] = os.getenv('CAMERA_SHM_NAME', 'asistencia-camera')
+    app.config['CAMERA_LOCK_PATH'] = os.getenv('CAMERA_LOCK_PATH')
+    app.config['CAMERA_IDLE_TIMEOUT'] = int(os.getenv('CAMERA_IDLE_TIMEOUT', 300))
+
+    # Arranque opcional de lo que normalmente se crea al primer uso
+    app.config['START_VIDEO_CAPTURE'] = env_flag('START_VIDEO_CAPTURE')
+    app.config['PRELOAD_TRANSCRIPTION'] = env_flag('PRELOAD_TRANSCRIPTION')
+    # Migración opcional de subidas antiguas al esquema por subcarpetas
+    app.config['MIGRATE_UPLOADS_IN_BACKGROUND'] = env_flag('MIGRATE_UPLOADS_IN_BACKGROUND')
+    app.config.update(config or {})
+
+    # Ensure upload folder exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    db.init_app(app)
+    # Los backrefs (Attendance.user...) solo existen tras configurar los mappers,
+    # y las consultas los usan al construirse, antes de tocar la base
+    configure_mappers()
+    login_manager.init_app(app)
+    sock.init_app(app)
+    app.register_blueprint(bp)
+    services = AppServices(app)
+    app.extensions['asistencia'] = services
+    # Las cachés en memoria son del proceso: se sincronizan con el último almacén creado
+    cache_sync.attach(services.state_store, app.config['CACHE_SYNC_INTERVAL'])
+    user_cache.maxsize = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+
+    # Sin API key la app arranca igual; solo queda desactivada la entrada por voz
+    if not app.config['ASSEMBLYAI_API_KEY']:
+        print("⚠️ ASSEMBLYAI_API_KEY no encontrada en variables de entorno: entrada por voz desactivada")
+        print("💡 Crea un archivo .env con tu API key")
+    if app.config['CAMERA_PROCESS'] and app.config['STATE_BACKEND'] == 'memory':
+        print("⚠️ CAMERA_PROCESS con STATE_BACKEND=memory: el proceso de cámara no verá el estado de los kioscos")
+
+    record_timing('create_app', started)
+    if app.config['PRELOAD_TRANSCRIPTION']:
+        services.transcription.get()
+    if app.config['START_VIDEO_CAPTURE']:
+        services.vision.get().start()
+    if app.config['MIGRATE_UPLOADS_IN_BACKGROUND']:
+        upload_layout.start_background_migration(app.config['UPLOAD_FOLDER'])
+    return app
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    # Snapshot en caché: identificar al usuario no consulta la base en cada petición
+    return user_cache.get(int(user_id))
 
-def create_tables():
+def create_tables(app=None):
     """Create database tables and migrate data if needed"""
+    app = app or create_app()
     with app.app_context():
         try:
             db.create_all()
@@ -61,6 +203,16 @@ def create_tables():
             print(f"❌ Error conectando a la base de datos: {e}")
             print("💡 Verifica tu configuración de SUPABASE_DATABASE_URL en .env")
             return False
+        try:
+            # Bases creadas por versiones anteriores: columnas, índices y fotos antiguas
+            upgrade_schema()
+            adopted = app.extensions['asistencia'].evidence_storage.adopt_legacy_files()
+            if adopted:
+                print(f"✅ {adopted} fotos antiguas pasadas al almacén por hash")
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error actualizando el esquema de la base de datos: {e}")
+            return False
         return True
 
         # Create default admin user if none exists
@@ -105,11 +257,34 @@ def create_tables():
             db.session.rollback()
             print(f"Error initializing database: {e}")
 
-# Verificar que la API key esté configurada
-if not ASSEMBLYAI_API_KEY:
-    print("❌ ERROR: ASSEMBLYAI_API_KEY no encontrada en variables de entorno")
-    print("💡 Crea un archivo .env con tu API key")
-    exit(1)
+@bp.cli.command('mark-absences')
+@click.option('--date', 'day', default=None, help='Fecha a procesar (YYYY-MM-DD), por defecto hoy')
+def mark_absences_command(day):
+    """Marcar ausencias del día para usuarios con turno y sin registro"""
+    target = date.fromisoformat(day) if day else date.today()
+    marked = shift_schedule.mark_absences(target)
+    print(f"✅ {marked} ausencias registradas para {target.isoformat()}")
+
+@bp.cli.command('provision-users')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=500, show_default=True, help='Usuarios por transacción')
+@click.option('--workers', default=None, type=int, help='Procesos para calcular los hashes')
+def provision_users_command(csv_path, batch_size, workers):
+    """Crear usuarios en lote desde un archivo CSV"""
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        result = provision_users(f, batch_size=batch_size, workers=workers)
+    for entry in result['rows']:
+        if entry['status'] != 'created':
+            print(f"❌ Fila {entry['row']} ({entry['username']}): {entry['error']}")
+    print(f"✅ {result['created']} usuarios creados, {result['failed']} con errores")
+
+@bp.cli.command('migrate-uploads')
+@click.option('--batch-size', default=500, show_default=True, help='Archivos por lote')
+@click.option('--pause', default=0.0, show_default=True, help='Segundos de espera entre lotes')
+def migrate_uploads_command(batch_size, pause):
+    """Mover las subidas de la carpeta plana a subcarpetas ab/cd (reanudable)"""
+    moved = upload_layout.migrate_flat_uploads(current_app.config['UPLOAD_FOLDER'], batch_size=batch_size, pause=pause)
+    print(f"✅ {moved} archivos movidos a subcarpetas")
 
 # Estado del sistema
 class SystemState:
@@ -119,95 +294,30 @@ class SystemState:
     REGISTERING = "registering"
     COMPLETED = "completed"
 
-system_state = SystemState.WAITING
-current_user_data = {}
-last_registered_user = {}
+KIOSK_DEFAULTS = {
+    'system_state': SystemState.WAITING,
+    'face_detected': False,
+    'current_user_data': {},
+    'last_registered_user': {},
+}
 
-class Camera:
-    def __init__(self, camera_index=0):
-        self.camera_index = camera_index
-        self.cap = None
-        self.last_frame = None
-    
-    def initialize_camera(self):
-        """Inicializar cámara"""
-        try:
-            # cv2.CAP_DSHOW is Windows only, removing it for Linux compatibility
-            if os.name == 'nt':
-                self.cap = cv2.VideoCapture(self.camera_index, cv2.CAP_DSHOW)
-            else:
-                self.cap = cv2.VideoCapture(self.camera_index)
+def kiosk_id():
+    """Cada navegador es un kiosco; su id viaja en la cookie de sesión"""
+    if 'kiosk_id' not in session:
+        session['kiosk_id'] = secrets.token_hex(8)
+    return session['kiosk_id']
 
-            if self.cap.isOpened():
-                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                return True
-        except Exception as e:
-            print(f"Error cámara: {e}")
-        return False
-    
-    def get_frame(self):
-        """Obtener frame de la cámara"""
-        if self.cap and self.cap.isOpened():
-            try:
-                ret, frame = self.cap.read()
-                if ret:
-                    return frame
-            except Exception as e:
-                print(f"Error capturando frame: {e}")
-        
-        # Frame de simulación
-        return self.create_test_frame()
-    
-    def create_test_frame(self):
-        """Crear frame de prueba"""
-        frame = np.ones((480, 640, 3), dtype=np.uint8) * 60
-        cv2.putText(frame, "CAMARA NO DISPONIBLE", (50, 240), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.putText(frame, "Usando modo simulacion", (50, 280), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        return frame
-    
-    def release(self):
-        if self.cap:
-            self.cap.release()
+def kiosk_state(kiosk=None):
+    """Estado del kiosco de la petición (o de `kiosk`)"""
+    return {**KIOSK_DEFAULTS, **state_store.get(f"kiosk:{kiosk or kiosk_id()}", {})}
 
-class FaceDetector:
-    def __init__(self):
-        try:
-            self.face_cascade = cv2.CascadeClassifier(
-                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            )
-        except:
-            self.face_cascade = None
-    
-    def detect_face(self, frame):
-        """Detectar si hay un rostro en el frame"""
-        if self.face_cascade is None:
-            return frame, True  # En simulación, siempre detecta rostro
-        
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(100, 100))
-        
-        # Dibujar rectángulo alrededor del rostro
-        for (x, y, w, h) in faces:
-            cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 3)
-            cv2.putText(frame, "ROSTRO DETECTADO", (x, y-10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        
-        # Mostrar instrucciones
-        if len(faces) > 0:
-            cv2.putText(frame, "✓ Rostro detectado - Puede continuar", 
-                       (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-        else:
-            cv2.putText(frame, "Acercarse a la camara para deteccion", 
-                       (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-        
-        return frame, len(faces) > 0
+def update_kiosk(kiosk=None, **changes):
+    """Cambiar el estado del kiosco y devolverlo completo"""
+    return state_store.update(f"kiosk:{kiosk or kiosk_id()}", changes, KIOSK_DEFAULTS)
 
 class AttendanceManager:
     @staticmethod
-    def register_attendance(user_id, user_data=None):
+    def register_attendance(user_id, user_data=None, user=None):
         """Registrar asistencia en base de datos"""
         today = date.today()
         now = datetime.now()
@@ -215,7 +325,7 @@ class AttendanceManager:
         # Check if user already checked in today
         existing = Attendance.query.filter_by(user_id=user_id, date=today).first()
 
-        if existing and not existing.check_out_time:
+        if existing and existing.check_in_time and not existing.check_out_time:
             # Prevent check-out immediately after check-in (minimum 1 minute)
             time_since_checkin = now - existing.check_in_time
             if time_since_checkin.total_seconds() < 60:  # 60 seconds = 1 minute
@@ -232,14 +342,22 @@ class AttendanceManager:
     
             print(f"✅ Check-out registrado para usuario {user_id}")
             return existing
-        elif not existing:
-            # Check in
-            attendance = Attendance(
-                user_id=user_id,
-                date=today,
-                check_in_time=now,
-                status='present'
-            )
+        elif not existing or not existing.check_in_time:
+            # Check in (también sobre un registro marcado previamente como ausente)
+            user = user or db.session.get(User, user_id)
+            status = shift_schedule.classify(user.department_id, user.position_id, now)
+            if existing:
+                attendance = existing
+                attendance.check_in_time = now
+                attendance.status = status
+                attendance.updated_at = now
+            else:
+                attendance = Attendance(
+                    user_id=user_id,
+                    date=today,
+                    check_in_time=now,
+                    status=status
+                )
 
             # Add legacy data if provided (for migration)
             if user_data:
@@ -271,366 +389,314 @@ class AttendanceManager:
         return query.order_by(Attendance.date.desc()).all()
 
     @staticmethod
-    def get_all_records():
-        """Obtener todos los registros para exportación"""
-        attendances = Attendance.query.join(User).order_by(Attendance.date.desc(), Attendance.check_in_time.desc()).all()
-
-        records = []
-        for att in attendances:
-            record = {
-                'Fecha': att.date.strftime('%Y-%m-%d'),
-                'Hora_Ingreso': att.check_in_time.strftime('%H:%M:%S') if att.check_in_time else '',
-                'Hora_Salida': att.check_out_time.strftime('%H:%M:%S') if att.check_out_time else '',
-                'Nombre': att.user.first_name,
-                'Apellido': att.user.last_name,
-                'Correo': att.user.email,
-                'Departamento': att.user.department.name if att.user.department else '',
-                'Posicion': att.user.position.name if att.user.position else '',
-                'Estado': att.status,
-                'Horas_Trabajadas': f"{att.total_hours:.2f}" if att.total_hours > 0 else '',
-                'Timestamp': att.created_at.isoformat()
-            }
-            records.append(record)
+    def serialize_record(att):
+        """Fila de registros/exportación (espera usuario, departamento y posición cargados)"""
+        return {
+            'Fecha': att.date.strftime('%Y-%m-%d'),
+            'Hora_Ingreso': att.check_in_time.strftime('%H:%M:%S') if att.check_in_time else '',
+            'Hora_Salida': att.check_out_time.strftime('%H:%M:%S') if att.check_out_time else '',
+            'Nombre': att.user.first_name,
+            'Apellido': att.user.last_name,
+            'Correo': att.user.email,
+            'Departamento': att.user.department.name if att.user.department else '',
+            'Posicion': att.user.position.name if att.user.position else '',
+            'Estado': att.status,
+            'Horas_Trabajadas': f"{att.total_hours:.2f}" if att.total_hours > 0 else '',
+            'Timestamp': att.created_at.isoformat()
+        }
 
-        return records
+    @staticmethod
+    def records_query(user=None):
+        """Registros visibles para `user` (todos si es None o admin; su departamento
+        si es manager; los propios si es empleado), del más reciente al más antiguo"""
+        stmt = (
+            db.select(Attendance)
+            .join(Attendance.user)
+            .options(contains_eager(Attendance.user).joinedload(User.department),
+                     contains_eager(Attendance.user).joinedload(User.position))
+            # Las ausencias (sin hora de entrada) al final del día en cualquier base
+            .order_by(Attendance.date.desc(), Attendance.check_in_time.desc().nulls_last(), Attendance.id.desc())
+        )
+        if user is None or user.is_admin():
+            return stmt
+        if user.is_manager():
+            return stmt.where(User.department_id == user.department_id)
+        return stmt.where(Attendance.user_id == user.id)
 
     @staticmethod
-    def has_records():
-        """Verificar si hay registros"""
-        return Attendance.query.count() > 0
+    def get_records(user=None, limit=None):
+        stmt = AttendanceManager.records_query(user)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        attendances = db.session.execute(stmt).scalars().all()
+        return [AttendanceManager.serialize_record(att) for att in attendances]
 
     @staticmethod
-    def get_today_stats():
-        """Obtener estadísticas del día"""
-        today = date.today()
-        attendances = Attendance.query.filter_by(date=today).all()
+    def records_page(user=None, before=None, limit=50):
+        """Página de registros posteriores (más antiguos) al registro `before`.
 
-        stats = {
-            'total_checkins': len([a for a in attendances if a.check_in_time]),
-            'total_checkouts': len([a for a in attendances if a.check_out_time]),
-            'present_today': len(attendances),
-            'late_arrivals': len([a for a in attendances if a.status == 'late'])
-        }
-        return stats
-
-# Cliente AssemblyAI personalizado
-class SimpleTranscriber:
-    def __init__(self, api_key=None):
-        self.api_key = api_key
-        self.enabled = bool(api_key and api_key != "tu_api_key_aqui")
-        print(f"🔧 AssemblyAI configurado: {self.enabled}")
-    
-    def transcribe_audio(self, audio_file_path):
-        """Transcripción simple usando la API REST de AssemblyAI"""
-        if not self.enabled:
-            return {"error": "AssemblyAI no configurado"}
-        
-        try:
-            print("📤 Subiendo audio a AssemblyAI...")
-            
-            # Leer archivo de audio
-            with open(audio_file_path, 'rb') as audio_file:
-                # Subir archivo
-                upload_response = requests.post(
-                    'https://api.assemblyai.com/v2/upload',
-                    headers={'authorization': self.api_key},
-                    data=audio_file.read(),
-                    timeout=30
-                )
-                
-                if upload_response.status_code != 200:
-                    error_msg = f"Error en upload ({upload_response.status_code}): {upload_response.text}"
-                    print(f"❌ {error_msg}")
-                    return {"error": error_msg}
-                
-                upload_url = upload_response.json()['upload_url']
-                print("✅ Audio subido correctamente")
-                
-                # Solicitar transcripción
-                transcript_response = requests.post(
-                    'https://api.assemblyai.com/v2/transcript',
-                    headers={
-                        'authorization': self.api_key,
-                        'content-type': 'application/json'
-                    },
-                    json={
-                        'audio_url': upload_url,
-                        'language_code': 'es'
-                    },
-                    timeout=30
-                )
-                
-                if transcript_response.status_code != 200:
-                    error_msg = f"Error en transcripción ({transcript_response.status_code}): {transcript_response.text}"
-                    print(f"❌ {error_msg}")
-                    return {"error": error_msg}
-                
-                transcript_id = transcript_response.json()['id']
-                print(f"🆔 ID de transcripción: {transcript_id}")
-                
-                # Polling para obtener resultado
-                return self.wait_for_transcription(transcript_id)
-                
-        except requests.exceptions.Timeout:
-            error_msg = "Timeout en la conexión con AssemblyAI"
-            print(f"❌ {error_msg}")
-            return {"error": error_msg}
-        except Exception as e:
-            error_msg = f"Error en transcripción: {str(e)}"
-            print(f"❌ {error_msg}")
-            return {"error": error_msg}
-    
-    def wait_for_transcription(self, transcript_id, timeout=60):
-        """Esperar a que la transcripción esté lista"""
-        start_time = time.time()
-        polling_interval = 2
-        
-        while time.time() - start_time < timeout:
-            try:
-                # Verificar estado
-                polling_response = requests.get(
-                    f'https://api.assemblyai.com/v2/transcript/{transcript_id}',
-                    headers={'authorization': self.api_key},
-                    timeout=30
+        Paginación por cursor sobre el mismo orden que `records_query`; el
+        cursor es el id del último registro devuelto. Devuelve
+        (registros, next_cursor), con next_cursor None en la última página.
+        """
+        stmt = AttendanceManager.records_query(user)
+        if before is not None:
+            cursor = db.session.execute(
+                db.select(Attendance.date, Attendance.check_in_time).where(Attendance.id == before)
+            ).first()
+            if cursor is None:
+                return [], None
+            if cursor.check_in_time is None:
+                later_in_day = db.and_(Attendance.check_in_time.is_(None), Attendance.id < before)
+            else:
+                later_in_day = db.or_(
+                    Attendance.check_in_time < cursor.check_in_time,
+                    Attendance.check_in_time.is_(None),
+                    db.and_(Attendance.check_in_time == cursor.check_in_time, Attendance.id < before),
                 )
-                
-                if polling_response.status_code != 200:
-                    return {"error": f"Error en polling: {polling_response.text}"}
-                
-                polling_result = polling_response.json()
-                status = polling_result['status']
-                
-                if status == 'completed':
-                    print("✅ Transcripción completada")
-                    return {
-                        'success': True,
-                        'text': polling_result['text'],
-                        'confidence': polling_result.get('confidence', 1.0),
-                        'duration': polling_result.get('audio_duration', 0)
-                    }
-                elif status == 'error':
-                    error_msg = polling_result.get('error', 'Error desconocido en transcripción')
-                    print(f"❌ Error en transcripción: {error_msg}")
-                    return {"error": error_msg}
-                elif status == 'processing':
-                    print("⏳ Procesando audio...")
-                elif status == 'queued':
-                    print("📋 Audio en cola...")
-                
-                time.sleep(polling_interval)
-                polling_interval = min(polling_interval * 1.5, 5)  # Backoff exponencial
-                
-            except requests.exceptions.Timeout:
-                print("⏰ Timeout en polling, reintentando...")
-                time.sleep(polling_interval)
-            except Exception as e:
-                return {"error": f"Error en polling: {str(e)}"}
-        
-        return {"error": f"Timeout después de {timeout} segundos"}
-
-class VoiceFormManager:
-    def __init__(self, assemblyai_client):
-        self.client = assemblyai_client
-        self.field_keywords = {
-            'nombre': ['nombre', 'llámame', 'me llamo', 'mi nombre es', 'soy'],
-            'apellido': ['apellido', 'apellidos', 'mis apellidos'],
-            'edad': ['edad', 'años', 'tengo', 'mi edad es'],
-            'correo': ['correo', 'email', 'mail', 'correo electrónico'],
-            'celular': ['celular', 'teléfono', 'número', 'contacto', 'móvil']
-        }
-    
-    def process_voice_input(self, audio_file_path, current_field=None):
-        """Procesar entrada de voz y extraer información relevante"""
-        if not self.client.enabled:
-            return {"error": "AssemblyAI no disponible"}
-        
-        # Transcribir audio
-        result = self.client.transcribe_audio(audio_file_path)
-        if "error" in result:
-            return result
-        
-        text = result["text"].lower().strip()
-        print(f"📝 Texto transcrito: {text}")
-        
-        # Si se especifica un campo, usar directamente
-        if current_field:
-            return {
-                'success': True,
-                'field': current_field,
-                'value': self.clean_text(text),
-                'confidence': result.get('confidence', 1.0),
-                'original_text': text
+            stmt = stmt.where(db.or_(
+                Attendance.date < cursor.date,
+                db.and_(Attendance.date == cursor.date, later_in_day),
+            ))
+
+        attendances = db.session.execute(stmt.limit(limit + 1)).scalars().all()
+        next_cursor = attendances[limit - 1].id if len(attendances) > limit else None
+        return [AttendanceManager.serialize_record(att) for att in attendances[:limit]], next_cursor
+
+    @staticmethod
+    def get_all_records():
+        """Obtener todos los registros para exportación"""
+        return AttendanceManager.get_records()
+
+class Dashboard:
+    RECORDS_PAGE = 50
+
+    @staticmethod
+    def context(user):
+        """Todo lo que pinta la página de inicio, en dos consultas.
+
+        Una agrega las estadísticas del día, si hay registros y el registro de
+        hoy del usuario; la otra trae la primera página de sus registros, que
+        va incrustada en la página para no pedir /api/records al abrirlos.
+        """
+        today = date.today()
+        mine = Attendance.user_id == user.id
+        any_attendance = aliased(Attendance)
+        row = db.session.execute(
+            db.select(
+                db.func.count(Attendance.check_in_time).label('total_checkins'),
+                db.func.count(Attendance.check_out_time).label('total_checkouts'),
+                # Las filas que crea mark-absences no son asistentes
+                db.func.count(db.case((db.or_(Attendance.status.is_(None), Attendance.status != 'absent'), 1)))
+                .label('present_today'),
+                db.func.count(db.case((Attendance.status == 'late', 1))).label('late_arrivals'),
+                db.func.max(db.case((mine, Attendance.check_in_time))).label('check_in_time'),
+                db.func.max(db.case((mine, Attendance.check_out_time))).label('check_out_time'),
+                db.select(any_attendance.id).exists().label('has_records'),
+            ).where(Attendance.date == today)
+        ).one()
+
+        records, next_cursor = AttendanceManager.records_page(user, limit=Dashboard.RECORDS_PAGE)
+        current_attendance = None
+        if row.check_in_time:
+            current_attendance = {'check_in_time': row.check_in_time, 'check_out_time': row.check_out_time}
+        return {
+            'has_records': bool(row.has_records),
+            'stats': {
+                'total_checkins': row.total_checkins,
+                'total_checkouts': row.total_checkouts,
+                'present_today': row.present_today,
+                'late_arrivals': row.late_arrivals
+            },
+            'show_checkout': bool(row.check_in_time and not row.check_out_time),
+            'current_attendance': current_attendance,
+            # Mismo formato que /api/records; las siguientes páginas se piden con next_cursor
+            'records_page': {
+                'records': records,
+                'total': len(records),
+                'next_cursor': next_cursor,
+                'user_role': user.role
             }
-        
-        # Detectar comandos especiales
-        command_result = self.detect_commands(text)
-        if command_result:
-            return command_result
-        
-        # Intentar detectar campo automáticamente
-        return self.auto_detect_field(text, result.get('confidence', 1.0))
-    
-    def detect_commands(self, text):
-        """Detectar comandos de voz especiales"""
-        if any(cmd in text for cmd in ['siguiente', 'continuar', 'next', 'adelante']):
-            return {'success': True, 'action': 'next_field'}
-        elif any(cmd in text for cmd in ['anterior', 'atrás', 'back', 'regresar']):
-            return {'success': True, 'action': 'previous_field'}
-        elif any(cmd in text for cmd in ['enviar', 'registrar', 'finalizar', 'terminar']):
-            return {'success': True, 'action': 'submit_form'}
-        elif any(cmd in text for cmd in ['limpiar', 'borrar', 'reset', 'empezar de nuevo']):
-            return {'success': True, 'action': 'clear_form'}
-        elif any(cmd in text for cmd in ['ayuda', 'help', 'asistencia']):
-            return {'success': True, 'action': 'show_help'}
-        
-        return None
-    
-    def auto_detect_field(self, text, confidence):
-        """Detectar automáticamente el campo basado en palabras clave"""
-        for field, keywords in self.field_keywords.items():
-            for keyword in keywords:
-                if keyword in text:
-                    value = self.extract_value_after_keyword(text, keyword)
-                    return {
-                        'success': True,
-                        'field': field,
-                        'value': value,
-                        'confidence': confidence,
-                        'original_text': text,
-                        'action': 'fill_field'
-                    }
-        
-        # Si no se detecta campo específico, devolver texto completo
+        }
+
+class UserDirectory:
+    PAGE_SIZE = 50
+
+    @staticmethod
+    def search(query='', after=None, limit=PAGE_SIZE):
+        """Página de usuarios ordenada por username (paginación por cursor)"""
+        stmt = db.select(User).options(joinedload(User.department), joinedload(User.position))
+
+        query = (query or '').strip().lower()
+        if query:
+            # Búsqueda por prefijo, apoyada en los índices sobre lower(columna)
+            escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            pattern = f"{escaped}%"
+            stmt = stmt.where(db.or_(
+                db.func.lower(User.username).like(pattern, escape='\\'),
+                db.func.lower(User.email).like(pattern, escape='\\'),
+                db.func.lower(User.first_name).like(pattern, escape='\\'),
+                db.func.lower(User.last_name).like(pattern, escape='\\'),
+            ))
+        if after:
+            stmt = stmt.where(User.username > after)
+
+        users = db.session.execute(stmt.order_by(User.username).limit(limit + 1)).scalars().all()
+        next_cursor = users[limit - 1].username if len(users) > limit else None
+        return users[:limit], next_cursor
+
+    @staticmethod
+    def serialize(user):
         return {
-            'success': True,
-            'field': 'unknown',
-            'value': self.clean_text(text),
-            'confidence': confidence,
-            'original_text': text,
-            'action': 'unknown'
+            'id': user.id,
+            'username': user.username,
+            'full_name': user.full_name,
+            'email': user.email,
+            'role': user.role,
+            'department': user.department.name if user.department else None,
+            'position': user.position.name if user.position else None,
+            'is_active': bool(user.is_active)
         }
-    
-    def extract_value_after_keyword(self, text, keyword):
-        """Extraer valor después de una palabra clave"""
-        if keyword in text:
-            start_pos = text.find(keyword) + len(keyword)
-            value = text[start_pos:].strip()
-            # Limpiar valor
-            value = self.clean_text(value)
-            return value
-        return text
-    
-    def clean_text(self, text):
-        """Limpiar y formatear texto"""
-        # Remover palabras comunes no necesarias
-        common_words = ['es', 'de', 'el', 'la', 'los', 'las', 'un', 'una', 'y', 'o', 'que', 'en']
-        words = text.split()
-        filtered_words = [word for word in words if word not in common_words]
-        
-        # Unir y capitalizar
-        cleaned = ' '.join(filtered_words).title()
-        
-        # Limpiar puntuación extra
-        cleaned = cleaned.replace('.', '').replace(',', '').strip()
-        
-        return cleaned
 
 # Inicializar componentes
-camera = Camera()
-face_detector = FaceDetector()
 attendance_manager = AttendanceManager()
 
-# Inicializar AssemblyAI
-assemblyai_client = SimpleTranscriber(ASSEMBLYAI_API_KEY)
-voice_manager = VoiceFormManager(assemblyai_client)
-
-# Variables globales
-current_frame = camera.create_test_frame()
-face_detected = False
-frame_lock = threading.Lock()
-
-def process_frames():
-    """Procesamiento de frames en segundo plano"""
-    global current_frame, face_detected
-    
-    while True:
-        try:
-            frame = camera.get_frame()
-            
-            if system_state == SystemState.DETECTING_FACE:
-                # Solo detectar rostros cuando estamos en modo detección
-                processed_frame, face_found = face_detector.detect_face(frame)
-                face_detected = face_found
-            else:
-                processed_frame = frame
-                # Mostrar información del estado
-                if system_state == SystemState.WAITING:
-                    cv2.putText(processed_frame, "SISTEMA DE ASISTENCIA", (50, 50),
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                    cv2.putText(processed_frame, "Esperando registro...", (50, 100),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                elif system_state == SystemState.FACE_DETECTED:
-                    cv2.putText(processed_frame, "✓ ROSTRO VERIFICADO", (50, 50),
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    cv2.putText(processed_frame, "Complete el formulario", (50, 100),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                elif system_state == SystemState.REGISTERING:
-                    cv2.putText(processed_frame, "REGISTRANDO DATOS...", (50, 50),
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-                elif system_state == SystemState.COMPLETED:
-                    cv2.putText(processed_frame, "✓ REGISTRO COMPLETADO", (50, 50),
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    cv2.putText(processed_frame, "Puede continuar", (50, 100),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            
-            with frame_lock:
-                current_frame = processed_frame
-            
-            time.sleep(0.1)  # Reduce CPU usage (10 FPS processing)
-        except Exception as e:
-            print(f"Error en procesamiento: {e}")
-            time.sleep(1)
-
-# Iniciar thread de procesamiento automáticamente al importar
-# Esto asegura que funcione con Gunicorn y otros servidores WSGI
-if not os.environ.get('WERKZEUG_RUN_MAIN') or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-    # Evitar iniciar thread doble en modo debug de Flask
-    processing_thread = threading.Thread(target=process_frames, daemon=True)
-    processing_thread.start()
-    print("✅ Thread de procesamiento de video iniciado")
-
-def generate_frames():
-    """Generar stream de video"""
-    while True:
-        with frame_lock:
-            if current_frame is not None:
-                ret, buffer = cv2.imencode('.jpg', current_frame)
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        time.sleep(0.05)  # Limit streaming FPS to 20
+def build_vision(app, state_store):
+    """Cámara del servidor (/video_feed): hilo propio o proceso dueño compartido"""
+    if app.config['CAMERA_PROCESS']:
+        from camera_process import CameraClient, DEFAULT_LOCK_PATH
+        return CameraClient(
+            name=app.config['CAMERA_SHM_NAME'],
+            lock_path=app.config['CAMERA_LOCK_PATH'] or DEFAULT_LOCK_PATH,
+            env={
+                'STATE_BACKEND': app.config['STATE_BACKEND'],
+                'STATE_PATH': app.config['STATE_PATH'],
+                'STATE_URL': app.config['STATE_URL'] or '',
+                'STATE_TTL': str(app.config['STATE_TTL']),
+                'CAMERA_IDLE_TIMEOUT': str(app.config['CAMERA_IDLE_TIMEOUT']),
+            }
+        )
+    from vision import VisionPipeline, kiosk_binding
+    get_state, on_detection = kiosk_binding(state_store)
+    return VisionPipeline(get_state=get_state, on_detection=on_detection)
+
+def build_face_detector():
+    from vision import FaceDetector
+    return FaceDetector()
+
+def build_transcription(app, state_store):
+    from transcription import TranscriptionService
+    return TranscriptionService(app.config, shared=state_store)
+
+class AppServices:
+    """Lo que cada app crea en create_app, en `app.extensions['asistencia']`.
+
+    Los hilos de fondo (cámara, transcripción, miniaturas) reciben estos
+    objetos directamente, no los proxies, porque no tienen app context.
+    """
+
+    def __init__(self, app):
+        # Estado por kiosco y de los trabajos, compartido entre workers
+        self.state_store = create_store(
+            app.config['STATE_BACKEND'],
+            path=app.config['STATE_PATH'],
+            url=app.config['STATE_URL'],
+            ttl=app.config['STATE_TTL']
+        )
+        self.evidence_storage = EvidenceStorage(app.config['UPLOAD_FOLDER'])
+        self.derivative_pipeline = DerivativePipeline()
+        self.derivative_pipeline.init_app(app, self.evidence_storage)
+        # Se crean en la primera petición que los usa
+        self.vision = LazySubsystem('vision', lambda: build_vision(app, self.state_store))
+        self.face_detector = LazySubsystem('face_detector', build_face_detector)
+        self.transcription = LazySubsystem('transcription', lambda: build_transcription(app, self.state_store))
+
+def voice_input_configured(app=None):
+    """¿Hay API key? Se puede consultar sin montar el subsistema de transcripción"""
+    key = (app or current_app).config.get('ASSEMBLYAI_API_KEY')
+    return bool(key and key != "tu_api_key_aqui")
 
 # Rutas de la aplicación (legacy - now handled by protected routes below)
 
+# Nombres que nunca cambian de contenido: por hash (`<sha256>[.variante].ext`)
+# o con timestamp (`{user}_{attendance}_{ts}_{name}`, subidas antiguas)
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}(\.[A-Za-z0-9]+)*$')
+TIMESTAMPED_NAME = re.compile(r'^\d+_\d+_\d+_')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def send_upload(file_name, cacheable=True):
+    """Servir un archivo subido con ETag, caché y soporte de Range.
+
+    `cacheable=False` es para respuestas provisionales (la URL servirá otro
+    archivo más adelante): se revalidan siempre aunque el nombre sea inmutable.
+    Con UPLOAD_ACCEL_REDIRECT (nginx) o USE_X_SENDFILE (Apache/lighttpd) la
+    transferencia la hace el proxy y el hilo del worker queda libre.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    # Acepta tanto el esquema `ab/cd/<nombre>` como la carpeta plana antigua
+    full_path = upload_layout.resolve(upload_folder, file_name)
+    if full_path is None:
+        abort(404)
+
+    content_addressed = bool(CONTENT_ADDRESSED_NAME.match(file_name))
+    immutable = cacheable and (content_addressed or bool(TIMESTAMPED_NAME.match(file_name)))
+    # Para contenido direccionado por hash el propio nombre es un ETag fuerte
+    etag = file_name if content_addressed else True
+
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT')
+    if accel_prefix:
+        response = Response(status=200)
+        if content_addressed:
+            response.set_etag(etag)
+            if request.if_none_match.contains(etag):
+                response.status_code = 304
+        if response.status_code == 200:
+            relative_path = os.path.relpath(full_path, upload_folder).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + relative_path
+        response.mimetype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    else:
+        # conditional=True resuelve If-None-Match/If-Modified-Since y Range
+        response = send_file(os.path.abspath(full_path), conditional=True, etag=etag)
+
+    # Privado: los archivos están detrás de login y no deben quedar en cachés compartidas
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
 # Route to serve uploaded files
-@app.route('/uploads/<filename>')
+@bp.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # ?size=thumb|display sirve la variante reducida si ya está generada
+    size = request.args.get('size')
+    if size:
+        # Los navegadores con soporte WebP lo anuncian explícitamente en Accept
+        accept_webp = 'image/webp' in request.headers.get('Accept', '')
+        derivative = pick_derivative(current_app.config['UPLOAD_FOLDER'], filename, size, accept_webp)
+        # Solo la variante pedida exacta es definitiva; el JPEG en lugar del WebP
+        # o el original mientras se generan las variantes se revalidan siempre
+        preferred = derivative_name(filename, size, 'webp' if accept_webp else 'jpeg')
+        response = send_upload(derivative or filename, cacheable=derivative == preferred)
+        response.vary.add('Accept')
+        return response
+    return send_upload(filename)
 
 # Old registro route removed - now handled by protected route below
 
-@app.route('/detectar_rostro')
+@bp.route('/detectar_rostro')
 @login_required
 def detectar_rostro():
     """Iniciar detección de rostro"""
-    global system_state
-    system_state = SystemState.DETECTING_FACE
+    update_kiosk(system_state=SystemState.DETECTING_FACE)
 
-    # Inicializar cámara si no está activa
-    if not camera.cap or not camera.cap.isOpened():
-        camera.initialize_camera()
+    # Inicializar cámara si no está activa; queda asociada a este kiosco
+    state_store.set('camera', {'kiosk': kiosk_id()})
+    vision.get().open_camera()
 
     # Check if user needs to complete profile
     needs_profile_completion = not (
@@ -641,14 +707,13 @@ def detectar_rostro():
 
     return render_template('detectar_rostro.html', needs_profile_completion=needs_profile_completion)
 
-@app.route('/formulario')
+@bp.route('/formulario')
 @login_required
 def formulario():
     """Formulario de datos personales - Solo para completar perfil inicial"""
-    global system_state
-    if face_detected:
-        system_state = SystemState.FACE_DETECTED
-        assemblyai_enabled = assemblyai_client.enabled
+    if kiosk_state()['face_detected']:
+        update_kiosk(system_state=SystemState.FACE_DETECTED)
+        assemblyai_enabled = voice_input_configured()
 
         # Check if user has complete profile
         has_complete_profile = (
@@ -663,40 +728,40 @@ def formulario():
                              assemblyai_enabled=assemblyai_enabled,
                              has_complete_profile=has_complete_profile)
     else:
-        return redirect(url_for('detectar_rostro'))
+        return redirect(url_for('main.detectar_rostro'))
 
-@app.route('/completado')
+@bp.route('/completado')
 @login_required
 def completado():
     """Vista de registro completado"""
-    global system_state
-    system_state = SystemState.COMPLETED
+    state = update_kiosk(system_state=SystemState.COMPLETED)
 
     # Get the latest attendance for current user
     today = date.today()
     latest_attendance = Attendance.query.filter_by(user_id=current_user.id, date=today).order_by(Attendance.created_at.desc()).first()
 
-    return render_template('completado.html', user_data=last_registered_user, attendance=latest_attendance)
+    return render_template('completado.html', user_data=state['last_registered_user'], attendance=latest_attendance)
 
 # API endpoints
-@app.route('/video_feed')
+@bp.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    pipeline = vision.get()
+    pipeline.start()
+    return Response(pipeline.generate_frames(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/api/face_status')
+@bp.route('/api/face_status')
 def api_face_status():
     """API para verificar estado de detección facial"""
+    state = kiosk_state()
     return jsonify({
-        'face_detected': face_detected,
-        'system_state': system_state
+        'face_detected': state['face_detected'],
+        'system_state': state['system_state']
     })
 
-@app.route('/api/detect_face', methods=['POST'])
+@bp.route('/api/detect_face', methods=['POST'])
 def api_detect_face():
     """API para detectar rostro desde imagen del cliente"""
-    global face_detected
-    
     try:
         if 'image' not in request.files:
             return jsonify({'face_detected': False, 'error': 'No image provided'})
@@ -705,19 +770,19 @@ def api_detect_face():
         
         # Read image from uploaded file
         image_bytes = image_file.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        detector = face_detector.get()
+        frame = detector.decode_image(image_bytes)
         
         if frame is None:
             return jsonify({'face_detected': False, 'error': 'Invalid image'})
         
         # Detect face using face detector
-        _, detected = face_detector.detect_face(frame)
-        face_detected = detected
+        _, detected = detector.detect_face(frame)
+        state = update_kiosk(face_detected=detected)
         
         return jsonify({
             'face_detected': detected,
-            'system_state': system_state,
+            'system_state': state['system_state'],
             'timestamp': datetime.now().isoformat()
         })
         
@@ -725,122 +790,70 @@ def api_detect_face():
         print(f"Error en detección de rostro: {e}")
         return jsonify({'face_detected': False, 'error': str(e)})
 
-@app.route('/api/register', methods=['POST'])
+@bp.route('/api/register', methods=['POST'])
 @login_required
 def api_register():
     """API para registrar asistencia"""
-    global system_state, last_registered_user
-
     try:
         # Check if this is a profile update or attendance registration
         user_data = request.json or {}
 
         # If user data is provided, update profile first
+        user = current_user
         if user_data and any(key in user_data for key in ['nombre', 'apellido', 'email', 'departamento', 'posicion']):
-            # Update user profile
+            # current_user es un snapshot en caché; el perfil se edita sobre el User real
+            user = db.session.get(User, current_user.id)
             if 'nombre' in user_data:
-                current_user.first_name = user_data['nombre']
+                user.first_name = user_data['nombre']
             if 'apellido' in user_data:
-                current_user.last_name = user_data['apellido']
+                user.last_name = user_data['apellido']
             if 'email' in user_data:
-                current_user.email = user_data['email']
+                user.email = user_data['email']
             if 'edad' in user_data:
-                current_user.phone = user_data.get('edad', '')  # Using phone field for age for now
+                user.phone = user_data.get('edad', '')  # Using phone field for age for now
             if 'departamento' in user_data:
-                dept = Department.query.filter_by(name=user_data['departamento']).first()
-                if not dept:
-                    dept = Department(name=user_data['departamento'])
-                    db.session.add(dept)
-                    db.session.flush()
-                current_user.department_id = dept.id
+                user.department_id = department_cache.get_or_create(user_data['departamento'])
             if 'posicion' in user_data:
-                pos = Position.query.filter_by(name=user_data['posicion']).first()
-                if not pos:
-                    pos = Position(name=user_data['posicion'])
-                    db.session.add(pos)
-                    db.session.flush()
-                current_user.position_id = pos.id
+                user.position_id = position_cache.get_or_create(user_data['posicion'])
 
             db.session.commit()
             SystemLog.log_action(current_user.id, 'profile_update', 'Updated profile information', request.remote_addr)
 
         # Registrar asistencia usando el usuario actual
-        system_state = SystemState.REGISTERING
+        update_kiosk(system_state=SystemState.REGISTERING)
         time.sleep(1)  # Pequeña pausa para efecto visual
 
-        record = AttendanceManager.register_attendance(current_user.id)
-        last_registered_user = {
+        record = AttendanceManager.register_attendance(user.id, user=user)
+        registered = {
             'id': record.id,
             'date': record.date.strftime('%Y-%m-%d'),
             'check_in_time': record.check_in_time.strftime('%H:%M:%S') if record.check_in_time else None,
             'check_out_time': record.check_out_time.strftime('%H:%M:%S') if record.check_out_time else None,
             'status': record.status,
-            'user': current_user.full_name,
+            'user': user.full_name,
             'total_hours': record.total_hours
         }
-        system_state = SystemState.COMPLETED
+        update_kiosk(system_state=SystemState.COMPLETED, last_registered_user=registered)
 
         action = 'check_out' if record.check_out_time else 'check_in'
         return jsonify({
             'success': True,
             'message': f'{"Check-out" if record.check_out_time else "Check-in"} registrado correctamente',
-            'record': last_registered_user,
+            'record': registered,
             'action': action,
-            'redirect_url': url_for('evidencia', attendance_id=record.id) if not record.check_out_time else None
+            'redirect_url': url_for('main.evidencia', attendance_id=record.id) if not record.check_out_time else None
         })
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/export_csv')
+@bp.route('/api/export_csv')
 @login_required
 def api_export_csv():
     """Exportar registros a CSV según permisos"""
-    if current_user.is_admin():
-        # Admin exporta todos los registros
-        records = AttendanceManager.get_all_records()
-    elif current_user.is_manager():
-        # Manager exporta registros de su departamento
-        department_users = User.query.filter_by(department_id=current_user.department_id).all()
-        user_ids = [u.id for u in department_users]
-        attendances = Attendance.query.filter(Attendance.user_id.in_(user_ids)).all()
-
-        records = []
-        for att in attendances:
-            record = {
-                'Fecha': att.date.strftime('%Y-%m-%d'),
-                'Hora_Ingreso': att.check_in_time.strftime('%H:%M:%S') if att.check_in_time else '',
-                'Hora_Salida': att.check_out_time.strftime('%H:%M:%S') if att.check_out_time else '',
-                'Nombre': att.user.first_name,
-                'Apellido': att.user.last_name,
-                'Correo': att.user.email,
-                'Departamento': att.user.department.name if att.user.department else '',
-                'Posicion': att.user.position.name if att.user.position else '',
-                'Estado': att.status,
-                'Horas_Trabajadas': f"{att.total_hours:.2f}" if att.total_hours > 0 else '',
-                'Timestamp': att.created_at.isoformat()
-            }
-            records.append(record)
-    else:
-        # Employee exporta solo sus registros
-        attendances = AttendanceManager.get_user_attendance(current_user.id)
-        records = []
-        for att in attendances:
-            record = {
-                'Fecha': att.date.strftime('%Y-%m-%d'),
-                'Hora_Ingreso': att.check_in_time.strftime('%H:%M:%S') if att.check_in_time else '',
-                'Hora_Salida': att.check_out_time.strftime('%H:%M:%S') if att.check_out_time else '',
-                'Nombre': att.user.first_name,
-                'Apellido': att.user.last_name,
-                'Correo': att.user.email,
-                'Departamento': att.user.department.name if att.user.department else '',
-                'Posicion': att.user.position.name if att.user.position else '',
-                'Estado': att.status,
-                'Horas_Trabajadas': f"{att.total_hours:.2f}" if att.total_hours > 0 else '',
-                'Timestamp': att.created_at.isoformat()
-            }
-            records.append(record)
+    # Admin exporta todo, manager su departamento y employee solo sus registros
+    records = AttendanceManager.get_records(current_user)
     
     if not records:
         # Devolver mensaje amigable en lugar de error
@@ -912,67 +925,29 @@ def api_export_csv():
     
     return response
 
-@app.route('/api/records')
+@bp.route('/api/records')
 @login_required
 def api_records():
-    """Obtener registros según permisos del usuario"""
-    if current_user.is_admin():
-        # Admin ve todos los registros
-        records = AttendanceManager.get_all_records()
-    elif current_user.is_manager():
-        # Manager ve registros de su departamento
-        department_users = User.query.filter_by(department_id=current_user.department_id).all()
-        user_ids = [u.id for u in department_users]
-        attendances = Attendance.query.filter(Attendance.user_id.in_(user_ids)).all()
-
-        records = []
-        for att in attendances:
-            record = {
-                'Fecha': att.date.strftime('%Y-%m-%d'),
-                'Hora_Ingreso': att.check_in_time.strftime('%H:%M:%S') if att.check_in_time else '',
-                'Hora_Salida': att.check_out_time.strftime('%H:%M:%S') if att.check_out_time else '',
-                'Nombre': att.user.first_name,
-                'Apellido': att.user.last_name,
-                'Correo': att.user.email,
-                'Departamento': att.user.department.name if att.user.department else '',
-                'Posicion': att.user.position.name if att.user.position else '',
-                'Estado': att.status,
-                'Horas_Trabajadas': f"{att.total_hours:.2f}" if att.total_hours > 0 else '',
-                'Timestamp': att.created_at.isoformat()
-            }
-            records.append(record)
-    else:
-        # Employee ve solo sus propios registros
-        records = AttendanceManager.get_user_attendance(current_user.id)
-        # Convertir a formato de lista como los otros
-        formatted_records = []
-        for att in records:
-            record = {
-                'Fecha': att.date.strftime('%Y-%m-%d'),
-                'Hora_Ingreso': att.check_in_time.strftime('%H:%M:%S') if att.check_in_time else '',
-                'Hora_Salida': att.check_out_time.strftime('%H:%M:%S') if att.check_out_time else '',
-                'Nombre': att.user.first_name,
-                'Apellido': att.user.last_name,
-                'Correo': att.user.email,
-                'Departamento': att.user.department.name if att.user.department else '',
-                'Posicion': att.user.position.name if att.user.position else '',
-                'Estado': att.status,
-                'Horas_Trabajadas': f"{att.total_hours:.2f}" if att.total_hours > 0 else '',
-                'Timestamp': att.created_at.isoformat()
-            }
-            formatted_records.append(record)
-        records = formatted_records
+    """Página de registros según permisos del usuario (`before` = next_cursor anterior)"""
+    # Admin ve todo, manager su departamento y employee solo sus registros
+    limit = min(request.args.get('limit', Dashboard.RECORDS_PAGE, type=int), 200)
+    records, next_cursor = AttendanceManager.records_page(
+        current_user,
+        before=request.args.get('before', type=int),
+        limit=max(limit, 1)
+    )
 
     return jsonify({
         'records': records,
         'total': len(records),
         'has_records': len(records) > 0,
+        'next_cursor': next_cursor,
         'user_role': current_user.role
     })
 
-@app.route('/api/transcribe', methods=['POST'])
+@bp.route('/api/transcribe', methods=['POST'])
 def api_transcribe():
-    """Transcribir audio usando AssemblyAI"""
+    """Encolar un audio para transcribir con AssemblyAI; devuelve el id del trabajo"""
     if 'audio' not in request.files:
         return jsonify({'error': 'No se proporcionó archivo de audio'})
     
@@ -980,55 +955,138 @@ def api_transcribe():
     if audio_file.filename == '':
         return jsonify({'error': 'No se seleccionó archivo'})
     
-    # Guardar archivo temporal
-    filename = f"temp_audio_{int(time.time())}.wav"
+    if not voice_input_configured():
+        return jsonify({'error': 'AssemblyAI no disponible'})
+    
+    # El audio ya está volcado en un temporal único (IngestSpool)
+    spool = audio_file.stream
+    if spool.kind != 'audio':
+        spool.discard()
+        return jsonify({'error': 'El archivo no es un audio válido'})
+
+    # Obtener campo específico si se proporciona
+    current_field = request.form.get('field', None)
+    
+    # El temporal pasa a la cola, que lo borra tras subirlo. El hash ya se
+    # calculó al recibirlo y sirve de clave de caché
+    service = transcription.get()
+    cache_key = service.voice_manager.cache_key(audio_hash=spool.sha256)
     try:
-        audio_file.save(filename)
-        
-        # Obtener campo específico si se proporciona
-        current_field = request.form.get('field', None)
-        
-        # Transcribir con AssemblyAI
-        result = voice_manager.process_voice_input(filename, current_field)
-        
-        return jsonify(result)
-        
+        job = service.queue.submit(spool.detach(), current_field, cache_key=cache_key)
+    except ServiceUnavailable as e:
+        return service_unavailable(e)
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('main.api_transcribe_status', job_id=job.id)
+    }), 202
+
+def service_unavailable(error):
+    """Respuesta 503 para una transcripción rechazada sin intentarla"""
+    response = jsonify({'success': False, 'error': error.message, 'status': error.reason})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+@bp.route('/api/transcribe/<job_id>')
+def api_transcribe_status(job_id):
+    """Estado o resultado de un trabajo de transcripción"""
+    job = transcription.get().queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Trabajo de transcripción no encontrado'}), 404
+    return jsonify(job)
+
+@sock.route('/ws/transcribe', bp=bp)
+def ws_transcribe(ws):
+    """Transcripción en tiempo real: el navegador envía PCM 16 kHz y recibe parciales y finales"""
+    if not voice_input_configured():
+        ws.send(json.dumps({'type': 'error', 'error': 'AssemblyAI no disponible'}))
+        return
+    
+    current_field = request.args.get('field') or None
+    service = transcription.get()
+    try:
+        service.realtime_limiter.acquire()
+    except ServiceUnavailable as e:
+        ws.send(json.dumps({'type': 'error', 'error': e.message, 'status': e.reason}))
+        return
+    try:
+        session = service.streaming.connect()
+    except ServiceUnavailable as e:
+        service.realtime_limiter.release()
+        ws.send(json.dumps({'type': 'error', 'error': e.message, 'status': e.reason}))
+        return
     except Exception as e:
-        return jsonify({'error': f'Error procesando audio: {str(e)}'})
+        service.realtime_limiter.release()
+        print(f"❌ Error abriendo streaming con AssemblyAI: {e}")
+        ws.send(json.dumps({'type': 'error', 'error': 'No se pudo conectar con AssemblyAI'}))
+        return
     
+    def on_final(event):
+        result = service.voice_manager.interpret({
+            'success': True,
+            'text': event['text'],
+            'confidence': event['confidence']
+        }, current_field)
+        result['type'] = 'final'
+        return result
+    
+    try:
+        from realtime_transcription import relay
+        relay(ws, session, on_final)
     finally:
-        # Limpiar archivo temporal
-        if os.path.exists(filename):
-            try:
-                os.remove(filename)
-            except:
-                pass
+        service.realtime_limiter.release()
+
+@bp.route('/api/assemblyai/webhook', methods=['POST'])
+def assemblyai_webhook():
+    """Aviso de AssemblyAI al terminar una transcripción"""
+    service = transcription.get()
+    if not service.client.verify_webhook(request.headers):
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    payload = request.get_json(silent=True) or {}
+    transcript_id = payload.get('transcript_id')
+    if not transcript_id:
+        return jsonify({'error': 'Falta transcript_id'}), 400
+    
+    # El resultado lo recoge el hilo de la cola; aquí solo se le despierta (si el
+    # trabajo es de otro worker, a través del almacén compartido). Un id
+    # desconocido responde 200 igualmente para que no se reintente
+    found = service.queue.notify(transcript_id)
+    return jsonify({'success': True, 'matched': found})
 
-@app.route('/reset_system')
+@bp.route('/reset_system')
 def reset_system():
     """Resetear sistema para nuevo registro"""
-    global system_state, face_detected, current_user_data
-    system_state = SystemState.WAITING
-    face_detected = False
-    current_user_data = {}
+    update_kiosk(system_state=SystemState.WAITING, face_detected=False, current_user_data={})
     return jsonify({'success': True, 'message': 'Sistema reiniciado'})
 
-@app.route('/api/system_status')
+@bp.route('/api/system_status')
 def api_system_status():
     """Estado del sistema"""
-    return jsonify({
-        'assemblyai_enabled': assemblyai_client.enabled,
-        'camera_available': camera.cap is not None and camera.cap.isOpened(),
-        'face_detected': face_detected,
-        'system_state': system_state,
-        'total_records': len(attendance_manager.get_all_records())
-    })
+    configured = voice_input_configured()
+    state = kiosk_state()
+    status = {
+        'assemblyai_enabled': configured,
+        'realtime_enabled': configured,
+        'camera_available': vision.loaded and vision.get().camera_available(),
+        'face_detected': state['face_detected'],
+        'system_state': state['system_state'],
+        'total_records': len(attendance_manager.get_all_records()),
+        'startup_ms': startup_timings
+    }
+    # Las métricas de transcripción solo si el subsistema ya está montado
+    if transcription.loaded:
+        service = transcription.get()
+        status['realtime_enabled'] = service.realtime_available()
+        status.update(service.stats())
+    return jsonify(status)
 
 # Authentication routes
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     if request.method == 'POST':
         username = request.form.get('username')
@@ -1039,56 +1097,62 @@ def login():
             login_user(user)
             SystemLog.log_action(user.id, 'login', f'Login from {request.remote_addr}', request.remote_addr)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('index'))
+            return redirect(next_page) if next_page else redirect(url_for('main.index'))
 
         flash('Usuario o contraseña incorrectos', 'error')
 
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     SystemLog.log_action(current_user.id, 'logout', f'Logout from {request.remote_addr}', request.remote_addr)
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
 # Protected routes
-@app.route('/')
+@bp.route('/')
 @login_required
 def index():
     """Vista principal - Menú de inicio"""
-    has_records = AttendanceManager.has_records()
-    stats = AttendanceManager.get_today_stats()
-
-    # Check if user has checked in today but not checked out
-    today = date.today()
-    current_attendance = Attendance.query.filter_by(
-        user_id=current_user.id,
-        date=today
-    ).first()
+    return render_template('index.html', **Dashboard.context(current_user))
 
-    show_checkout = current_attendance and current_attendance.check_in_time and not current_attendance.check_out_time
-
-    return render_template('index.html',
-                         has_records=has_records,
-                         stats=stats,
-                         show_checkout=show_checkout,
-                         current_attendance=current_attendance)
-
-@app.route('/admin')
+@bp.route('/admin')
 @login_required
 def admin():
     """Panel de administración"""
     if not current_user.is_admin():
         flash('Acceso denegado. Se requieren permisos de administrador.', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
+
+    search = request.args.get('q', '')
+    users, next_cursor = UserDirectory.search(search)
+    departments = department_cache.all()
+    positions = position_cache.all()
+    shifts = Shift.query.order_by(Shift.start_time).all()
+    return render_template('admin.html', users=users, next_cursor=next_cursor, search=search,
+                           departments=departments, positions=positions, shifts=shifts)
+
+@bp.route('/api/admin/users')
+@login_required
+def api_admin_users():
+    """Directorio de usuarios paginado para el panel de administración"""
+    if not current_user.is_admin():
+        return jsonify({'success': False, 'error': 'Acceso denegado'})
 
-    users = User.query.all()
-    departments = Department.query.all()
-    positions = Position.query.all()
-    return render_template('admin.html', users=users, departments=departments, positions=positions)
+    limit = min(request.args.get('limit', UserDirectory.PAGE_SIZE, type=int), 200)
+    users, next_cursor = UserDirectory.search(
+        request.args.get('q', ''),
+        after=request.args.get('after') or None,
+        limit=max(limit, 1)
+    )
+    return jsonify({
+        'success': True,
+        'users': [UserDirectory.serialize(user) for user in users],
+        'next_cursor': next_cursor
+    })
 
-@app.route('/admin/user/create', methods=['POST'])
+@bp.route('/admin/user/create', methods=['POST'])
 @login_required
 def admin_create_user():
     """Crear nuevo usuario (solo admin)"""
@@ -1108,16 +1172,16 @@ def admin_create_user():
         # Validar datos
         if not all([username, email, password, first_name, last_name]):
             flash('Todos los campos son obligatorios', 'error')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
 
         # Verificar si usuario ya existe
         if User.query.filter_by(username=username).first():
             flash('El nombre de usuario ya existe', 'error')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
 
         if User.query.filter_by(email=email).first():
             flash('El correo electrónico ya está registrado', 'error')
-            return redirect(url_for('admin'))
+            return redirect(url_for('main.admin'))
 
         # Crear usuario
         user = User(
@@ -1138,19 +1202,84 @@ def admin_create_user():
         SystemLog.log_action(current_user.id, 'create_user', f'Created user {username}', request.remote_addr)
 
         flash(f'Usuario {username} creado exitosamente', 'success')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
 
     except Exception as e:
         db.session.rollback()
         flash(f'Error al crear usuario: {str(e)}', 'error')
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
 
-@app.route('/registro')
+@bp.route('/admin/users/bulk', methods=['POST'])
+@login_required
+def admin_bulk_create_users():
+    """Alta masiva de usuarios desde CSV (solo admin)"""
+    if not current_user.is_admin():
+        return jsonify({'success': False, 'error': 'Acceso denegado'})
+
+    csv_file = request.files.get('file')
+    if not csv_file or csv_file.filename == '':
+        return jsonify({'success': False, 'error': 'No se proporcionó archivo CSV'})
+    if csv_file.stream.kind != 'csv':
+        return jsonify({'success': False, 'error': 'El archivo no es un CSV válido'})
+
+    try:
+        result = provision_users(csv_file.read())
+        SystemLog.log_action(current_user.id, 'bulk_create_users',
+                             f"Created {result['created']} users from {csv_file.filename}", request.remote_addr)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+@bp.route('/admin/shift/create', methods=['POST'])
+@login_required
+def admin_create_shift():
+    """Crear turno para un departamento/posición (solo admin)"""
+    if not current_user.is_admin():
+        return jsonify({'success': False, 'error': 'Acceso denegado'})
+
+    try:
+        name = request.form.get('name')
+        start_time = request.form.get('start_time')
+        end_time = request.form.get('end_time')
+        grace_minutes = request.form.get('grace_minutes') or 0
+        department_id = request.form.get('department_id')
+        position_id = request.form.get('position_id')
+        # Un checkbox por día: weekday=0..6 (lunes..domingo)
+        selected_days = set(request.form.getlist('weekday'))
+        weekdays = ''.join('1' if str(i) in selected_days else '0' for i in range(7))
+
+        if not name or not start_time:
+            flash('El nombre y la hora de entrada del turno son obligatorios', 'error')
+            return redirect(url_for('main.admin'))
+
+        shift = Shift(
+            name=name,
+            start_time=datetime.strptime(start_time, '%H:%M').time(),
+            end_time=datetime.strptime(end_time, '%H:%M').time() if end_time else None,
+            grace_minutes=int(grace_minutes),
+            weekdays=weekdays if selected_days else '1111100',
+            department_id=int(department_id) if department_id else None,
+            position_id=int(position_id) if position_id else None
+        )
+        db.session.add(shift)
+        db.session.commit()
+
+        SystemLog.log_action(current_user.id, 'create_shift', f'Created shift {name}', request.remote_addr)
+
+        flash(f'Turno {name} creado exitosamente', 'success')
+        return redirect(url_for('main.admin'))
+
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al crear turno: {str(e)}', 'error')
+        return redirect(url_for('main.admin'))
+
+@bp.route('/registro')
 @login_required
 def registro():
     """Vista de registro de asistencia"""
-    global system_state
-    system_state = SystemState.WAITING
+    update_kiosk(system_state=SystemState.WAITING)
 
     # Check if user already checked in today
     today = date.today()
@@ -1159,21 +1288,21 @@ def registro():
 
     return render_template('registro.html', already_checked_in=already_checked_in, attendance=existing_attendance)
 
-@app.route('/evidencia/<int:attendance_id>')
+@bp.route('/evidencia/<int:attendance_id>')
 @login_required
 def evidencia(attendance_id):
     """Vista para subir evidencia de actividades"""
     attendance = Attendance.query.filter_by(id=attendance_id, user_id=current_user.id).first()
     if not attendance:
         flash('Registro de asistencia no encontrado', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     # Get existing evidence
     existing_evidence = Evidence.query.filter_by(attendance_id=attendance_id).all()
 
     return render_template('evidencia.html', attendance=attendance, existing_evidence=existing_evidence)
 
-@app.route('/api/evidence/upload', methods=['POST'])
+@bp.route('/api/evidence/upload', methods=['POST'])
 @login_required
 def upload_evidence():
     """API para subir evidencia"""
@@ -1189,13 +1318,14 @@ def upload_evidence():
             return jsonify({'success': False, 'error': 'Registro no encontrado'})
 
         # Handle file upload for photos
-        filename = None
+        blob = None
         if evidence_type == 'photo' and 'file' in request.files:
             file = request.files['file']
             if file.filename != '':
-                filename = secure_filename(f"{current_user.id}_{attendance_id}_{int(time.time())}_{file.filename}")
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
+                if file.stream.kind != 'image':
+                    return jsonify({'success': False, 'error': 'El archivo no es una imagen válida'})
+                # Guardado por hash de contenido: una foto repetida no se escribe de nuevo
+                blob = evidence_storage.store(file)
 
         # Create evidence record
         evidence = Evidence(
@@ -1203,12 +1333,21 @@ def upload_evidence():
             type=evidence_type,
             title=title,
             content=content,
-            file_path=filename  # Store only filename, not full path
+            file_path=blob.file_name if blob else None,  # Store only filename, not full path
+            content_hash=blob.sha256 if blob else None
         )
 
         db.session.add(evidence)
         db.session.commit()
 
+        if blob:
+            # Recompresión, miniaturas y versión de pantalla en segundo plano.
+            # La evidencia ya está guardada: sin variantes se sirve el original
+            try:
+                derivative_pipeline.submit(evidence.id, blob.file_name)
+            except Exception as e:
+                print(f"❌ No se pudo encolar el procesado de la evidencia {evidence.id}: {e}")
+
         # Log action
         SystemLog.log_action(current_user.id, 'upload_evidence', f'Uploaded {evidence_type} evidence for attendance {attendance_id}', request.remote_addr)
 
@@ -1229,7 +1368,7 @@ def upload_evidence():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
-@app.route('/api/evidence/<int:evidence_id>', methods=['DELETE'])
+@bp.route('/api/evidence/<int:evidence_id>', methods=['DELETE'])
 @login_required
 def delete_evidence(evidence_id):
     """Eliminar evidencia"""
@@ -1243,13 +1382,17 @@ def delete_evidence(evidence_id):
         if not attendance:
             return jsonify({'success': False, 'error': 'No autorizado'})
 
+        content_hash = evidence.content_hash
+        db.session.delete(evidence)
+        db.session.flush()
+
         # Delete file if exists
-        if evidence.file_path:
-            full_path = os.path.join(app.config['UPLOAD_FOLDER'], evidence.file_path)
-            if os.path.exists(full_path):
-                os.remove(full_path)
+        if content_hash:
+            # El blob solo se borra cuando ya no lo referencia ninguna evidencia
+            evidence_storage.release(content_hash)
+        elif evidence.file_path:
+            evidence_storage.remove_file(evidence.file_path)
 
-        db.session.delete(evidence)
         db.session.commit()
 
         # Log action
@@ -1261,9 +1404,12 @@ def delete_evidence(evidence_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
+record_timing('import', _module_started)
+
 if __name__ == '__main__':
+    app = create_app()
     # Create database tables and migrate data
-    if not create_tables():
+    if not create_tables(app):
         print("❌ No se pudo conectar a la base de datos. Revisa la configuración.")
         exit(1)
 
@@ -1277,7 +1423,7 @@ if __name__ == '__main__':
     print("   - Check-in/Check-out con seguimiento de horas")
     print("   - Dashboard administrativo")
     print("   - Sistema de logs y auditoría")
-    if assemblyai_client.enabled:
+    if voice_input_configured(app):
         print("   - ✅ AssemblyAI integrado para comandos de voz")
         print("   - 🔑 API Key configurada correctamente")
     else:
@@ -1288,7 +1434,9 @@ if __name__ == '__main__':
         app.run(host='0.0.0.0', port=5000, debug=DEBUG, threaded=True)
     except KeyboardInterrupt:
         print("\n🛑 Cerrando sistema...")
-        camera.release()
     except Exception as e:
         print(f"❌ Error iniciando servidor: {e}")
-        camera.release()
\ No newline at end of file
+    finally:
+        services = app.extensions['asistencia']
+        if services.vision.loaded:
+            services.vision.get().release()
\ No newline at end of file
@@ -1,31 +1,48 @@
-import requests
 import time
 import os
+import hmac
+import threading
 from datetime import datetime
 
+from realtime_transcription import StreamingTranscriber
+from transport import API_TIMEOUT, UPLOAD_TIMEOUT, StreamingBody, default_transport
+from voice_matcher import clean_text, default_matcher
+
 class AssemblyAIClient:
-    def __init__(self, api_key=None):
+    WEBHOOK_HEADER = "X-Webhook-Secret"
+
+    def __init__(self, api_key=None, base_url=None, webhook_url=None, webhook_secret=None, transport=None):
         self.api_key = api_key or os.getenv('ASSEMBLYAI_API_KEY')
-        self.base_url = "https://api.assemblyai.com/v2"
+        # Sesión HTTP compartida: keep-alive y reintentos en 429/5xx
+        self.transport = transport or default_transport
+        base_url = base_url or os.getenv('ASSEMBLYAI_BASE_URL', 'https://api.assemblyai.com')
+        self.base_url = f"{base_url.rstrip('/')}/v2"
         self.headers = {
             "authorization": self.api_key,
             "content-type": "application/json"
         }
+        # Modo webhook: AssemblyAI llama a webhook_url al terminar y
+        # handle_webhook despierta a quien espera; el polling queda de respaldo
+        self.webhook_url = webhook_url or os.getenv('ASSEMBLYAI_WEBHOOK_URL')
+        self.webhook_secret = webhook_secret or os.getenv('ASSEMBLYAI_WEBHOOK_SECRET')
+        self._waiters = {}
+        self._waiters_lock = threading.Lock()
         self.enabled = bool(self.api_key and self.api_key != "effa893c8d2342b4a09333f6dfbce42e")
     
-    def upload_audio(self, audio_file_path):
-        """Subir archivo de audio a AssemblyAI"""
+    def upload_audio(self, audio_source):
+        """Subir audio a AssemblyAI desde una ruta o un objeto tipo archivo"""
         if not self.enabled:
             return {"error": "AssemblyAI no configurado"}
         
         try:
-            # Subir archivo
-            with open(audio_file_path, "rb") as f:
-                upload_response = requests.post(
-                    f"{self.base_url}/upload",
-                    headers=self.headers,
-                    data=f.read()
-                )
+            # Subir archivo por bloques, sin cargarlo entero en memoria
+            upload_response = self.transport.post(
+                f"{self.base_url}/upload",
+                headers=self.headers,
+                data=StreamingBody(audio_source),
+                timeout=UPLOAD_TIMEOUT,
+                idempotent=True  # Repetir la subida solo deja un archivo sin usar
+            )
             
             if upload_response.status_code != 200:
                 return {"error": f"Error en upload: {upload_response.text}"}
@@ -36,25 +53,23 @@ class AssemblyAIClient:
         except Exception as e:
             return {"error": f"Error subiendo audio: {str(e)}"}
     
-    def transcribe_audio(self, audio_file_path):
-        """Transcribir archivo de audio completo"""
+    def transcribe_audio(self, audio_source):
+        """Transcribir archivo de audio completo (ruta o objeto tipo archivo)"""
         if not self.enabled:
             return {"error": "AssemblyAI no configurado"}
         
         try:
             # Primero subir el archivo
-            upload_result = self.upload_audio(audio_file_path)
+            upload_result = self.upload_audio(audio_source)
             if "error" in upload_result:
                 return upload_result
             
             # Solicitar transcripción
-            transcript_response = requests.post(
+            transcript_response = self.transport.post(
                 f"{self.base_url}/transcript",
                 headers=self.headers,
-                json={
-                    "audio_url": upload_result["upload_url"],
-                    "language_code": "es"
-                }
+                json=self.transcript_request(upload_result["upload_url"]),
+                timeout=API_TIMEOUT
             )
             
             if transcript_response.status_code != 200:
@@ -68,55 +83,117 @@ class AssemblyAIClient:
         except Exception as e:
             return {"error": f"Error en transcripción: {str(e)}"}
     
-    def wait_for_transcription(self, transcript_id, timeout=300):
+    def transcript_request(self, upload_url):
+        """Cuerpo de la petición de transcripción (con webhook si está configurado)"""
+        payload = {
+            "audio_url": upload_url,
+            "language_code": "es"
+        }
+        if self.webhook_url and self.webhook_secret:
+            payload.update({
+                "webhook_url": self.webhook_url,
+                "webhook_auth_header_name": self.WEBHOOK_HEADER,
+                "webhook_auth_header_value": self.webhook_secret
+            })
+        return payload
+    
+    def handle_webhook(self, headers, payload):
+        """Procesar la llamada del webhook; devuelve False si no está autorizada"""
+        received = headers.get(self.WEBHOOK_HEADER, "")
+        if not self.webhook_secret or not hmac.compare_digest(received, self.webhook_secret):
+            return False
+        with self._waiters_lock:
+            event = self._waiters.get((payload or {}).get("transcript_id"))
+        if event is not None:
+            event.set()
+        return True
+    
+    def wait_for_transcription(self, transcript_id, timeout=300, poll_interval=None):
         """Esperar a que la transcripción esté lista"""
         start_time = time.time()
+        if poll_interval is None:
+            poll_interval = 15 if self.webhook_url and self.webhook_secret else 2
+        event = threading.Event()
+        with self._waiters_lock:
+            self._waiters[transcript_id] = event
         
-        while time.time() - start_time < timeout:
-            # Verificar estado
-            status_response = requests.get(
-                f"{self.base_url}/transcript/{transcript_id}",
-                headers=self.headers
-            )
-            
-            if status_response.status_code != 200:
-                return {"error": f"Error verificando estado: {status_response.text}"}
-            
-            status_data = status_response.json()
-            status = status_data["status"]
-            
-            if status == "completed":
-                return {
-                    "success": True,
-                    "text": status_data["text"],
-                    "words": status_data.get("words", []),
-                    "confidence": status_data.get("confidence", 1.0),
-                    "duration": status_data.get("audio_duration", 0)
-                }
-            elif status == "error":
-                return {"error": status_data.get("error", "Error desconocido en transcripción")}
-            
-            # Esperar antes de verificar de nuevo
-            time.sleep(2)
+        try:
+            while time.time() - start_time < timeout:
+                # Verificar estado
+                status_response = self.transport.get(
+                    f"{self.base_url}/transcript/{transcript_id}",
+                    headers=self.headers,
+                    timeout=API_TIMEOUT
+                )
+                
+                if status_response.status_code != 200:
+                    return {"error": f"Error verificando estado: {status_response.text}"}
+                
+                status_data = status_response.json()
+                status = status_data["status"]
+                
+                if status == "completed":
+                    return {
+                        "success": True,
+                        "text": status_data["text"],
+                        "words": status_data.get("words", []),
+                        "confidence": status_data.get("confidence", 1.0),
+                        "duration": status_data.get("audio_duration", 0)
+                    }
+                elif status == "error":
+                    return {"error": status_data.get("error", "Error desconocido en transcripción")}
+                
+                # Esperar al webhook o, como respaldo, al siguiente polling
+                event.wait(poll_interval)
+                event.clear()
+        finally:
+            with self._waiters_lock:
+                self._waiters.pop(transcript_id, None)
         
         return {"error": "Timeout esperando por transcripción"}
     
-    def transcribe_realtime(self, audio_chunk):
-        """Transcripción en tiempo real (para futura implementación)"""
-        # Esta función sería para streaming, pero requiere WebSocket
-        # Por ahora usamos transcripción por archivo
-        return {"error": "Transcripción en tiempo real no implementada"}
+    def transcribe_realtime(self, audio_chunks, sample_rate=16000):
+        """Transcripción en tiempo real por WebSocket.
+
+        `audio_chunks` es un iterable de bloques PCM 16 bits mono (50-1000 ms
+        cada uno). Devuelve un generador de eventos `partial`/`final` a medida
+        que llegan; el audio se envía desde un hilo aparte.
+        """
+        if not self.enabled:
+            yield {"type": "error", "error": "AssemblyAI no configurado"}
+            return
+        
+        transcriber = StreamingTranscriber(
+            self.api_key,
+            url=os.getenv('ASSEMBLYAI_STREAMING_URL'),
+            sample_rate=sample_rate,
+            params={"speech_model": os.getenv('ASSEMBLYAI_STREAMING_MODEL', 'universal-streaming-multilingual')}
+        )
+        try:
+            session = transcriber.connect()
+        except Exception as e:
+            yield {"type": "error", "error": f"Error conectando streaming: {str(e)}"}
+            return
+        
+        def send_audio():
+            try:
+                for chunk in audio_chunks:
+                    session.send_audio(chunk)
+            except Exception:
+                pass
+            finally:
+                session.terminate()
+        
+        threading.Thread(target=send_audio, daemon=True).start()
+        try:
+            yield from session.events()
+        finally:
+            session.close()
 
 class VoiceFormManager:
     def __init__(self, assemblyai_client):
         self.client = assemblyai_client
-        self.field_keywords = {
-            'nombre': ['nombre', 'llámame', 'me llamo', 'mi nombre es', 'soy'],
-            'apellido': ['apellido', 'apellidos', 'mis apellidos'],
-            'edad': ['edad', 'años', 'tengo', 'mi edad es'],
-            'correo': ['correo', 'email', 'mail', 'correo electrónico'],
-            'celular': ['celular', 'teléfono', 'número', 'contacto', 'móvil']
-        }
+        self.matcher = default_matcher
     
     def process_voice_input(self, audio_file_path, current_field=None):
         """Procesar entrada de voz y extraer información relevante"""
@@ -131,93 +208,37 @@ class VoiceFormManager:
         text = result["text"].lower().strip()
         print(f"📝 Texto transcrito: {text}")
         
-        # Si se especifica un campo, usar directamente
-        if current_field:
-            return {
-                'success': True,
-                'field': current_field,
-                'value': self.clean_text(text),
-                'confidence': result.get('confidence', 1.0),
-                'original_text': text
-            }
-        
-        # Detectar comandos especiales
-        command_result = self.detect_commands(text)
-        if command_result:
-            return command_result
-        
-        # Intentar detectar campo automáticamente
-        return self.auto_detect_field(text, result.get('confidence', 1.0))
+        # Comandos, campo y valor en una sola pasada del matcher precompilado
+        match = self.matcher.match(text, current_field)
+        if 'field' not in match:
+            return {'success': True, 'action': match['action']}
+        match.update({
+            'success': True,
+            'confidence': result.get('confidence', 1.0),
+            'original_text': text
+        })
+        return match
     
     def detect_commands(self, text):
         """Detectar comandos de voz especiales"""
-        if any(cmd in text for cmd in ['siguiente', 'continuar', 'next', 'adelante']):
-            return {'success': True, 'action': 'next_field'}
-        elif any(cmd in text for cmd in ['anterior', 'atrás', 'back', 'regresar']):
-            return {'success': True, 'action': 'previous_field'}
-        elif any(cmd in text for cmd in ['enviar', 'registrar', 'finalizar', 'terminar']):
-            return {'success': True, 'action': 'submit_form'}
-        elif any(cmd in text for cmd in ['limpiar', 'borrar', 'reset', 'empezar de nuevo']):
-            return {'success': True, 'action': 'clear_form'}
-        elif any(cmd in text for cmd in ['ayuda', 'help', 'asistencia']):
-            return {'success': True, 'action': 'show_help'}
-        
-        return None
+        action = self.matcher.detect_command(text)
+        return {'success': True, 'action': action} if action else None
     
     def auto_detect_field(self, text, confidence):
         """Detectar automáticamente el campo basado en palabras clave"""
-        for field, keywords in self.field_keywords.items():
-            for keyword in keywords:
-                if keyword in text:
-                    value = self.extract_value_after_keyword(text, keyword)
-                    return {
-                        'success': True,
-                        'field': field,
-                        'value': value,
-                        'confidence': confidence,
-                        'original_text': text,
-                        'action': 'fill_field'
-                    }
-        
-        # Si no se detecta campo específico, devolver texto completo
-        return {
-            'success': True,
-            'field': 'unknown',
-            'value': self.clean_text(text),
-            'confidence': confidence,
-            'original_text': text,
-            'action': 'unknown'
-        }
-    
-    def extract_value_after_keyword(self, text, keyword):
-        """Extraer valor después de una palabra clave"""
-        if keyword in text:
-            start_pos = text.find(keyword) + len(keyword)
-            value = text[start_pos:].strip()
-            # Limpiar valor
-            value = self.clean_text(value)
-            return value
-        return text
+        match = self.matcher.match(text)
+        match.update({'success': True, 'confidence': confidence, 'original_text': text})
+        return match
     
     def clean_text(self, text):
         """Limpiar y formatear texto"""
-        # Remover palabras comunes no necesarias
-        common_words = ['es', 'de', 'el', 'la', 'los', 'las', 'un', 'una', 'y', 'o']
-        words = text.split()
-        filtered_words = [word for word in words if word not in common_words]
-        
-        # Unir y capitalizar
-        cleaned = ' '.join(filtered_words).title()
-        
-        # Limpiar puntuación extra
-        cleaned = cleaned.replace('.', '').replace(',', '').strip()
-        
-        return cleaned
+        return clean_text(text)
 
 # Cliente simplificado para transcripción básica
 class SimpleTranscriber:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, transport=None):
         self.api_key = api_key
+        self.transport = transport or default_transport
         self.enabled = bool(api_key and api_key != "tu_api_key_aqui")
     
     def transcribe_audio(self, audio_file_path):
@@ -229,10 +250,12 @@ class SimpleTranscriber:
             # Leer archivo de audio
             with open(audio_file_path, 'rb') as audio_file:
                 # Subir archivo
-                upload_response = requests.post(
+                upload_response = self.transport.post(
                     'https://api.assemblyai.com/v2/upload',
                     headers={'authorization': self.api_key},
-                    data=audio_file.read()
+                    data=StreamingBody(audio_file),
+                    timeout=UPLOAD_TIMEOUT,
+                    idempotent=True  # Repetir la subida solo deja un archivo sin usar
                 )
                 
                 if upload_response.status_code != 200:
@@ -241,7 +264,7 @@ class SimpleTranscriber:
                 upload_url = upload_response.json()['upload_url']
                 
                 # Solicitar transcripción
-                transcript_response = requests.post(
+                transcript_response = self.transport.post(
                     'https://api.assemblyai.com/v2/transcript',
                     headers={
                         'authorization': self.api_key,
@@ -250,7 +273,8 @@ class SimpleTranscriber:
                     json={
                         'audio_url': upload_url,
                         'language_code': 'es'
-                    }
+                    },
+                    timeout=API_TIMEOUT
                 )
                 
                 if transcript_response.status_code != 200:
@@ -260,9 +284,10 @@ class SimpleTranscriber:
                 
                 # Polling para obtener resultado
                 while True:
-                    polling_response = requests.get(
+                    polling_response = self.transport.get(
                         f'https://api.assemblyai.com/v2/transcript/{transcript_id}',
-                        headers={'authorization': self.api_key}
+                        headers={'authorization': self.api_key},
+                        timeout=API_TIMEOUT
                     )
                     
                     if polling_response.status_code != 200:
@@ -0,0 +1,114 @@
+import os
+import wave
+
+import numpy as np
+
+TARGET_RATE = 16000  # Lo que AssemblyAI usa internamente; más no mejora el resultado
+FRAME_MS = 30
+PAD_MS = 200
+
+
+def is_wav(path):
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    return head[:4] == b'RIFF' and head[8:12] == b'WAVE'
+
+
+def read_wav(path):
+    """Decodificar un WAV PCM a float32 en [-1, 1] con forma (muestras, canales)"""
+    with wave.open(path, 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif width == 3:
+        data = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = data[:, 0] | (data[:, 1] << 8) | (data[:, 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        samples = values.astype(np.float32) / (1 << 23)
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise wave.Error(f'Ancho de muestra no soportado: {width}')
+    usable = len(samples) - len(samples) % channels
+    return samples[:usable].reshape(-1, channels), rate
+
+
+def write_wav(path, signal, rate):
+    """Guardar una señal mono float32 como WAV PCM de 16 bits"""
+    pcm = (np.clip(signal, -1.0, 1.0) * 32767).astype('<i2')
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+
+
+def downmix(samples):
+    return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+
+
+def resample(signal, rate, target_rate=TARGET_RATE):
+    """Remuestreo lineal; al bajar de frecuencia se filtra antes con una media móvil"""
+    if rate == target_rate or len(signal) == 0:
+        return signal
+    if target_rate < rate:
+        width = int(np.ceil(rate / target_rate))
+        if width > 1:
+            signal = np.convolve(signal, np.ones(width, dtype=np.float32) / width, mode='same')
+    length = int(round(len(signal) * target_rate / rate))
+    positions = np.arange(length, dtype=np.float64) * (rate / target_rate)
+    return np.interp(positions, np.arange(len(signal)), signal).astype(np.float32)
+
+
+def trim_silence(signal, rate, frame_ms=FRAME_MS, pad_ms=PAD_MS, threshold_db=-35.0):
+    """Recortar el silencio inicial y final con un VAD por energía.
+
+    Una trama es voz si su energía RMS supera tanto el umbral relativo al
+    pico (`threshold_db`) como tres veces el ruido de fondo (percentil 10).
+    Se deja `pad_ms` de margen a cada lado para no cortar consonantes.
+    """
+    frame = int(rate * frame_ms / 1000)
+    count = len(signal) // frame
+    if count == 0:
+        return signal
+    frames = signal[:count * frame].reshape(count, frame)
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    peak = energy.max()
+    if peak == 0:
+        return signal
+    threshold = max(peak * 10 ** (threshold_db / 20), np.percentile(energy, 10) * 3)
+    voiced = np.flatnonzero(energy > threshold)
+    if len(voiced) == 0:
+        return signal
+    pad = int(pad_ms / frame_ms)
+    start = max(voiced[0] - pad, 0) * frame
+    end = min((voiced[-1] + 1 + pad) * frame, len(signal))
+    return signal[start:end]
+
+
+def preprocess_wav(path, target_rate=TARGET_RATE, trim=True):
+    """Preparar un WAV para subirlo: mono, `target_rate` Hz, 16 bits y sin silencios.
+
+    Devuelve la ruta del archivo nuevo (junto al original; lo borra quien
+    llama) o None si no es un WAV PCM, en cuyo caso se sube el original.
+    """
+    if not is_wav(path):
+        return None
+    try:
+        samples, rate = read_wav(path)
+    except (wave.Error, EOFError, ValueError):
+        return None  # WAV no PCM (p. ej. float o comprimido)
+
+    signal = resample(downmix(samples), rate, target_rate)
+    if trim:
+        signal = trim_silence(signal, target_rate)
+    output_path = f"{path}.{target_rate // 1000}k.wav"
+    write_wav(output_path, signal, target_rate)
+    print(f"🎚️ Audio preprocesado: {os.path.getsize(path)} → {os.path.getsize(output_path)} bytes")
+    return output_path
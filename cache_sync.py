@@ -0,0 +1,76 @@
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Almacén compartido por los workers (ver create_app); None = un solo proceso
+_store = None
+_check_interval = 1.0
+
+
+def attach(store, check_interval=1.0):
+    """Compartir las versiones de las cachés a través de `store` (state_store)"""
+    global _store, _check_interval
+    _store = store
+    _check_interval = check_interval
+
+
+class SharedVersion:
+    """Versión de un dato que cada worker cachea en memoria (usuarios, turnos, catálogos).
+
+    Quien confirma un cambio llama a `bump_on_commit` y la versión pasa a
+    ser un token nuevo en el almacén compartido. Cada caché guarda con sus
+    entradas la versión con la que las cargó y las descarta si `current()`
+    ya no coincide. `current()` consulta el almacén como mucho una vez cada
+    `check_interval` segundos, que es lo que tarda un cambio hecho en otro
+    worker en verse aquí.
+    """
+
+    def __init__(self, name):
+        self.key = f'version:{name}'
+        self._value = None
+        self._checked_at = 0
+
+    def current(self):
+        if _store is None:
+            return None
+        now = time.monotonic()
+        if now - self._checked_at >= _check_interval:
+            try:
+                self._value = _store.get(self.key)
+            except Exception as e:
+                print(f"⚠️ No se pudo leer {self.key}: {e}")
+            self._checked_at = now
+        return self._value
+
+    def bump(self):
+        if _store is None:
+            return
+        # Un token aleatorio y no un contador: dos cambios simultáneos nunca dejan la misma versión
+        value = uuid.uuid4().hex
+        try:
+            _store.set(self.key, value, ttl=30 * 86400)
+        except Exception as e:
+            print(f"⚠️ No se pudo publicar {self.key}: {e}")
+            return
+        self._value = value
+        self._checked_at = time.monotonic()
+
+    def bump_on_commit(self, session):
+        """Publicar la versión nueva cuando `session` confirme (ya, si no hay sesión)"""
+        if session is None:
+            self.bump()
+        else:
+            session.info.setdefault('shared_versions', set()).add(self)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed_versions(session):
+    for version in session.info.pop('shared_versions', ()):
+        version.bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_versions(session):
+    session.info.pop('shared_versions', None)
@@ -0,0 +1,294 @@
+"""Proceso único dueño de la cámara del servidor.
+
+Con varios workers de gunicorn cada uno tendría su propio hilo de captura
+abriendo el mismo dispositivo. Aquí un solo proceso abre la cámara, detecta
+rostros y publica el último JPEG y el resultado en memoria compartida
+(`multiprocessing.shared_memory`); los workers lo leen directamente, sin
+serializar ni pasar por sockets.
+
+El primer worker que necesita la cámara lanza `python camera_process.py`;
+un `flock` garantiza que solo quede un dueño aunque varios lo lancen a la
+vez. El proceso termina solo cuando nadie lee frames durante
+`CAMERA_IDLE_TIMEOUT` segundos. Requiere Linux/macOS (fcntl).
+"""
+import fcntl
+import os
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from multiprocessing import resource_tracker, shared_memory
+
+DEFAULT_NAME = 'asistencia-camera'
+DEFAULT_LOCK_PATH = os.path.join(tempfile.gettempdir(), 'asistencia-camera.lock')
+JPEG_CAPACITY = 512 * 1024  # un JPEG de 640x480 ronda los 50 KB
+
+# Cabecera: contador de secuencia (seqlock, impar mientras se escribe) y
+# luego instante de publicación, nº de frame, tamaño del JPEG, rostro
+# (-1 sin detección, 0 no, 1 sí) y cámara real disponible.
+_SEQ = struct.Struct('<Q')
+_HEADER = struct.Struct('<dQIbB')
+_HEADER_OFFSET = 8
+# Última lectura de algún worker; fuera del seqlock, la escriben los lectores
+_READER = struct.Struct('<d')
+_READER_OFFSET = 32
+DATA_OFFSET = 64
+
+Frame = namedtuple('Frame', 'seq published_at frame_count jpeg face_detected camera_available')
+
+
+class FrameBuffer:
+    """Último frame JPEG y su detección en un segmento de memoria compartida.
+
+    Un único escritor (`publish`) y cualquier número de lectores. El
+    escritor deja la secuencia impar mientras copia; el lector reintenta si
+    la ve impar o si cambió entre el principio y el final de la lectura.
+    """
+
+    def __init__(self, shm, owner=False):
+        self._shm = shm
+        self.owner = owner
+        self.capacity = shm.size - DATA_OFFSET
+        self.frame_count = 0
+
+    @classmethod
+    def create(cls, name=DEFAULT_NAME, capacity=JPEG_CAPACITY):
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=DATA_OFFSET + capacity)
+        except FileExistsError:
+            # Resto de un dueño que murió sin limpiar; solo llega aquí quien tiene el lock
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=DATA_OFFSET + capacity)
+        buffer = cls(shm, owner=True)
+        buffer.touch()
+        return buffer
+
+    @classmethod
+    def attach(cls, name=DEFAULT_NAME):
+        """Abrir el segmento existente; FileNotFoundError si no hay dueño"""
+        shm = shared_memory.SharedMemory(name=name)
+        # En Python < 3.13 el resource_tracker borraría el segmento al salir el worker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm)
+
+    def publish(self, jpeg, face_detected=None, camera_available=False):
+        """Escribir un frame (bytes o array de cv2.imencode); False si no cabe"""
+        data = memoryview(jpeg).cast('B')
+        size = data.nbytes
+        if size > self.capacity:
+            return False
+        buf = self._shm.buf
+        seq = _SEQ.unpack_from(buf, 0)[0]
+        _SEQ.pack_into(buf, 0, seq + 1)
+        buf[DATA_OFFSET:DATA_OFFSET + size] = data
+        self.frame_count += 1
+        face = -1 if face_detected is None else int(face_detected)
+        _HEADER.pack_into(buf, _HEADER_OFFSET, time.time(), self.frame_count, size, face, int(camera_available))
+        _SEQ.pack_into(buf, 0, seq + 2)
+        return True
+
+    def read(self, since=None, with_jpeg=True, retries=100):
+        """Último frame publicado, o None si no hay ninguno nuevo desde `since`.
+
+        Con `with_jpeg=False` solo se lee la cabecera (para los endpoints de
+        estado) y no se copia nada.
+        """
+        buf = self._shm.buf
+        for _ in range(retries):
+            seq = _SEQ.unpack_from(buf, 0)[0]
+            if seq & 1:
+                time.sleep(0.001)
+                continue
+            if seq == 0 or seq == since:
+                return None
+            published_at, frame_count, size, face, camera = _HEADER.unpack_from(buf, _HEADER_OFFSET)
+            jpeg = bytes(buf[DATA_OFFSET:DATA_OFFSET + min(size, self.capacity)]) if with_jpeg else None
+            if _SEQ.unpack_from(buf, 0)[0] == seq:
+                return Frame(seq, published_at, frame_count, jpeg,
+                             None if face < 0 else bool(face), bool(camera))
+        return None
+
+    def touch(self):
+        """Anotar que alguien está leyendo (el dueño se apaga si nadie lo hace)"""
+        _READER.pack_into(self._shm.buf, _READER_OFFSET, time.time())
+
+    def last_read_at(self):
+        return _READER.unpack_from(self._shm.buf, _READER_OFFSET)[0]
+
+    def close(self):
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+def run_owner(store, name=DEFAULT_NAME, lock_path=DEFAULT_LOCK_PATH, camera_index=0,
+              idle_timeout=300, fps=10):
+    """Bucle del proceso dueño: capturar, detectar y publicar hasta quedar ocioso.
+
+    Devuelve False sin hacer nada si ya hay otro dueño.
+    """
+    lock_file = open(lock_path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        print("📷 La cámara ya tiene un proceso dueño")
+        return False
+
+    import cv2
+    from vision import VisionPipeline, kiosk_binding
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+
+    buffer = FrameBuffer.create(name)
+    pipeline = VisionPipeline(*kiosk_binding(store), camera_index=camera_index)
+    pipeline.camera.initialize_camera()
+    print(f"📷 Proceso de cámara {os.getpid()} publicando en '{name}'")
+    try:
+        while not stopping.is_set():
+            try:
+                frame, face_found = pipeline.process_frame()
+                ret, jpeg = cv2.imencode('.jpg', frame)
+                if ret:
+                    buffer.publish(jpeg, face_found, pipeline.camera_available())
+                if time.time() - buffer.last_read_at() > idle_timeout:
+                    print(f"📷 Sin lectores durante {idle_timeout} s; liberando la cámara")
+                    break
+                stopping.wait(1 / fps)
+            except Exception as e:
+                print(f"Error en procesamiento: {e}")
+                stopping.wait(1)
+    finally:
+        pipeline.release()
+        buffer.close()
+        lock_file.close()
+    return True
+
+
+class CameraClient:
+    """Lado de los workers: misma interfaz que VisionPipeline, pero leyendo
+    los frames que publica el proceso dueño (que arranca si no existe).
+    """
+
+    def __init__(self, name=DEFAULT_NAME, lock_path=DEFAULT_LOCK_PATH, env=None, stale_after=3):
+        self.name = name
+        self.lock_path = lock_path
+        self.env = env or {}
+        self.stale_after = stale_after
+        self._buffer = None
+        self._process = None
+        self._attach_tried_at = 0
+        self._lock = threading.Lock()
+
+    def owner_running(self):
+        """¿Alguien tiene el lock? Es la prueba fiable de que el dueño sigue vivo"""
+        with open(self.lock_path, 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(f, fcntl.LOCK_UN)
+            return False
+
+    def start(self):
+        """Lanzar el proceso dueño si no hay ninguno vivo"""
+        with self._lock:
+            if self._process is not None and self._process.poll() is not None:
+                self._process = None  # recoger el proceso que terminó
+            if self.owner_running():
+                return
+            print("📷 Lanzando proceso dueño de la cámara")
+            self._process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__)],
+                env={**os.environ, 'CAMERA_SHM_NAME': self.name,
+                     'CAMERA_LOCK_PATH': self.lock_path, **self.env},
+                start_new_session=True
+            )
+
+    # El dueño abre la cámara al arrancar
+    open_camera = start
+
+    def _attached(self):
+        """Segmento mapeado; se vuelve a abrir (como mucho una vez por segundo) si el dueño cambió"""
+        buffer = self._buffer
+        if buffer is not None:
+            latest = buffer.read(with_jpeg=False)
+            if latest is not None and time.time() - latest.published_at <= self.stale_after:
+                return buffer
+        with self._lock:
+            if time.time() - self._attach_tried_at >= 1:
+                self._attach_tried_at = time.time()
+                try:
+                    # El mapeo anterior no se cierra aquí: otro hilo puede estar
+                    # leyéndolo; se libera cuando deja de tener referencias
+                    self._buffer = FrameBuffer.attach(self.name)
+                except FileNotFoundError:
+                    pass
+            return self._buffer
+
+    def latest(self, with_jpeg=False):
+        """Último frame si el dueño publicó hace menos de `stale_after` segundos"""
+        buffer = self._attached()
+        frame = buffer.read(with_jpeg=with_jpeg) if buffer else None
+        if frame is None or time.time() - frame.published_at > self.stale_after:
+            return None
+        return frame
+
+    def camera_available(self):
+        frame = self.latest()
+        return bool(frame and frame.camera_available)
+
+    def generate_frames(self):
+        """Generar stream de video con los frames publicados por el dueño"""
+        seq = None
+        idle_since = time.time()
+        while True:
+            buffer = self._attached()
+            frame = buffer.read(since=seq) if buffer else None
+            if frame is not None:
+                seq = frame.seq
+                idle_since = time.time()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame.jpeg + b'\r\n')
+            elif time.time() - idle_since > self.stale_after:
+                # El dueño se apagó (o murió) con alguien mirando: relanzarlo
+                self.start()
+                idle_since = time.time()
+            if buffer:
+                buffer.touch()
+            time.sleep(0.05)  # Limit streaming FPS to 20
+
+    def release(self):
+        """Soltar el mapeo; el dueño libera la cámara cuando se queda sin lectores"""
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+
+
+def main():
+    from state_store import create_store
+
+    store = create_store(
+        os.getenv('STATE_BACKEND', 'memory'),
+        path=os.getenv('STATE_PATH', 'instance/state.db'),
+        url=os.getenv('STATE_URL') or None,
+        ttl=int(os.getenv('STATE_TTL', 43200))
+    )
+    run_owner(
+        store,
+        name=os.getenv('CAMERA_SHM_NAME', DEFAULT_NAME),
+        lock_path=os.getenv('CAMERA_LOCK_PATH', DEFAULT_LOCK_PATH),
+        camera_index=int(os.getenv('CAMERA_INDEX', 0)),
+        idle_timeout=int(os.getenv('CAMERA_IDLE_TIMEOUT', 300))
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,247 @@
 #!/usr/bin/env python3
-import sqlite3
+"""Conciliar los archivos de evidencia de la base de datos con la carpeta de subidas.
+
+Detecta en las dos direcciones:
+  - archivos huérfanos: están en disco pero ninguna evidencia los referencia
+  - archivos perdidos: una evidencia los referencia pero no están en disco
+
+Ambos lados se vuelcan por lotes a una base SQLite temporal y se cruzan allí,
+así la memoria no crece con el número de archivos.
+
+Uso:
+  python check_db.py                         # solo informe
+  python check_db.py --quarantine cuarentena # mover huérfanos
+  python check_db.py --delete                # borrar huérfanos
+"""
+import argparse
 import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+
+from models import Evidence
+from upload_layout import TEMP_PREFIX, owner_stem, stored_name
+
+
+def resolve_database_url(url=None):
+    """Misma URL que usa la app; las rutas SQLite relativas van a instance/ como en Flask-SQLAlchemy"""
+    url = url or os.getenv('SUPABASE_DATABASE_URL', os.getenv('DATABASE_URL', 'sqlite:///attendance.db'))
+    parsed = make_url(url)
+    if parsed.drivername.startswith('sqlite') and parsed.database and parsed.database != ':memory:' \
+            and not os.path.isabs(parsed.database):
+        instance_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
+        parsed = parsed.set(database=os.path.join(instance_path, parsed.database))
+    return parsed
+
+
+def walk_uploads(root):
+    """Recorrer la carpeta de subidas (incluidas subcarpetas) con os.scandir"""
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+class Reconciler:
+    def __init__(self, database_url, upload_folder, chunk_size=10000, temp_max_age=3600):
+        self.engine = create_engine(database_url)
+        self.upload_folder = upload_folder
+        self.chunk_size = chunk_size
+        self.temp_max_age = temp_max_age
+        self._workdir = tempfile.TemporaryDirectory(prefix='reconcile-')
+        self.index = sqlite3.connect(os.path.join(self._workdir.name, 'index.db'))
+        self.index.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE db_files (evidence_id INTEGER, name TEXT, stem TEXT);
+            CREATE TABLE disk_files (name TEXT, stem TEXT, rel_path TEXT, is_stale_temp INTEGER);
+        """)
+
+    def close(self):
+        self.index.close()
+        self._workdir.cleanup()
+        self.engine.dispose()
+
+    def load_database(self):
+        """Volcar las rutas de la base por lotes, sin cargarlas todas en memoria"""
+        stmt = select(Evidence.id, Evidence.file_path).where(Evidence.file_path.isnot(None))
+        count = 0
+        with self.engine.connect() as connection:
+            result = connection.execution_options(stream_results=True, yield_per=self.chunk_size).execute(stmt)
+            for rows in result.partitions():
+                batch = []
+                for evidence_id, file_path in rows:
+                    # Algunas subidas antiguas guardaron la ruta completa
+                    name = stored_name(file_path)
+                    batch.append((evidence_id, name, owner_stem(name)))
+                self.index.executemany('INSERT INTO db_files VALUES (?, ?, ?)', batch)
+                count += len(batch)
+        self.index.execute('CREATE INDEX ix_db_name ON db_files (name)')
+        self.index.execute('CREATE INDEX ix_db_stem ON db_files (stem)')
+        return count
+
+    def load_disk(self, snapshot_time):
+        """Volcar los archivos en disco; se ignoran los creados después de leer la base"""
+        count = 0
+        batch = []
+        for entry in walk_uploads(self.upload_folder):
+            rel_path = os.path.relpath(entry.path, self.upload_folder)
+            stat = entry.stat(follow_symlinks=False)
+            # os.replace conserva el mtime del temporal, que puede ser anterior a
+            # la lectura de la base; el ctime sí cambia al renombrar
+            modified = max(stat.st_mtime, stat.st_ctime)
+            if modified >= snapshot_time:
+                continue  # Subida posterior al volcado de la base
+            stale_temp = 0
+            if entry.name.startswith(TEMP_PREFIX):
+                # Un temporal reciente puede ser una subida en curso
+                if snapshot_time - modified < self.temp_max_age:
+                    continue
+                stale_temp = 1
+            batch.append((entry.name, owner_stem(entry.name), rel_path, stale_temp))
+            if len(batch) >= self.chunk_size:
+                self.index.executemany('INSERT INTO disk_files VALUES (?, ?, ?, ?)', batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.index.executemany('INSERT INTO disk_files VALUES (?, ?, ?, ?)', batch)
+            count += len(batch)
+        self.index.execute('CREATE INDEX ix_disk_name ON disk_files (name)')
+        self.index.execute('CREATE INDEX ix_disk_stem ON disk_files (stem)')
+        return count
+
+    def orphan_files(self):
+        """Archivos en disco cuyo original no referencia ninguna evidencia"""
+        return self.index.execute("""
+            SELECT rel_path FROM disk_files d
+            WHERE d.is_stale_temp = 1
+               OR NOT EXISTS (SELECT 1 FROM db_files f WHERE f.stem = d.stem)
+            ORDER BY rel_path
+        """)
+
+    def missing_files(self):
+        """Evidencias cuyo archivo no está en disco"""
+        return self.index.execute("""
+            SELECT evidence_id, name FROM db_files f
+            WHERE NOT EXISTS (SELECT 1 FROM disk_files d WHERE d.name = f.name)
+            ORDER BY evidence_id
+        """)
+
+    def recent_stems(self, since):
+        """Originales de las evidencias creadas desde `since` (epoch), leídos de nuevo"""
+        stmt = select(Evidence.file_path).where(
+            Evidence.file_path.isnot(None),
+            Evidence.created_at >= datetime.utcfromtimestamp(since)
+        )
+        with self.engine.connect() as connection:
+            return {owner_stem(stored_name(file_path)) for (file_path,) in connection.execute(stmt)}
+
+    def apply(self, rel_paths, quarantine=None, delete=False, keep_stems=()):
+        """Mover a cuarentena o borrar un lote de huérfanos.
+
+        Se salta lo que pertenezca a `keep_stems`: evidencias que se
+        confirmaron después de volcar la base.
+        """
+        applied = 0
+        for rel_path in rel_paths:
+            name = os.path.basename(rel_path)
+            if not name.startswith(TEMP_PREFIX) and owner_stem(name) in keep_stems:
+                continue
+            source = os.path.join(self.upload_folder, rel_path)
+            try:
+                if quarantine:
+                    target = os.path.join(quarantine, rel_path)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    shutil.move(source, target)
+                elif delete:
+                    os.remove(source)
+                applied += 1
+            except FileNotFoundError:
+                pass  # Ya no está (p. ej. la app lo borró mientras tanto)
+        return applied
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Conciliar evidencias en base de datos con la carpeta de subidas')
+    parser.add_argument('--database-url', help='URL de la base (por defecto la de la app)')
+    parser.add_argument('--upload-folder', default='uploads', help='Carpeta de subidas (por defecto: uploads)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Filas/archivos por lote')
+    parser.add_argument('--temp-max-age', type=int, default=3600,
+                        help='Segundos tras los que un temporal de subida se considera huérfano')
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--quarantine', metavar='DIR', help='Mover los huérfanos a esta carpeta')
+    action.add_argument('--delete', action='store_true', help='Borrar los huérfanos')
+    parser.add_argument('--quiet', action='store_true', help='Mostrar solo el resumen')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.upload_folder):
+        print(f"❌ La carpeta de subidas no existe: {args.upload_folder}")
+        return 1
 
-def check_database():
-    # Connect to SQLite database
-    db_path = 'attendance.db'
-    if not os.path.exists(db_path):
-        print("Database file not found!")
-        return
+    database_url = resolve_database_url(args.database_url)
+    if database_url.drivername.startswith('sqlite') and not os.path.exists(database_url.database or ''):
+        print(f"❌ No se encontró la base de datos: {database_url.database}")
+        return 1
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+    reconciler = Reconciler(database_url, args.upload_folder,
+                            chunk_size=args.chunk_size, temp_max_age=args.temp_max_age)
+    try:
+        snapshot_time = time.time()
+        db_count = reconciler.load_database()
+        disk_count = reconciler.load_disk(snapshot_time)
+        print(f"📊 {db_count} evidencias con archivo, {disk_count} archivos en {args.upload_folder}")
 
-    # Check evidence table
-    cursor.execute("SELECT id, file_path FROM evidence")
-    evidences = cursor.fetchall()
+        orphans = 0
+        applied = 0
+        cursor = reconciler.orphan_files()
+        while True:
+            batch = [rel_path for (rel_path,) in cursor.fetchmany(args.chunk_size)]
+            if not batch:
+                break
+            orphans += len(batch)
+            if not args.quiet:
+                for rel_path in batch:
+                    print(f"ORPHAN  {rel_path}")
+            if args.quarantine or args.delete:
+                # Volver a mirar la base justo antes de tocar nada: una subida
+                # guardada en disco antes del volcado pudo confirmarse después
+                keep_stems = reconciler.recent_stems(snapshot_time - args.temp_max_age)
+                applied += reconciler.apply(batch, quarantine=args.quarantine, delete=args.delete,
+                                            keep_stems=keep_stems)
 
-    print("Evidence records in database:")
-    for evidence_id, file_path in evidences:
-        print(f'ID: {evidence_id}, Path: {repr(file_path)}')
+        missing = 0
+        cursor = reconciler.missing_files()
+        while True:
+            batch = cursor.fetchmany(args.chunk_size)
+            if not batch:
+                break
+            missing += len(batch)
+            if not args.quiet:
+                for evidence_id, name in batch:
+                    print(f"MISSING evidence={evidence_id} {name}")
 
-    conn.close()
+        if args.quarantine or args.delete:
+            verb = 'movidos a cuarentena' if args.quarantine else 'borrados'
+            print(f"✅ {orphans} archivos huérfanos detectados, {applied} {verb}, {missing} archivos perdidos")
+        else:
+            print(f"✅ {orphans} archivos huérfanos detectados, {missing} archivos perdidos")
+    finally:
+        reconciler.close()
+    return 0
 
-    # Check upload folder
-    upload_folder = 'uploads'
-    print(f"\nUpload folder: {upload_folder}")
-    print("Files in upload folder:")
-    if os.path.exists(upload_folder):
-        for filename in os.listdir(upload_folder):
-            print(f"  {filename}")
-    else:
-        print("  Upload folder does not exist!")
 
 if __name__ == '__main__':
-    check_database()
\ No newline at end of file
+    sys.exit(main())
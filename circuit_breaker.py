@@ -0,0 +1,159 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class ServiceUnavailable(Exception):
+    """Llamada rechazada sin intentarla: circuito abierto o sin plazas libres"""
+
+    def __init__(self, message, reason, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.reason = reason  # 'circuit_open' | 'busy'
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class CircuitBreaker:
+    """Cortacircuitos por tasa de fallos en una ventana deslizante.
+
+    Cerrado: todo pasa y se anota el resultado. Si en los últimos `window`
+    segundos hay al menos `min_calls` llamadas y la proporción de fallos
+    llega a `failure_rate`, se abre y durante `reset_timeout` segundos se
+    rechaza todo al instante. Después pasa a semiabierto: se dejan pasar
+    `half_open_calls` llamadas de prueba; un éxito lo cierra y un fallo lo
+    vuelve a abrir.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window=60, min_calls=5, failure_rate=0.5, reset_timeout=30, half_open_calls=1):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._state = self.CLOSED
+        self._calls = deque()  # (instante, fallo)
+        self._opened_at = None
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.time())
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def retry_after(self):
+        """Segundos hasta que se vuelva a intentar (0 si no está abierto)"""
+        with self._lock:
+            if self._current_state(time.time()) != self.OPEN:
+                return 0
+            return self.reset_timeout - (time.time() - self._opened_at)
+
+    def allow(self):
+        """¿Puede hacerse la llamada? En semiabierto reserva una de las pruebas"""
+        with self._lock:
+            state = self._current_state(time.time())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """Como `allow`, pero lanza ServiceUnavailable si no se puede llamar"""
+        if not self.allow():
+            raise ServiceUnavailable(
+                f'{self.name} no responde; se reintentará en unos segundos',
+                'circuit_open', self.retry_after()
+            )
+
+    def record_success(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                print(f"✅ Circuito de {self.name} cerrado de nuevo")
+                self._state = self.CLOSED
+                self._calls.clear()
+            elif self._state == self.CLOSED:
+                self._record(False)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trip()
+            elif self._state == self.CLOSED:
+                self._record(True)
+                failures = sum(1 for _, failed in self._calls if failed)
+                if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+                    self._trip()
+
+    def _record(self, failed):
+        now = time.time()
+        self._calls.append((now, failed))
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def _trip(self):
+        print(f"⚡ Circuito de {self.name} abierto durante {self.reset_timeout} s")
+        self._state = self.OPEN
+        self._opened_at = time.time()
+        self._calls.clear()
+        self.trips += 1
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state(time.time())
+            failures = sum(1 for _, failed in self._calls if failed)
+            return {
+                'state': state,
+                'calls_in_window': len(self._calls),
+                'failures_in_window': failures,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+class ConcurrencyLimiter:
+    """Tope de operaciones simultáneas; sin espera, si no hay plaza se rechaza"""
+
+    def __init__(self, limit, name='transcripciones'):
+        self.limit = limit
+        self.name = name
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """Reservar una plaza o lanzar ServiceUnavailable"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceUnavailable(
+                f'Demasiadas {self.name} en curso; inténtelo de nuevo en unos segundos', 'busy'
+            )
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': self.in_flight, 'limit': self.limit, 'rejected': self.rejected}
@@ -0,0 +1,80 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from websockets.sync.server import serve
+from werkzeug.serving import make_server
+
+import fake_assemblyai as fake_api
+from app import create_app
+from models import db
+from refdata import department_cache, position_cache
+from schedule import shift_schedule
+from user_cache import user_cache
+
+
+@pytest.fixture
+def app(tmp_path):
+    """App aislada sobre SQLite en memoria y una carpeta de subidas temporal"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'STATE_BACKEND': 'memory',
+    })
+    reset_process_caches()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def make_user(app):
+    """Crear usuarios de prueba (contraseña 'secreto')"""
+    from models import User
+
+    def make_user(username, role='employee', **fields):
+        user = User(username=username, email=f'{username}@example.com', first_name=username.title(),
+                    last_name='Prueba', role=role, **fields)
+        user.set_password('secreto')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+
+def reset_process_caches():
+    """Las cachés en memoria son del proceso: cada prueba empieza con una base nueva"""
+    shift_schedule.invalidate()
+    user_cache.clear()
+    department_cache.invalidate()
+    position_cache.invalidate()
+
+
+def login(client, username, password='secreto'):
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302
+    return client
+
+
+def serve_app(app):
+    """Servir una app WSGI en un puerto libre; devuelve (servidor, URL base)"""
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+@pytest.fixture(scope='session')
+def fake_assemblyai():
+    """fake_assemblyai.py en puertos libres: API REST y streaming v3"""
+    fake_api.app.config['DELAY'] = 0.3
+    rest, base_url = serve_app(fake_api.app)
+    streaming = serve(fake_api.streaming_session, '127.0.0.1', 0)
+    threading.Thread(target=streaming.serve_forever, daemon=True).start()
+    port = streaming.socket.getsockname()[1]
+    yield SimpleNamespace(base_url=base_url, streaming_url=f'ws://127.0.0.1:{port}/v3/ws',
+                          text=fake_api.app.config['TEXT'])
+    streaming.shutdown()
+    rest.shutdown()
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import upload_layout
+
+# Variantes generadas para cada foto: lado mayor en píxeles y calidad
+DERIVATIVE_SIZES = {
+    'thumb': {'max_side': 400, 'quality': 70},
+    'display': {'max_side': 1280, 'quality': 80},
+}
+DERIVATIVE_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+# Recompresión opcional del original al subirlo (EVIDENCE_RECOMPRESS)
+RECOMPRESS_DEFAULTS = {'max_side': 2048, 'quality': 82, 'format': 'jpeg'}
+
+
+def derivative_name(file_name, size, fmt):
+    """Nombre del archivo derivado, p. ej. `<sha256>.thumb.webp`"""
+    stem = os.path.splitext(file_name)[0]
+    return f"{stem}.{size}.{fmt}"
+
+
+def derivative_names(file_name):
+    return [derivative_name(file_name, size, fmt)
+            for size in DERIVATIVE_SIZES for fmt in DERIVATIVE_FORMATS]
+
+
+def render_derivatives(upload_folder, file_name):
+    """Generar las variantes redimensionadas de una foto (se ejecuta en el pool).
+
+    Devuelve {size: {fmt: nombre}}. Las variantes ya existentes no se
+    regeneran, así que un contenido duplicado no cuesta trabajo extra.
+    """
+    from PIL import Image, ImageOps
+
+    source_path = upload_layout.resolve(upload_folder, file_name)
+    if source_path is None:
+        raise FileNotFoundError(file_name)
+    result = {}
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        for size, spec in DERIVATIVE_SIZES.items():
+            result[size] = {}
+            resized = None
+            for fmt, pil_format in DERIVATIVE_FORMATS.items():
+                name = derivative_name(file_name, size, fmt)
+                target_path = upload_layout.sharded_path(upload_folder, name)
+                if upload_layout.resolve(upload_folder, name) is None:
+                    if resized is None:
+                        resized = image.copy()
+                        resized.thumbnail((spec['max_side'], spec['max_side']), Image.LANCZOS)
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    # Temporal único: dos subidas del mismo contenido pueden coincidir
+                    fd, temp_path = tempfile.mkstemp(dir=upload_folder, prefix=upload_layout.TEMP_PREFIX)
+                    with os.fdopen(fd, 'wb') as temp:
+                        resized.save(temp, pil_format, quality=spec['quality'], optimize=True)
+                    os.replace(temp_path, target_path)
+                result[size][fmt] = name
+    return result
+
+
+def _flatten(image, pil_format):
+    """Pasar a RGB; en JPEG la transparencia se compone sobre blanco"""
+    from PIL import Image
+
+    if image.mode in ('RGB', 'L'):
+        return image
+    if pil_format == 'JPEG' and (image.mode in ('RGBA', 'LA') or 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGBA' if pil_format == 'WEBP' and image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+
+def recompress_original(upload_folder, file_name, max_side, quality, fmt):
+    """Reducir, recomprimir y quitar el EXIF de una foto (se ejecuta en el pool).
+
+    La orientación EXIF se aplica a los píxeles antes de descartar los
+    metadatos. Las capturas PNG pasan al formato configurado. Devuelve
+    (sha256, nombre, tamaño) del nuevo original, o None si no compensa:
+    el resultado no es más pequeño y la foto no llevaba EXIF.
+    """
+    from PIL import Image, ImageOps
+
+    source_path = upload_layout.resolve(upload_folder, file_name)
+    if source_path is None:
+        raise FileNotFoundError(file_name)
+    pil_format = DERIVATIVE_FORMATS[fmt]
+    original_size = os.path.getsize(source_path)
+
+    with Image.open(source_path) as original:
+        had_exif = bool(original.info.get('exif')) or bool(original.getexif())
+        image = _flatten(ImageOps.exif_transpose(original), pil_format)
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        fd, temp_path = tempfile.mkstemp(dir=upload_folder, prefix=upload_layout.TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'w+b') as temp:
+                image.save(temp, pil_format, quality=quality, optimize=True)
+                size = temp.tell()
+                temp.seek(0)
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: temp.read(64 * 1024), b''):
+                    digest.update(chunk)
+            if size >= original_size and not had_exif:
+                return None
+
+            sha256 = digest.hexdigest()
+            new_name = f"{sha256}.{'jpg' if fmt == 'jpeg' else fmt}"
+            if new_name == file_name:
+                return None
+            if upload_layout.resolve(upload_folder, new_name) is None:
+                target_path = upload_layout.sharded_path(upload_folder, new_name)
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                os.replace(temp_path, target_path)
+            return sha256, new_name, size
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def process_upload(upload_folder, file_name, recompress=None):
+    """Trabajo completo de una foto subida: recompresión opcional y variantes"""
+    recompressed = None
+    if recompress:
+        recompressed = recompress_original(upload_folder, file_name, **recompress)
+        if recompressed:
+            file_name = recompressed[1]
+    return recompressed, render_derivatives(upload_folder, file_name)
+
+
+class DerivativePipeline:
+    """Pool de procesos que recomprime y genera miniaturas tras cada subida de foto"""
+
+    def __init__(self, app=None, storage=None, workers=2):
+        self.app = app
+        self.storage = storage
+        self.workers = workers
+        self.recompress = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, storage=None):
+        self.app = app
+        self.storage = storage or self.storage
+        self.workers = app.config.get('EVIDENCE_DERIVATIVE_WORKERS', self.workers)
+        if app.config.get('EVIDENCE_RECOMPRESS'):
+            self.recompress = {
+                'max_side': app.config.get('EVIDENCE_MAX_SIDE', RECOMPRESS_DEFAULTS['max_side']),
+                'quality': app.config.get('EVIDENCE_QUALITY', RECOMPRESS_DEFAULTS['quality']),
+                'fmt': app.config.get('EVIDENCE_RECOMPRESS_FORMAT', RECOMPRESS_DEFAULTS['format']),
+            }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 'spawn' para no heredar los hilos de la cámara ni de gunicorn
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """Olvidar un pool roto (murió un proceso); el siguiente trabajo crea otro"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def submit(self, evidence_id, file_name):
+        """Encolar el procesado de una evidencia ya confirmada"""
+        args = (process_upload, self.app.config['UPLOAD_FOLDER'], file_name, self.recompress)
+        executor = self._get_executor()
+        try:
+            future = executor.submit(*args)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(*args)
+        future.add_done_callback(lambda f: self._record(evidence_id, file_name, f, executor))
+        return future
+
+    def _record(self, evidence_id, source_name, future, executor=None):
+        from models import db, Evidence
+
+        try:
+            recompressed, derivatives = future.result()
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and executor is not None:
+                self._discard_executor(executor)
+            print(f"❌ Error procesando la foto de la evidencia {evidence_id}: {e}")
+            return
+
+        with self.app.app_context():
+            try:
+                evidence = db.session.get(Evidence, evidence_id)
+                if evidence is None or evidence.file_path != source_name:
+                    # Borrada o cambiada mientras tanto: lo generado sobra
+                    if recompressed:
+                        self.storage._remove_file(recompressed[0], recompressed[1])
+                    return
+
+                if recompressed:
+                    # El original pasa a ser la versión recomprimida; el anterior
+                    # pierde una referencia y se borra si nadie más lo usa
+                    sha256, file_name, size = recompressed
+                    old_hash = evidence.content_hash
+                    self.storage._add_reference(sha256, file_name, size)
+                    evidence.file_path = file_name
+                    evidence.content_hash = sha256
+                    db.session.flush()
+                    if old_hash:
+                        self.storage.release(old_hash)
+                evidence.derivatives = json.dumps(derivatives)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Error guardando la foto procesada de la evidencia {evidence_id}: {e}")
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def pick_derivative(upload_folder, file_name, size, accept_webp):
+    """Variante a servir para `?size=`, o None si aún no existe"""
+    if size not in DERIVATIVE_SIZES:
+        return None
+    formats = ['webp', 'jpeg'] if accept_webp else ['jpeg']
+    for fmt in formats:
+        name = derivative_name(file_name, size, fmt)
+        if upload_layout.resolve(upload_folder, name):
+            return name
+    return None
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from werkzeug.utils import secure_filename
+
+from models import db, EvidenceBlob
+from evidence_derivatives import derivative_names
+import upload_layout
+from ingest import IngestSpool
+
+CHUNK_SIZE = 64 * 1024
+
+
+class EvidenceStorage:
+    """Almacén de evidencias direccionado por contenido (SHA-256).
+
+    Cada archivo se guarda una sola vez como `<sha256><ext>`; `EvidenceBlob`
+    lleva la cuenta de cuántas evidencias lo referencian.
+    """
+
+    def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
+
+    def path_for(self, file_name):
+        """Ruta de escritura (esquema `ab/cd/<nombre>`)"""
+        return upload_layout.sharded_path(self.upload_folder, file_name)
+
+    def resolve(self, file_name):
+        """Ruta existente del archivo, sea del esquema nuevo o del plano antiguo"""
+        return upload_layout.resolve(self.upload_folder, file_name)
+
+    def _spool(self, stream):
+        """Copiar el stream a un IngestSpool (hash calculado por el camino)"""
+        spool = IngestSpool(self.upload_folder, {})
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                spool.write(chunk)
+            spool.seek(0)
+        except Exception:
+            spool.discard()
+            raise
+        return spool
+
+    def store(self, file_storage):
+        """Guardar un archivo subido y devolver su EvidenceBlob.
+
+        Si el contenido ya existía solo se incrementa la referencia y el
+        temporal se descarta. Los cambios en la base quedan en la sesión
+        actual y se confirman junto con la evidencia.
+        """
+        spool = file_storage.stream
+        if not isinstance(spool, IngestSpool):
+            # Fuera de una petición con IngestRequest: volcar y hashear aquí
+            spool = self._spool(file_storage.stream)
+        extension = os.path.splitext(secure_filename(file_storage.filename or ''))[1].lower()
+
+        try:
+            blob = self._add_reference(spool.sha256, f"{spool.sha256}{extension}", spool.size)
+            if not self.resolve(blob.file_name):
+                spool.commit(self.path_for(blob.file_name))
+        finally:
+            # Contenido duplicado o error: el temporal no se conserva
+            spool.discard()
+        return blob
+
+    def _add_reference(self, sha256, file_name, size):
+        for _ in range(2):
+            result = db.session.execute(
+                update(EvidenceBlob)
+                .where(EvidenceBlob.sha256 == sha256)
+                .values(ref_count=EvidenceBlob.ref_count + 1)
+            )
+            if result.rowcount == 0:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(insert(EvidenceBlob).values(
+                            sha256=sha256, file_name=file_name, size=size,
+                            ref_count=1, created_at=datetime.utcnow()
+                        ))
+                except IntegrityError:
+                    continue  # Otra petición subió el mismo contenido a la vez
+            return db.session.execute(
+                select(EvidenceBlob).where(EvidenceBlob.sha256 == sha256)
+                .execution_options(populate_existing=True)
+            ).scalar_one()
+        raise RuntimeError(f"No se pudo registrar el blob {sha256}")
+
+    def release(self, sha256):
+        """Quitar una referencia; el archivo se borra tras el commit si era la última"""
+        db.session.execute(
+            update(EvidenceBlob)
+            .where(EvidenceBlob.sha256 == sha256)
+            .values(ref_count=EvidenceBlob.ref_count - 1)
+        )
+        blob = db.session.execute(
+            select(EvidenceBlob.file_name, EvidenceBlob.ref_count).where(EvidenceBlob.sha256 == sha256)
+        ).first()
+        # La fila se queda (con 0) hasta que `_remove_file` borre el archivo
+        if blob and blob.ref_count <= 0:
+            db.session.info.setdefault('released_blobs', []).append((self, sha256, blob.file_name))
+
+    def _remove_file(self, sha256, file_name):
+        """Borrar el archivo de un blob sin referencias, salvo que se haya vuelto a subir.
+
+        Comprobación y borrado van en una misma transacción que bloquea la
+        fila del hash (borrándola o, si no existe, reservándola), así que una
+        subida simultánea del mismo contenido espera a que termine y, al no
+        encontrar el archivo, lo vuelve a escribir. La sesión ya no admite
+        SQL en after_commit, así que se usa otra conexión.
+        """
+        with db.engine.connect() as connection, connection.begin():
+            unused = connection.execute(
+                delete(EvidenceBlob)
+                .where(EvidenceBlob.sha256 == sha256, EvidenceBlob.ref_count <= 0)
+            ).rowcount
+            if not unused:
+                # Sin fila (p. ej. una recompresión descartada) o con referencias
+                try:
+                    with connection.begin_nested():
+                        connection.execute(insert(EvidenceBlob).values(
+                            sha256=sha256, file_name=file_name, size=0,
+                            ref_count=0, created_at=datetime.utcnow()
+                        ))
+                except IntegrityError:
+                    return  # Alguien lo referencia: se conserva
+            self.remove_file(file_name)
+            if not unused:
+                connection.execute(delete(EvidenceBlob).where(EvidenceBlob.sha256 == sha256))
+
+    def adopt_legacy_files(self):
+        """Pasar al almacén por hash las fotos subidas antes de que existiera.
+
+        Cada archivo antiguo se enlaza (o copia) como `<sha256><ext>`, la
+        evidencia pasa a referenciar su EvidenceBlob y el archivo antiguo se
+        borra tras el commit. Idempotente: solo toca evidencias sin
+        content_hash cuyo archivo sigue en disco. Devuelve cuántas adoptó.
+        """
+        from models import Evidence
+
+        legacy = db.session.execute(
+            select(Evidence.id, Evidence.file_path)
+            .where(Evidence.content_hash.is_(None), Evidence.file_path.isnot(None))
+        ).all()
+        adopted = 0
+        for evidence_id, file_path in legacy:
+            source_path = self.resolve(upload_layout.stored_name(file_path))
+            if source_path is None:
+                continue  # check_db lo informa como archivo perdido
+            digest = hashlib.sha256()
+            with open(source_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            sha256 = digest.hexdigest()
+            extension = os.path.splitext(source_path)[1].lower()
+            blob = self._add_reference(sha256, f"{sha256}{extension}", os.path.getsize(source_path))
+            target_path = self.resolve(blob.file_name)
+            if target_path is None:
+                target_path = self.path_for(blob.file_name)
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                try:
+                    os.link(source_path, target_path)
+                except OSError:
+                    fd, temp_path = tempfile.mkstemp(dir=self.upload_folder, prefix=upload_layout.TEMP_PREFIX)
+                    with os.fdopen(fd, 'wb') as temp, open(source_path, 'rb') as source:
+                        shutil.copyfileobj(source, temp)
+                    os.replace(temp_path, target_path)
+            db.session.execute(
+                update(Evidence).where(Evidence.id == evidence_id)
+                .values(file_path=blob.file_name, content_hash=sha256)
+            )
+            db.session.commit()
+            # El nombre nuevo ya está confirmado: el antiguo sobra
+            if os.path.abspath(source_path) != os.path.abspath(target_path):
+                os.remove(source_path)
+            adopted += 1
+        return adopted
+
+    def remove_file(self, file_name):
+        """Borrar un archivo subido junto con sus variantes (acepta rutas antiguas completas)"""
+        file_name = upload_layout.stored_name(file_name)
+        for name in [file_name] + derivative_names(file_name):
+            full_path = self.resolve(name)
+            if full_path:
+                os.remove(full_path)
+
+
+@event.listens_for(Session, 'after_commit')
+def _remove_released_blobs(session):
+    for storage, sha256, file_name in session.info.pop('released_blobs', ()):
+        try:
+            storage._remove_file(sha256, file_name)
+        except OSError as e:
+            print(f"Error eliminando archivo de evidencia {file_name}: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_released_blobs(session):
+    session.info.pop('released_blobs', None)
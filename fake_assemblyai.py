@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Servidor local que imita la API REST de AssemblyAI para pruebas.
+
+Implementa lo que usa la app: subida de audio, creación de la transcripción
+y consulta de su estado. Las transcripciones pasan por queued -> processing
+-> completed en `--delay` segundos. Si la petición trae `webhook_url`, al
+terminar se hace POST a esa URL con la cabecera de autenticación indicada,
+igual que el servicio real.
+
+En `--ws-port` imita además la API de streaming v3: envía Begin, un Turn
+parcial cada medio segundo de audio recibido y, al recibir Terminate, el
+turno final (sin formato y formateado) seguido de Termination.
+
+Uso:
+  python fake_assemblyai.py --port 8765 --ws-port 8766 --delay 2
+  ASSEMBLYAI_BASE_URL=http://127.0.0.1:8765 \
+  ASSEMBLYAI_STREAMING_URL=ws://127.0.0.1:8766/v3/ws \
+  ASSEMBLYAI_API_KEY=test python app.py
+
+El texto devuelto es `--text`, salvo que el audio subido empiece por
+`TEXT:`; entonces se usa lo que sigue (útil para probar la extracción de
+campos sin grabar audio real).
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from flask import Flask, jsonify, request
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import serve
+
+app = Flask(__name__)
+app.config['DELAY'] = 2.0
+app.config['TEXT'] = 'Mi nombre es Juan Pérez'
+
+_lock = threading.Lock()
+_uploads = {}
+_transcripts = {}
+
+
+def _authorized():
+    return bool(request.headers.get('authorization'))
+
+
+@app.route('/v2/upload', methods=['POST'])
+def upload():
+    if not _authorized():
+        return jsonify({'error': 'Authentication error, API token missing/invalid'}), 401
+    upload_id = uuid.uuid4().hex
+    with _lock:
+        _uploads[upload_id] = request.get_data()
+    return jsonify({'upload_url': f"{request.host_url}files/{upload_id}"})
+
+
+@app.route('/v2/transcript', methods=['POST'])
+def create_transcript():
+    if not _authorized():
+        return jsonify({'error': 'Authentication error, API token missing/invalid'}), 401
+    payload = request.get_json(silent=True) or {}
+    audio_url = payload.get('audio_url', '')
+    audio = _uploads.get(audio_url.rsplit('/', 1)[-1])
+    if audio is None:
+        return jsonify({'error': 'audio_url no válida'}), 400
+
+    transcript = {
+        'id': uuid.uuid4().hex,
+        'status': 'queued',
+        'audio_url': audio_url,
+        'language_code': payload.get('language_code'),
+        'created': time.time(),
+        'audio': audio,
+    }
+    for key in ('webhook_url', 'webhook_auth_header_name', 'webhook_auth_header_value'):
+        if payload.get(key):
+            transcript[key] = payload[key]
+    with _lock:
+        _transcripts[transcript['id']] = transcript
+    if transcript.get('webhook_url'):
+        timer = threading.Timer(app.config['DELAY'], _deliver_webhook, args=(transcript,))
+        timer.daemon = True
+        timer.start()
+    return jsonify(_public(transcript))
+
+
+@app.route('/v2/transcript/<transcript_id>')
+def get_transcript(transcript_id):
+    if not _authorized():
+        return jsonify({'error': 'Authentication error, API token missing/invalid'}), 401
+    transcript = _transcripts.get(transcript_id)
+    if transcript is None:
+        return jsonify({'error': 'Transcript not found'}), 404
+    _advance(transcript)
+    return jsonify(_public(transcript))
+
+
+def _deliver_webhook(transcript):
+    _advance(transcript)
+    headers = {}
+    if transcript.get('webhook_auth_header_name'):
+        headers[transcript['webhook_auth_header_name']] = transcript.get('webhook_auth_header_value', '')
+    try:
+        response = requests.post(
+            transcript['webhook_url'],
+            json={'transcript_id': transcript['id'], 'status': transcript['status']},
+            headers=headers,
+            timeout=10
+        )
+        print(f"📨 Webhook {transcript['id']} -> {response.status_code}")
+    except requests.RequestException as e:
+        print(f"❌ Webhook {transcript['id']} falló: {e}")
+
+
+def _advance(transcript):
+    elapsed = time.time() - transcript['created']
+    delay = app.config['DELAY']
+    audio = transcript['audio']
+    if transcript['status'] in ('completed', 'error'):
+        return
+    if elapsed < delay * 0.3:
+        transcript['status'] = 'queued'
+    elif elapsed < delay:
+        transcript['status'] = 'processing'
+    elif not audio:
+        transcript['status'] = 'error'
+        transcript['error'] = 'File does not appear to contain audio.'
+    else:
+        transcript['status'] = 'completed'
+        if audio.startswith(b'TEXT:'):
+            transcript['text'] = audio[5:].decode('utf-8', 'replace').strip()
+        else:
+            transcript['text'] = app.config['TEXT']
+        transcript['confidence'] = 0.95
+        transcript['audio_duration'] = round(len(audio) / 32000, 2)  # PCM 16 kHz mono
+
+
+def _public(transcript):
+    hidden = ('audio', 'created', 'webhook_auth_header_value')
+    return {key: value for key, value in transcript.items() if key not in hidden}
+
+
+def streaming_session(connection):
+    """Sesión de streaming v3: parciales según llega el audio y final al terminar"""
+    if not connection.request.headers.get('Authorization'):
+        connection.close(code=1008, reason='Missing Authorization')
+        return
+    query = parse_qs(urlparse(connection.request.path).query)
+    sample_rate = int(query.get('sample_rate', ['16000'])[0])
+    format_turns = query.get('format_turns', ['false'])[0] == 'true'
+    words = app.config['TEXT'].split()
+    bytes_per_step = sample_rate  # medio segundo de PCM de 16 bits
+    received = 0
+
+    def turn(count, end_of_turn=False, formatted=False):
+        text = ' '.join(words[:count])
+        if not formatted:
+            text = text.lower().rstrip('.')
+        return json.dumps({
+            'type': 'Turn', 'turn_order': 0, 'transcript': text,
+            'end_of_turn': end_of_turn, 'turn_is_formatted': formatted,
+            'end_of_turn_confidence': 0.95 if end_of_turn else 0.5,
+        })
+
+    connection.send(json.dumps({'type': 'Begin', 'id': uuid.uuid4().hex, 'expires_at': int(time.time()) + 600}))
+    try:
+        for message in connection:
+            if isinstance(message, bytes):
+                before = received // bytes_per_step
+                received += len(message)
+                if received // bytes_per_step > before:
+                    connection.send(turn(min(received // bytes_per_step, len(words))))
+            elif json.loads(message).get('type') == 'Terminate':
+                connection.send(turn(len(words), end_of_turn=True))
+                if format_turns:
+                    connection.send(turn(len(words), end_of_turn=True, formatted=True))
+                connection.send(json.dumps({
+                    'type': 'Termination',
+                    'audio_duration_seconds': round(received / (sample_rate * 2), 2),
+                }))
+                break
+    except ConnectionClosed:
+        pass
+
+
+def serve_streaming(host, port):
+    with serve(streaming_session, host, port) as server:
+        server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='AssemblyAI falso para pruebas locales')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--ws-port', type=int, default=None, help='Puerto del streaming (por defecto --port + 1)')
+    parser.add_argument('--delay', type=float, default=2.0, help='Segundos hasta completar cada transcripción')
+    parser.add_argument('--text', default=app.config['TEXT'], help='Texto devuelto por defecto')
+    args = parser.parse_args(argv)
+
+    app.config['DELAY'] = args.delay
+    app.config['TEXT'] = args.text
+    ws_port = args.ws_port or args.port + 1
+    threading.Thread(target=serve_streaming, args=(args.host, ws_port), daemon=True).start()
+    print(f"🎙️ Streaming falso en ws://{args.host}:{ws_port}/v3/ws")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Firmas de los formatos que aceptamos: (offset, bytes, tipo MIME)
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),
+    (8, b'WAVE', 'audio/wav'),
+    (0, b'\x1a\x45\xdf\xa3', 'audio/webm'),  # WebM/Matroska de MediaRecorder
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'fLaC', 'audio/flac'),
+]
+SNIFF_BYTES = 12
+
+# Contenedores ISO-BMFF (`....ftyp<marca>`): el tipo depende de la marca principal
+FTYP_BRANDS = {
+    b'M4A ': 'audio/mp4', b'M4B ': 'audio/mp4', b'M4P ': 'audio/mp4',
+    b'F4A ': 'audio/mp4', b'F4B ': 'audio/mp4',
+    b'heic': 'image/heic', b'heix': 'image/heic', b'heim': 'image/heic', b'heis': 'image/heic',
+    b'hevc': 'image/heic', b'hevx': 'image/heic', b'hevm': 'image/heic', b'hevs': 'image/heic',
+    b'mif1': 'image/heif', b'msf1': 'image/heif',
+    b'avif': 'image/avif', b'avis': 'image/avif',
+    b'qt  ': 'video/quicktime',
+}
+# Imágenes que Pillow abre sin plugins. HEIC/HEIF necesitan pillow-heif y AVIF
+# depende de cómo se compiló Pillow: se reconocen pero no cuentan como imagen
+DECODABLE_IMAGES = frozenset({'image/jpeg', 'image/png', 'image/gif', 'image/webp'})
+# El CSV no tiene firma: se acepta como tal si se declara así y parece texto
+CSV_TYPES = frozenset({'text/csv', 'application/csv'})
+# Marcas genéricas (isom, mp41, mp42, iso5...) que valen tanto para audio como
+# para vídeo: solo se aceptan como audio si el cliente lo declara así
+# (MediaRecorder de Safari sube audio/mp4 con estas marcas)
+GENERIC_FTYP = 'video/mp4'
+
+# Límite de tamaño por familia de tipo (bytes); se comprueba mientras llega el cuerpo
+DEFAULT_LIMITS = {
+    'image': 16 * 1024 * 1024,
+    'audio': 10 * 1024 * 1024,
+    'csv': 8 * 1024 * 1024,
+    'other': 1 * 1024 * 1024,
+}
+
+
+def sniff_content_type(head, declared_type=None, filename=None):
+    """Tipo MIME a partir de los primeros bytes, o None si no se reconoce.
+
+    `declared_type` (el Content-Type de la parte) solo desempata los MP4
+    genéricos y, junto con `filename`, identifica los CSV; nunca convierte
+    en imagen o audio algo que no lo parece.
+    """
+    declared_type = (declared_type or '').split(';', 1)[0].strip().lower()
+    for offset, signature, content_type in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return content_type
+    if head[4:8] == b'ftyp':
+        content_type = FTYP_BRANDS.get(bytes(head[8:12]))
+        if content_type:
+            return content_type
+        if declared_type in ('audio/mp4', 'audio/x-m4a', 'audio/aac'):
+            return 'audio/mp4'
+        return GENERIC_FTYP
+    if len(head) >= 2 and head[0] == 0xff and head[1] & 0xe0 == 0xe0:
+        return 'audio/mpeg'  # MP3 sin cabecera ID3
+    declared_csv = declared_type in CSV_TYPES or (filename or '').lower().endswith('.csv')
+    if declared_csv and b'\x00' not in head:
+        return 'text/csv'
+    return None
+
+
+class IngestSpool:
+    """Archivo temporal en el que Werkzeug vuelca cada parte subida.
+
+    Calcula el SHA-256 y detecta el tipo a medida que llegan los bloques, de
+    modo que el cuerpo nunca se guarda entero en memoria, y corta la subida en
+    cuanto supera el límite de su tipo. `commit()` lo mueve a su destino
+    con un rename atómico; si nadie lo hace, `close()` lo borra.
+    """
+
+    def __init__(self, directory, limits, filename=None, declared_type=None):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self._limits = limits
+        self.filename = filename
+        self.declared_type = declared_type
+        self.content_type = None
+        self.size = 0
+        self.committed = False
+
+    @property
+    def kind(self):
+        """Familia del tipo detectado: 'image', 'audio', 'csv' u 'other'"""
+        if self.content_type in DECODABLE_IMAGES:
+            return 'image'
+        if self.content_type == 'text/csv':
+            return 'csv'
+        if self.content_type and self.content_type.startswith('audio/'):
+            return 'audio'
+        return 'other'
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def write(self, data):
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self.content_type = sniff_content_type(self._head, self.declared_type, self.filename)
+        self.size += len(data)
+        sniffed = len(self._head) >= SNIFF_BYTES
+        limit = self._limits.get(self.kind) if sniffed else None
+        if limit is not None and self.size > limit:
+            self.discard()
+            raise RequestEntityTooLarge()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def seek(self, offset, whence=0):
+        if self.content_type is None and self._head:
+            # Archivos más cortos que la firma
+            self.content_type = sniff_content_type(self._head, self.declared_type, self.filename)
+        return self._file.seek(offset, whence)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readline(self, size=-1):
+        return self._file.readline(size)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def commit(self, final_path):
+        """Mover el temporal a su ruta definitiva (rename atómico)"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.makedirs(os.path.dirname(final_path) or '.', exist_ok=True)
+        os.replace(self.path, final_path)
+        self.committed = True
+
+    def detach(self):
+        """Quedarse con el temporal tal cual: lo borra quien lo recibe"""
+        self._file.flush()
+        self._file.close()
+        self.committed = True
+        return self.path
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        self.discard()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+class IngestRequest(Request):
+    """Request de Flask que vuelca las subidas a disco con IngestSpool"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        directory = config.get('INGEST_TEMP_FOLDER') or config['UPLOAD_FOLDER']
+        spool = IngestSpool(directory, config.get('INGEST_LIMITS', DEFAULT_LIMITS), filename=filename,
+                            declared_type=content_type)
+        self.__dict__.setdefault('_ingest_spools', []).append(spool)
+        return spool
+
+    def close(self):
+        super().close()
+        # Incluye los temporales de una subida abortada a medias
+        for spool in self.__dict__.pop('_ingest_spools', ()):
+            spool.discard()
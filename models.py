@@ -2,6 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from sqlalchemy.schema import CreateColumn, CreateIndex
 import os
 
 db = SQLAlchemy()
@@ -42,6 +43,18 @@ class User(UserMixin, db.Model):
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
 
+def _prefix_search_index(column):
+    """Index on lower(column) usable by `lower(column) LIKE 'prefix%'`"""
+    label = f'{column.key}_lower'
+    return db.Index(f'ix_user_{label}', db.func.lower(column).label(label),
+                    postgresql_ops={label: 'text_pattern_ops'})
+
+# Prefix search indexes for the admin user directory
+_prefix_search_index(User.username)
+_prefix_search_index(User.email)
+_prefix_search_index(User.first_name)
+_prefix_search_index(User.last_name)
+
 class Department(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), unique=True, nullable=False)
@@ -54,6 +67,26 @@ class Position(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class Shift(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('department.id'))  # NULL = any department
+    position_id = db.Column(db.Integer, db.ForeignKey('position.id'))  # NULL = any position
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time)
+    grace_minutes = db.Column(db.Integer, nullable=False, default=0)
+    weekdays = db.Column(db.String(7), nullable=False, default='1111100')  # Mon..Sun, '1' = working day
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationships
+    department = db.relationship('Department', backref=db.backref('shifts', lazy=True))
+    position = db.relationship('Position', backref=db.backref('shifts', lazy=True))
+
+    def works_on(self, day):
+        """Whether this shift is scheduled on the given date"""
+        return self.weekdays[day.weekday()] == '1'
+
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -82,6 +115,16 @@ class Evidence(db.Model):
     title = db.Column(db.String(128))
     content = db.Column(db.Text)  # For notes and checklist data
     file_path = db.Column(db.String(256))  # For uploaded files
+    content_hash = db.Column(db.String(64), db.ForeignKey('evidence_blob.sha256'), index=True)  # NULL for legacy uploads
+    derivatives = db.Column(db.Text)  # JSON {size: {format: file name}} filled in by the derivative pipeline
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EvidenceBlob(db.Model):
+    """Content-addressed uploaded file, shared by every Evidence with the same bytes"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    file_name = db.Column(db.String(256), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class SystemLog(db.Model):
@@ -109,6 +152,40 @@ class SystemLog(db.Model):
         except:
             db.session.rollback()
 
+# Columns added to existing tables after their first release. create_all()
+# only creates missing tables, so upgrade_schema() adds these by hand
+ADDED_COLUMNS = {
+    'evidence': ['content_hash', 'derivatives'],
+}
+
+def upgrade_schema():
+    """Bring a database created by an older version up to the current models.
+
+    Idempotent: adds the missing columns in ADDED_COLUMNS and creates every
+    index declared on the models that the database lacks (create_all() only
+    creates indexes together with new tables). Call it after db.create_all().
+    """
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as connection:
+        preparer = connection.dialect.identifier_preparer
+        for table_name, column_names in ADDED_COLUMNS.items():
+            table = db.metadata.tables[table_name]
+            existing = {column['name'] for column in inspector.get_columns(table_name)}
+            for name in column_names:
+                if name in existing:
+                    continue
+                column = table.c[name]
+                ddl = str(CreateColumn(column).compile(dialect=connection.dialect))
+                for fk in column.foreign_keys:
+                    ddl += f' REFERENCES {preparer.quote(fk.column.table.name)} ({preparer.quote(fk.column.name)})'
+                connection.execute(db.text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}'))
+                print(f"✅ Columna {table_name}.{name} añadida")
+        # IF NOT EXISTS en la propia base: el inspector de SQLite no ve los
+        # índices sobre expresiones como lower(username)
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
 # Migration function to import existing CSV data
 def migrate_csv_data(csv_file='asistencia_registros.csv'):
     """Migrate existing CSV data to database"""
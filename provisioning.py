@@ -0,0 +1,151 @@
+import csv
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from models import db, User
+from refdata import department_cache, position_cache
+
+REQUIRED_COLUMNS = ['username', 'email', 'password', 'first_name', 'last_name']
+VALID_ROLES = {'admin', 'manager', 'employee'}
+
+
+def _validate_rows(reader):
+    """Separar filas válidas de las inválidas, sin tocar la base de datos"""
+    report = []
+    valid = []
+    seen_usernames = set()
+    seen_emails = set()
+
+    for row_number, row in enumerate(reader, start=2):  # la fila 1 es la cabecera
+        row = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        entry = {'row': row_number, 'username': row.get('username', ''), 'status': 'error'}
+        report.append(entry)
+
+        missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+        role = row.get('role') or 'employee'
+        if missing:
+            entry['error'] = f"Campos obligatorios vacíos: {', '.join(missing)}"
+        elif role not in VALID_ROLES:
+            entry['error'] = f"Rol inválido: {role}"
+        elif row['username'] in seen_usernames:
+            entry['error'] = 'Nombre de usuario repetido en el archivo'
+        elif row['email'] in seen_emails:
+            entry['error'] = 'Correo electrónico repetido en el archivo'
+        else:
+            row['role'] = role
+            seen_usernames.add(row['username'])
+            seen_emails.add(row['email'])
+            valid.append((entry, row))
+
+    return report, valid
+
+
+def _existing_identities(valid):
+    """Usernames y correos ya registrados, en una sola consulta"""
+    if not valid:
+        return set(), set()
+    usernames = [row['username'] for _, row in valid]
+    emails = [row['email'] for _, row in valid]
+    existing = db.session.execute(
+        select(User.username, User.email).where(
+            or_(User.username.in_(usernames), User.email.in_(emails))
+        )
+    ).all()
+    return {username for username, _ in existing}, {email for _, email in existing}
+
+
+def _hash_passwords(passwords, workers=None):
+    """Calcular los hashes pbkdf2 en paralelo en un pool de procesos"""
+    if len(passwords) < 2:
+        return [generate_password_hash(password) for password in passwords]
+    # 'spawn' evita heredar los hilos (cámara, gunicorn) del proceso padre
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        chunksize = max(1, len(passwords) // ((workers or multiprocessing.cpu_count()) * 4))
+        return list(executor.map(generate_password_hash, passwords, chunksize=chunksize))
+
+
+def _insert_batch(batch):
+    """Insertar un lote en una transacción; si choca, reintentar fila a fila"""
+    try:
+        db.session.execute(insert(User), [values for _, values in batch])
+        db.session.commit()
+        for entry, _ in batch:
+            entry['status'] = 'created'
+        return
+    except IntegrityError:
+        db.session.rollback()
+
+    # Algún usuario se creó en paralelo: aislar la fila conflictiva
+    for entry, values in batch:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(User), [values])
+            entry['status'] = 'created'
+        except IntegrityError:
+            entry['error'] = 'El usuario o el correo ya existen'
+    db.session.commit()
+
+
+def provision_users(csv_file, batch_size=500, workers=None):
+    """Crear usuarios en lote a partir de un CSV.
+
+    Columnas: username, email, password, first_name, last_name y,
+    opcionalmente, role, department y position (por nombre).
+    Devuelve un informe con el resultado de cada fila.
+    """
+    if isinstance(csv_file, bytes):
+        csv_file = csv_file.decode('utf-8-sig')
+    if isinstance(csv_file, str):
+        csv_file = io.StringIO(csv_file)
+
+    report, valid = _validate_rows(csv.DictReader(csv_file))
+
+    existing_usernames, existing_emails = _existing_identities(valid)
+    pending = []
+    for entry, row in valid:
+        if row['username'] in existing_usernames:
+            entry['error'] = 'El nombre de usuario ya existe'
+        elif row['email'] in existing_emails:
+            entry['error'] = 'El correo electrónico ya está registrado'
+        else:
+            pending.append((entry, row))
+
+    hashes = _hash_passwords([row['password'] for _, row in pending], workers=workers)
+
+    now = datetime.utcnow()
+    to_insert = []
+    for (entry, row), password_hash in zip(pending, hashes):
+        to_insert.append((entry, {
+            'username': row['username'],
+            'email': row['email'],
+            'password_hash': password_hash,
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'role': row['role'],
+            'department_id': department_cache.get_or_create(row['department']) if row.get('department') else None,
+            'position_id': position_cache.get_or_create(row['position']) if row.get('position') else None,
+            'is_active': True,
+            'created_at': now,
+            'updated_at': now,
+        }))
+
+    # Confirmar los departamentos/posiciones nuevos antes de los lotes,
+    # para que un rollback de lote no los arrastre
+    db.session.commit()
+
+    for start in range(0, len(to_insert), batch_size):
+        _insert_batch(to_insert[start:start + batch_size])
+
+    return {
+        'total': len(report),
+        'created': sum(1 for entry in report if entry['status'] == 'created'),
+        'failed': sum(1 for entry in report if entry['status'] != 'created'),
+        'rows': report,
+    }
@@ -0,0 +1,140 @@
+import json
+import threading
+from urllib.parse import urlencode
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+STREAMING_URL = 'wss://streaming.assemblyai.com/v3/ws'
+SAMPLE_RATE = 16000  # PCM 16 bits mono, lo que envía el navegador
+
+
+class StreamingSession:
+    """Una conexión con la API de streaming (v3) de AssemblyAI.
+
+    `events()` traduce los mensajes del proveedor a eventos sencillos:
+    begin, partial (texto provisional del turno), final (turno cerrado y
+    formateado), end y error.
+    """
+
+    def __init__(self, connection, format_turns=True):
+        self._connection = connection
+        self.format_turns = format_turns
+        self._send_lock = threading.Lock()
+
+    def send_audio(self, chunk):
+        with self._send_lock:
+            self._connection.send(chunk)
+
+    def terminate(self):
+        """Pedir al proveedor que cierre la sesión tras procesar el audio pendiente"""
+        try:
+            with self._send_lock:
+                self._connection.send(json.dumps({'type': 'Terminate'}))
+        except ConnectionClosed:
+            pass
+
+    def events(self):
+        try:
+            for raw in self._connection:
+                message = json.loads(raw)
+                kind = message.get('type')
+                if kind == 'Begin':
+                    yield {'type': 'begin', 'session_id': message.get('id')}
+                elif kind == 'Turn':
+                    closed = message.get('end_of_turn') and (
+                        message.get('turn_is_formatted') or not self.format_turns
+                    )
+                    yield {
+                        'type': 'final' if closed else 'partial',
+                        'text': message.get('transcript', ''),
+                        'confidence': message.get('end_of_turn_confidence', 1.0),
+                    }
+                elif kind == 'Termination':
+                    yield {'type': 'end', 'duration': message.get('audio_duration_seconds', 0)}
+                    return
+                elif 'error' in message:
+                    yield {'type': 'error', 'error': message['error']}
+                    return
+        except ConnectionClosed as e:
+            if e.rcvd is None or e.rcvd.code != 1000:
+                reason = e.rcvd.reason if e.rcvd and e.rcvd.reason else 'Conexión de streaming cerrada'
+                yield {'type': 'error', 'error': reason}
+
+    def close(self):
+        self._connection.close()
+
+
+class StreamingTranscriber:
+    """Abre sesiones de streaming; la URL es configurable para probar contra fake_assemblyai.py.
+
+    Con `breaker` (el mismo CircuitBreaker que las llamadas REST) cada
+    conexión cuenta como éxito o fallo y, con el circuito abierto, `connect`
+    lanza ServiceUnavailable sin intentarlo.
+    """
+
+    def __init__(self, api_key, url=None, sample_rate=SAMPLE_RATE, params=None, breaker=None):
+        self.api_key = api_key
+        self.url = url or STREAMING_URL
+        self.sample_rate = sample_rate
+        self.params = params or {}
+        self.breaker = breaker
+
+    def connect(self):
+        query = {
+            'sample_rate': self.sample_rate,
+            'encoding': 'pcm_s16le',
+            'format_turns': 'true',
+        }
+        query.update(self.params)
+        if self.breaker is not None:
+            self.breaker.check()
+        try:
+            connection = connect(
+                f"{self.url}?{urlencode(query)}",
+                additional_headers={'Authorization': self.api_key},
+                open_timeout=10
+            )
+        except Exception:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success()
+        return StreamingSession(connection)
+
+
+def relay(browser, session, on_final):
+    """Reenviar el audio del navegador al proveedor y devolverle los eventos.
+
+    `browser` es el WebSocket de flask-sock: mensajes binarios con PCM y un
+    texto `{"type": "stop"}` al terminar. Cada evento final pasa por
+    `on_final`, que lo convierte en campo/valor para el formulario.
+    """
+    def pump_audio():
+        try:
+            while True:
+                message = browser.receive()
+                if message is None:
+                    break
+                if isinstance(message, (bytes, bytearray)):
+                    session.send_audio(bytes(message))
+                elif json.loads(message).get('type') == 'stop':
+                    break
+        except Exception:
+            pass  # El navegador se desconectó
+        finally:
+            session.terminate()
+
+    threading.Thread(target=pump_audio, daemon=True, name='realtime-audio').start()
+    try:
+        for event in session.events():
+            if event['type'] == 'final':
+                if not event['text'].strip():
+                    continue
+                event = on_final(event)
+            browser.send(json.dumps(event))
+    except Exception:
+        pass  # El navegador cerró mientras se enviaban eventos
+    finally:
+        session.close()
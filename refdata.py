@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from cache_sync import SharedVersion
+from models import db, Department, Position
+
+# Fila de catálogo reducida a lo que usan las vistas y plantillas
+RefSnapshot = namedtuple('RefSnapshot', ['id', 'name'])
+
+
+class ReferenceCache:
+    """Caché write-through de nombre <-> id para tablas de catálogo.
+
+    Las altas nuevas se hacen con un upsert sobre la restricción UNIQUE de
+    `name`, así dos peticiones concurrentes con el mismo nombre no chocan.
+    Los cambios se publican en la caché solo cuando la transacción confirma,
+    y a los demás workers a través de `version` (ver cache_sync).
+    """
+
+    def __init__(self, model, ttl=300):
+        self.model = model
+        self.ttl = ttl
+        self.version = SharedVersion(f'refdata:{model.__tablename__}')
+        self._maps = None
+        self._maps_version = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        """Par (nombre -> id, id -> nombre) vigente.
+
+        Los diccionarios publicados no se modifican nunca (se sustituyen), así
+        que quien los obtiene puede usarlos aunque otro hilo invalide la caché.
+        """
+        version = self.version.current()
+        maps = self._maps
+        if maps is not None and self._fresh(version):
+            return maps
+        with self._lock:
+            if self._maps is not None and self._fresh(version):
+                return self._maps
+            rows = db.session.execute(select(self.model.id, self.model.name)).all()
+            self._maps = ({name: row_id for row_id, name in rows},
+                          {row_id: name for row_id, name in rows})
+            self._maps_version = version
+            self._loaded_at = time.monotonic()
+            return self._maps
+
+    def _fresh(self, version):
+        return self._maps_version == version and time.monotonic() - self._loaded_at < self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._maps = None
+
+    def all(self):
+        """Lista de RefSnapshot ordenada por nombre"""
+        _, by_id = self._ensure_loaded()
+        return sorted((RefSnapshot(row_id, name) for row_id, name in by_id.items()),
+                      key=lambda ref: ref.name)
+
+    def get_id(self, name):
+        by_name, _ = self._ensure_loaded()
+        return by_name.get(name)
+
+    def get_name(self, row_id):
+        _, by_id = self._ensure_loaded()
+        return by_id.get(row_id)
+
+    def get_or_create(self, name):
+        """Id de la fila con ese nombre, creándola si no existe"""
+        row_id = self.get_id(name)
+        if row_id is not None:
+            return row_id
+
+        table = self.model.__table__
+        values = {'name': name, 'created_at': datetime.utcnow()}
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            stmt = postgresql.insert(table).values(**values).on_conflict_do_nothing(index_elements=['name'])
+            db.session.execute(stmt)
+        elif dialect == 'sqlite':
+            stmt = sqlite.insert(table).values(**values).on_conflict_do_nothing(index_elements=['name'])
+            db.session.execute(stmt)
+        else:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(**values))
+            except IntegrityError:
+                pass  # Otra transacción la creó primero
+
+        row_id = db.session.execute(select(self.model.id).where(self.model.name == name)).scalar_one()
+        db.session.info.setdefault('pending_refs', []).append((self, name, row_id))
+        return row_id
+
+    def _publish(self, name, row_id):
+        with self._lock:
+            if self._maps is not None:
+                by_name, by_id = self._maps
+                self._maps = ({**by_name, name: row_id}, {**by_id, row_id: name})
+
+
+department_cache = ReferenceCache(Department)
+position_cache = ReferenceCache(Position)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_pending_refs(session):
+    for cache, name, row_id in session.info.pop('pending_refs', ()):
+        cache._publish(name, row_id)
+        cache.version.bump()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_refs(session):
+    session.info.pop('pending_refs', None)
+
+
+@event.listens_for(Department, 'after_insert')
+@event.listens_for(Department, 'after_update')
+@event.listens_for(Department, 'after_delete')
+def _invalidate_departments(mapper, connection, target):
+    department_cache.invalidate()
+    department_cache.version.bump_on_commit(object_session(target))
+
+
+@event.listens_for(Position, 'after_insert')
+@event.listens_for(Position, 'after_update')
+@event.listens_for(Position, 'after_delete')
+def _invalidate_positions(mapper, connection, target):
+    position_cache.invalidate()
+    position_cache.version.bump_on_commit(object_session(target))
@@ -0,0 +1,129 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy import and_, event, insert, literal, or_, select
+from sqlalchemy.orm import object_session
+
+from cache_sync import SharedVersion
+from models import db, User, Shift, Attendance
+
+
+class ShiftSchedule:
+    """Índice en memoria de turnos por (departamento, posición).
+
+    Cada clave apunta a una tupla de 7 elementos (lunes..domingo) con el
+    minuto límite de llegada de ese día, o None si no se trabaja. Así
+    clasificar un check-in es un par de búsquedas en diccionario. Un cambio
+    de turnos confirmado en otro worker cambia `version` (ver cache_sync) y
+    el índice se recompila.
+    """
+
+    def __init__(self):
+        self._index = None  # (versión, índice)
+        self.version = SharedVersion('shifts')
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Descartar el índice compilado (se recompila en el próximo uso)"""
+        with self._lock:
+            self._index = None
+
+    def _compile(self):
+        index = {}
+        for shift in Shift.query.filter_by(is_active=True).all():
+            deadline = shift.start_time.hour * 60 + shift.start_time.minute + (shift.grace_minutes or 0)
+            days = index.setdefault((shift.department_id, shift.position_id), [None] * 7)
+            for weekday, flag in enumerate(shift.weekdays or ''):
+                if flag == '1':
+                    # Si hay dos turnos para la misma clave y día, manda el más temprano
+                    days[weekday] = deadline if days[weekday] is None else min(days[weekday], deadline)
+        return {key: tuple(days) for key, days in index.items()}
+
+    def _get_index(self):
+        version = self.version.current()
+        compiled = self._index
+        if compiled is None or compiled[0] != version:
+            with self._lock:
+                if self._index is None or self._index[0] != version:
+                    self._index = (version, self._compile())
+                compiled = self._index
+        return compiled[1]
+
+    def resolve(self, department_id, position_id):
+        """Turno aplicable, del más específico al más general"""
+        index = self._get_index()
+        for key in ((department_id, position_id), (department_id, None),
+                    (None, position_id), (None, None)):
+            days = index.get(key)
+            if days is not None:
+                return days
+        return None
+
+    def deadline_for(self, department_id, position_id, day):
+        """Minuto del día hasta el que la llegada no es tardía (None si no hay turno)"""
+        days = self.resolve(department_id, position_id)
+        return days[day.weekday()] if days else None
+
+    def classify(self, department_id, position_id, check_in):
+        """Estado de asistencia ('present' o 'late') para una hora de llegada"""
+        deadline = self.deadline_for(department_id, position_id, check_in.date())
+        if deadline is None:
+            return 'present'
+        minute = check_in.hour * 60 + check_in.minute
+        return 'late' if minute > deadline else 'present'
+
+    def mark_absences(self, day):
+        """Marcar como ausentes a los usuarios con turno en `day` sin registro.
+
+        Devuelve el número de filas insertadas. La escritura es una única
+        sentencia INSERT ... SELECT, sin recorrer usuarios uno por uno.
+        """
+        pairs = db.session.execute(
+            select(User.department_id, User.position_id).where(User.is_active.is_(True)).distinct()
+        ).all()
+        scheduled = [(dept, pos) for dept, pos in pairs
+                     if self.deadline_for(dept, pos, day) is not None]
+        if not scheduled:
+            return 0
+
+        # tuple_ IN no admite NULL, así que cada par se compara con IS
+        conditions = [
+            and_(User.department_id.is_(dept) if dept is None else User.department_id == dept,
+                 User.position_id.is_(pos) if pos is None else User.position_id == pos)
+            for dept, pos in scheduled
+        ]
+        already_registered = select(Attendance.id).where(
+            Attendance.user_id == User.id,
+            Attendance.date == day,
+        ).exists()
+
+        now = datetime.utcnow()
+        rows = select(
+            User.id,
+            literal(day, Attendance.date.type),
+            literal('absent'),
+            literal(now, Attendance.created_at.type),
+            literal(now, Attendance.updated_at.type),
+        ).where(
+            User.is_active.is_(True),
+            or_(*conditions),
+            ~already_registered,
+        )
+        result = db.session.execute(
+            insert(Attendance).from_select(
+                ['user_id', 'date', 'status', 'created_at', 'updated_at'], rows
+            )
+        )
+        db.session.commit()
+        return result.rowcount
+
+
+shift_schedule = ShiftSchedule()
+
+
+@event.listens_for(Shift, 'after_insert')
+@event.listens_for(Shift, 'after_update')
+@event.listens_for(Shift, 'after_delete')
+def _invalidate_schedule(mapper, connection, target):
+    shift_schedule.invalidate()
+    shift_schedule.version.bump_on_commit(object_session(target))
@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class MemoryStore:
+    """Almacén clave -> dict en memoria del proceso (desarrollo, un solo worker)"""
+
+    def __init__(self, ttl=43200):
+        self.ttl = ttl
+        self._entries = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                self._entries.pop(key, None)
+                return default
+            return json.loads(entry[1])
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def update(self, key, changes, defaults=None):
+        """Mezclar `changes` en el valor actual (o en `defaults`) y devolver el resultado"""
+        with self._lock:
+            entry = self._entries.get(key)
+            current = json.loads(entry[1]) if entry and entry[0] > time.time() else dict(defaults or {})
+            current.update(changes)
+            self._store(key, current, None)
+            return current
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _store(self, key, value, ttl):
+        now = time.time()
+        # Se guarda serializado, igual que los otros backends: nada de objetos compartidos
+        self._entries[key] = (now + (ttl or self.ttl), json.dumps(value))
+        if len(self._entries) % 256 == 0:
+            for stale in [k for k, (expires_at, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[stale]
+
+
+class SQLiteStore:
+    """Almacén compartido por todos los procesos de la máquina a través de un archivo SQLite.
+
+    En modo WAL las lecturas no bloquean y `update` es atómico
+    (BEGIN IMMEDIATE), así que varios workers de gunicorn ven el mismo
+    estado. Con la ruta en /dev/shm el archivo vive en memoria compartida.
+    """
+
+    def __init__(self, path, ttl=43200):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def _connection(self):
+        # Una conexión por hilo y por proceso (los workers se crean con fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        row = self._connection().execute(
+            'SELECT value FROM state WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl=None):
+        self._write(self._connection(), key, value, ttl)
+
+    def update(self, key, changes, defaults=None):
+        """Mezclar `changes` en el valor actual (o en `defaults`) y devolver el resultado"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM state WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+            current = json.loads(row[0]) if row else dict(defaults or {})
+            current.update(changes)
+            self._write(conn, key, current, None)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return current
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM state WHERE key = ?', (key,))
+
+    def _write(self, conn, key, value, ttl):
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), now + (ttl or self.ttl))
+        )
+        self._writes += 1
+        if self._writes % 256 == 0:
+            conn.execute('DELETE FROM state WHERE expires_at <= ?', (now,))
+
+
+class KeyValueStore:
+    """Almacén sobre un cliente clave-valor externo con la interfaz de redis-py
+    (`get`, `set(..., ex=)`, `delete`): Redis, Valkey, KeyDB...
+
+    `update` lee y reescribe sin transacción; basta porque cada kiosco es un
+    solo navegador haciendo peticiones de una en una.
+    """
+
+    def __init__(self, client, prefix='asistencia:', ttl=43200):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else default
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=int(ttl or self.ttl))
+
+    def update(self, key, changes, defaults=None):
+        current = self.get(key)
+        if current is None:
+            current = dict(defaults or {})
+        current.update(changes)
+        self.set(key, current)
+        return current
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def create_store(backend='memory', path=None, url=None, ttl=43200):
+    """Backend según configuración: memory, sqlite (`path`) o redis (`url`)"""
+    if backend == 'memory':
+        return MemoryStore(ttl=ttl)
+    if backend == 'sqlite':
+        return SQLiteStore(path or 'instance/state.db', ttl=ttl)
+    if backend == 'redis':
+        import redis  # Opcional: pip install redis
+        return KeyValueStore(redis.Redis.from_url(url), ttl=ttl)
+    raise ValueError(f'Backend de estado desconocido: {backend}')
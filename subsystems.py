@@ -0,0 +1,40 @@
+import threading
+import time
+
+# Milisegundos que costó cada fase del arranque y cada subsistema (ver /api/system_status)
+startup_timings = {}
+
+
+def record_timing(name, started):
+    """Anotar lo que tardó `name` desde `started` (time.perf_counter())"""
+    startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return startup_timings[name]
+
+
+class LazySubsystem:
+    """Componente caro (cámara, OpenCV, cliente de transcripción...) creado al primer uso.
+
+    `factory` se llama una sola vez, aunque lleguen varias peticiones a la
+    vez, y su duración queda en `startup_timings`.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started = time.perf_counter()
+                    instance = self._factory()
+                    elapsed = record_timing(self.name, started)
+                    print(f"⚙️ Subsistema '{self.name}' listo en {elapsed} ms")
+                    self._instance = instance
+        return self._instance
@@ -0,0 +1,116 @@
+import os
+import time
+
+import pytest
+
+import check_db
+from app import create_app
+from check_db import Reconciler
+from models import db, Evidence
+from upload_layout import TEMP_PREFIX, sharded_path
+
+REFERENCED = 'a' * 64 + '.jpg'
+LOST = 'b' * 64 + '.jpg'
+UNREFERENCED = 'c' * 64 + '.jpg'
+LEGACY = '1_2_1700000000_foto.jpg'
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x')
+    return path
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    """Base con tres evidencias con archivo (una perdida) y una carpeta con huérfanos"""
+    database = tmp_path / 'app.db'
+    folder = str(tmp_path / 'uploads')
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+                      'UPLOAD_FOLDER': folder})
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Evidence(id=1, attendance_id=1, type='photo', file_path=REFERENCED),
+            Evidence(id=2, attendance_id=1, type='photo', file_path=f'uploads/{LEGACY}'),
+            Evidence(id=3, attendance_id=1, type='photo', file_path=LOST),
+            Evidence(id=4, attendance_id=1, type='note', content='sin archivo'),
+        ])
+        db.session.commit()
+        db.session.remove()
+    touch(sharded_path(folder, REFERENCED))
+    touch(sharded_path(folder, 'a' * 64 + '.thumb.webp'))  # Variante de una evidencia viva
+    touch(os.path.join(folder, LEGACY))  # Plano antiguo
+    touch(sharded_path(folder, UNREFERENCED))
+    touch(sharded_path(folder, 'c' * 64 + '.display.jpeg'))
+    touch(os.path.join(folder, f'{TEMP_PREFIX}abandonado'))
+    return f'sqlite:///{database}', folder
+
+
+def reconcile(database_url, folder, snapshot_time, temp_max_age=3600):
+    reconciler = Reconciler(database_url, folder, chunk_size=2, temp_max_age=temp_max_age)
+    reconciler.load_database()
+    reconciler.load_disk(snapshot_time)
+    return reconciler
+
+
+def test_orphans_and_missing_files(uploads):
+    reconciler = reconcile(*uploads, snapshot_time=time.time() + 1)
+    try:
+        orphans = [os.path.basename(rel_path) for (rel_path,) in reconciler.orphan_files()]
+        assert sorted(orphans) == sorted([UNREFERENCED, 'c' * 64 + '.display.jpeg'])
+        assert list(reconciler.missing_files()) == [(3, LOST)]
+    finally:
+        reconciler.close()
+
+
+def test_stale_temp_files_are_orphans_and_recent_ones_are_not(uploads):
+    reconciler = reconcile(*uploads, snapshot_time=time.time() + 100, temp_max_age=50)
+    try:
+        orphans = {os.path.basename(rel_path) for (rel_path,) in reconciler.orphan_files()}
+        assert f'{TEMP_PREFIX}abandonado' in orphans
+    finally:
+        reconciler.close()
+
+
+def test_files_written_after_the_snapshot_are_ignored(uploads):
+    reconciler = reconcile(*uploads, snapshot_time=time.time() - 100)
+    try:
+        assert list(reconciler.orphan_files()) == []
+        # Sin archivos anteriores a la lectura, todas las evidencias parecen perdidas
+        assert [evidence_id for evidence_id, _ in reconciler.missing_files()] == [1, 2, 3]
+    finally:
+        reconciler.close()
+
+
+def test_apply_quarantines_but_keeps_recently_committed_stems(uploads, tmp_path):
+    reconciler = reconcile(*uploads, snapshot_time=time.time() + 1)
+    folder = uploads[1]
+    try:
+        orphans = [rel_path for (rel_path,) in reconciler.orphan_files()]
+        quarantine = str(tmp_path / 'cuarentena')
+        # La evidencia se confirmó después del volcado: no se toca
+        assert reconciler.apply(orphans, quarantine=quarantine, keep_stems={'c' * 64}) == 0
+        assert reconciler.apply(orphans, quarantine=quarantine) == 2
+        for rel_path in orphans:
+            assert not os.path.exists(os.path.join(folder, rel_path))
+            assert os.path.exists(os.path.join(quarantine, rel_path))
+        # Lo que ya no está se salta sin error
+        assert reconciler.apply(orphans, delete=True) == 0
+    finally:
+        reconciler.close()
+
+
+def test_cli_deletes_orphans_and_reports(uploads, capsys, monkeypatch):
+    database_url, folder = uploads
+    # Los archivos de prueba se acaban de escribir: que cuenten como anteriores al volcado
+    monkeypatch.setattr(check_db.time, 'time', lambda: 4102444800.0)  # 2100-01-01
+    assert check_db.main(['--database-url', database_url, '--upload-folder', folder,
+                          '--delete', '--temp-max-age', '60']) == 0
+    output = capsys.readouterr().out
+    assert f'MISSING evidence=3 {LOST}' in output
+    assert '3 archivos huérfanos detectados, 3 borrados, 1 archivos perdidos' in output
+    assert not os.path.exists(sharded_path(folder, UNREFERENCED))
+    assert os.path.exists(sharded_path(folder, REFERENCED))
+    assert os.path.exists(os.path.join(folder, LEGACY))
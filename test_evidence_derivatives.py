@@ -0,0 +1,41 @@
+import io
+import os
+import time
+
+from PIL import Image
+
+import upload_layout
+from evidence_derivatives import DerivativePipeline, derivative_name
+
+
+def write_photo(upload_folder, file_name):
+    path = upload_layout.sharded_path(upload_folder, file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (10, 120, 200)).save(buffer, 'JPEG')
+    with open(path, 'wb') as f:
+        f.write(buffer.getvalue())
+
+
+def test_pipeline_replaces_a_broken_process_pool(app):
+    file_name = 'a' * 64 + '.jpg'
+    write_photo(app.config['UPLOAD_FOLDER'], file_name)
+    pipeline = DerivativePipeline(workers=1)
+    pipeline.init_app(app)
+    try:
+        broken = pipeline._get_executor()
+        broken.submit(abs, 1).result()
+        # Un proceso del pool muere (p. ej. por falta de memoria)
+        for process in list(broken._processes.values()):
+            process.kill()
+        deadline = time.time() + 30
+        while not broken._broken and time.time() < deadline:
+            time.sleep(0.05)
+        assert broken._broken
+
+        recompressed, derivatives = pipeline.submit(1, file_name).result(timeout=60)
+        assert pipeline._executor is not broken
+        assert recompressed is None
+        assert derivatives['thumb']['jpeg'] == derivative_name(file_name, 'thumb', 'jpeg')
+    finally:
+        pipeline.shutdown()
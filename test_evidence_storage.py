@@ -0,0 +1,174 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+
+from app import create_app, create_tables
+from conftest import login
+from models import db, Attendance, Evidence, EvidenceBlob
+
+# Tabla `evidence` tal como la creaba la primera versión
+BASELINE_EVIDENCE = """
+CREATE TABLE evidence (
+    id INTEGER NOT NULL PRIMARY KEY,
+    attendance_id INTEGER NOT NULL,
+    type VARCHAR(20) NOT NULL,
+    title VARCHAR(128),
+    content TEXT,
+    file_path VARCHAR(256),
+    created_at DATETIME
+)
+"""
+
+
+def test_create_tables_upgrades_baseline_database(tmp_path):
+    database = tmp_path / 'old.db'
+    upload_folder = tmp_path / 'uploads'
+    upload_folder.mkdir()
+    photo = b'legacy photo bytes'
+    (upload_folder / '1_1_1700000000_foto.JPG').write_bytes(photo)
+    (upload_folder / '1_2_1700000001_copia.jpg').write_bytes(photo)
+    with sqlite3.connect(database) as connection:
+        connection.execute(BASELINE_EVIDENCE)
+        connection.execute("INSERT INTO evidence (id, attendance_id, type, file_path) "
+                           "VALUES (1, 1, 'photo', 'uploads/1_1_1700000000_foto.JPG')")
+        connection.execute("INSERT INTO evidence (id, attendance_id, type, file_path) "
+                           "VALUES (2, 2, 'photo', '1_2_1700000001_copia.jpg')")
+        connection.execute("INSERT INTO evidence (id, attendance_id, type, content) VALUES (3, 1, 'note', 'hola')")
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+                      'UPLOAD_FOLDER': str(upload_folder)})
+    assert create_tables(app)
+    # Idempotente: una segunda ejecución no falla ni duplica referencias
+    assert create_tables(app)
+
+    sha256 = hashlib.sha256(photo).hexdigest()
+    with app.app_context():
+        evidences = {evidence.id: evidence for evidence in Evidence.query.all()}
+        assert evidences[1].content_hash == evidences[2].content_hash == sha256
+        assert evidences[1].file_path == f'{sha256}.jpg'
+        assert evidences[3].content_hash is None
+        assert evidences[1].derivatives is None
+        blob = db.session.get(EvidenceBlob, sha256)
+        assert blob.ref_count == 2
+        storage = app.extensions['asistencia'].evidence_storage
+        assert storage.resolve(blob.file_name)
+        indexes = {index['name'] for index in db.inspect(db.engine).get_indexes('evidence')}
+        assert 'ix_evidence_content_hash' in indexes
+        db.session.remove()
+    assert not os.path.exists(upload_folder / '1_1_1700000000_foto.JPG')
+    assert not os.path.exists(upload_folder / '1_2_1700000001_copia.jpg')
+
+
+def jpeg_bytes(color=(200, 30, 30)):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def test_upload_succeeds_when_derivatives_cannot_be_queued(app, make_user, monkeypatch):
+    user = make_user('ana')
+    attendance = Attendance(user_id=user.id, date=date.today(), check_in_time=datetime.now())
+    db.session.add(attendance)
+    db.session.commit()
+    pipeline = app.extensions['asistencia'].derivative_pipeline
+
+    def broken_submit(evidence_id, file_name):
+        raise RuntimeError('pool caído')
+    monkeypatch.setattr(pipeline, 'submit', broken_submit)
+
+    client = login(app.test_client(), 'ana')
+    response = client.post('/api/evidence/upload', data={
+        'attendance_id': attendance.id, 'type': 'photo', 'file': (io.BytesIO(jpeg_bytes()), 'foto.jpg')
+    })
+    assert response.get_json()['success'] is True
+    evidence = Evidence.query.one()
+    assert app.extensions['asistencia'].evidence_storage.resolve(evidence.file_path)
+
+
+def store_bytes(storage, data, filename='foto.jpg'):
+    from werkzeug.datastructures import FileStorage
+
+    return storage.store(FileStorage(io.BytesIO(data), filename=filename))
+
+
+def test_last_release_removes_the_file_and_the_blob(app):
+    storage = app.extensions['asistencia'].evidence_storage
+    blob = store_bytes(storage, b'contenido')
+    db.session.commit()
+    sha256, path = blob.sha256, storage.resolve(blob.file_name)
+    assert path
+
+    storage.release(sha256)
+    db.session.commit()
+    assert not os.path.exists(path)
+    assert db.session.get(EvidenceBlob, sha256) is None
+
+    # Volver a subirlo después escribe de nuevo el archivo
+    blob = store_bytes(storage, b'contenido')
+    db.session.commit()
+    assert storage.resolve(blob.file_name)
+
+
+def test_reupload_before_cleanup_keeps_the_file(app):
+    storage = app.extensions['asistencia'].evidence_storage
+    blob = store_bytes(storage, b'contenido')
+    db.session.commit()
+    storage.release(blob.sha256)
+    # El borrado pendiente aún no ha corrido cuando llega la misma foto
+    pending = db.session.info.pop('released_blobs')
+    db.session.commit()
+    store_bytes(storage, b'contenido')
+    db.session.commit()
+
+    for owner, sha256, file_name in pending:
+        owner._remove_file(sha256, file_name)
+    assert storage.resolve(blob.file_name)
+    assert db.session.get(EvidenceBlob, blob.sha256).ref_count == 1
+
+
+def test_cleanup_waits_for_a_concurrent_upload_of_the_same_content(tmp_path):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "t.db"}',
+                      'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'STATE_BACKEND': 'memory'})
+    storage = app.extensions['asistencia'].evidence_storage
+    with app.app_context():
+        db.create_all()
+        blob = store_bytes(storage, b'contenido')
+        db.session.commit()
+        storage.release(blob.sha256)
+        pending = db.session.info.pop('released_blobs')
+        db.session.commit()
+
+        # La subida ya tiene su referencia pero aún no ha confirmado
+        store_bytes(storage, b'contenido')
+
+        def cleanup():
+            with app.app_context():
+                for owner, sha256, file_name in pending:
+                    owner._remove_file(sha256, file_name)
+        cleaner = threading.Thread(target=cleanup)
+        cleaner.start()
+        cleaner.join(0.3)
+        assert cleaner.is_alive()  # Bloqueado por la subida en curso
+        db.session.commit()
+        cleaner.join(5)
+        assert not cleaner.is_alive()
+        assert storage.resolve(blob.file_name)
+        assert db.session.get(EvidenceBlob, blob.sha256).ref_count == 1
+        db.session.remove()
+
+
+def test_discarded_file_without_blob_is_removed(app):
+    storage = app.extensions['asistencia'].evidence_storage
+    file_name = 'f' * 64 + '.jpg'
+    path = storage.path_for(file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'recomprimida')
+    storage._remove_file('f' * 64, file_name)
+    assert not os.path.exists(path)
+    assert db.session.get(EvidenceBlob, 'f' * 64) is None
@@ -0,0 +1,74 @@
+import io
+from datetime import date, datetime
+
+import pytest
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from conftest import login
+from ingest import DEFAULT_LIMITS, IngestSpool, sniff_content_type
+from models import db, Attendance
+
+HEIC_HEAD = b'\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic'
+
+
+def spool_with(tmp_path, data, **kwargs):
+    spool = IngestSpool(str(tmp_path), DEFAULT_LIMITS, **kwargs)
+    spool.write(data)
+    spool.seek(0)
+    return spool
+
+
+@pytest.mark.parametrize('head, content_type', [
+    (HEIC_HEAD, 'image/heic'),
+    (b'\x00\x00\x00\x18ftypmif1\x00\x00\x00\x00', 'image/heif'),
+])
+def test_heic_and_heif_are_not_images(tmp_path, head, content_type):
+    spool = spool_with(tmp_path, head)
+    assert spool.content_type == content_type
+    assert spool.kind == 'other'
+    spool.discard()
+
+
+def test_csv_is_recognised_by_declared_type_or_extension(tmp_path):
+    data = b'username,email,password,first_name,last_name\n'
+    assert sniff_content_type(data, 'text/csv') == 'text/csv'
+    assert sniff_content_type(data, 'application/vnd.ms-excel', 'usuarios.CSV') == 'text/csv'
+    assert sniff_content_type(data, 'text/plain', 'usuarios.txt') is None
+    # Binario con extensión .csv: no es texto
+    assert sniff_content_type(b'\x00\x01\x02\x03' * 4, None, 'usuarios.csv') is None
+    assert spool_with(tmp_path, b'a,b\n', filename='u.csv').kind == 'csv'
+
+
+def test_csv_has_its_own_limit(tmp_path):
+    big = b'username,email\n' + b'usuario,usuario@example.com\n' * 80000  # ~2 MB
+    assert DEFAULT_LIMITS['other'] < len(big) < DEFAULT_LIMITS['csv']
+    spool_with(tmp_path, big, filename='usuarios.csv').discard()
+    with pytest.raises(RequestEntityTooLarge):
+        spool_with(tmp_path, big, filename='usuarios.txt')
+
+
+def test_bulk_upload_accepts_csv_over_the_generic_limit(app, make_user):
+    make_user('jefa', role='admin')
+    client = login(app.test_client(), 'jefa')
+    rows = b'username,email,password,first_name,last_name\nana,ana@example.com,clave123,Ana,Ruiz\n'
+    rows += b'fila_incompleta_de_relleno_sin_datos,,,,\n' * 30000
+    assert len(rows) > DEFAULT_LIMITS['other']
+    response = client.post('/admin/users/bulk', data={'file': (io.BytesIO(rows), 'usuarios.csv')})
+    assert response.status_code == 200
+    assert response.get_json()['created'] == 1
+
+    png = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+    response = client.post('/admin/users/bulk', data={'file': (io.BytesIO(png), 'usuarios.csv')})
+    assert response.get_json() == {'success': False, 'error': 'El archivo no es un CSV válido'}
+
+
+def test_heic_photo_is_rejected_as_evidence(app, make_user):
+    user = make_user('ana')
+    attendance = Attendance(user_id=user.id, date=date.today(), check_in_time=datetime.now())
+    db.session.add(attendance)
+    db.session.commit()
+    client = login(app.test_client(), 'ana')
+    response = client.post('/api/evidence/upload', data={
+        'attendance_id': attendance.id, 'type': 'photo', 'file': (io.BytesIO(HEIC_HEAD * 4), 'foto.heic')
+    })
+    assert response.get_json() == {'success': False, 'error': 'El archivo no es una imagen válida'}
@@ -0,0 +1,47 @@
+import sqlite3
+
+from app import create_app, create_tables
+from models import db
+
+# Tabla `user` tal como la creaba la primera versión, sin índices de búsqueda
+BASELINE_USER = """
+CREATE TABLE user (
+    id INTEGER NOT NULL PRIMARY KEY,
+    username VARCHAR(64) NOT NULL UNIQUE,
+    email VARCHAR(120) NOT NULL UNIQUE,
+    password_hash VARCHAR(256),
+    role VARCHAR(20) NOT NULL,
+    first_name VARCHAR(64),
+    last_name VARCHAR(64),
+    department_id INTEGER,
+    position_id INTEGER,
+    phone VARCHAR(20),
+    is_active BOOLEAN,
+    created_at DATETIME,
+    updated_at DATETIME
+)
+"""
+
+
+def test_create_tables_adds_search_indexes_to_existing_user_table(tmp_path):
+    database = tmp_path / 'old.db'
+    with sqlite3.connect(database) as connection:
+        connection.execute(BASELINE_USER)
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+                      'UPLOAD_FOLDER': str(tmp_path / 'uploads')})
+    assert create_tables(app)
+    assert create_tables(app)
+
+    with app.app_context():
+        with db.engine.connect() as connection:
+            # El inspector de SQLite no lista los índices sobre expresiones
+            indexes = set(connection.execute(db.text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'user'"
+            )).scalars())
+            plan = connection.execute(db.text(
+                "EXPLAIN QUERY PLAN SELECT id FROM user WHERE lower(username) = 'ana'"
+            )).all()
+    assert {'ix_user_username_lower', 'ix_user_email_lower',
+            'ix_user_first_name_lower', 'ix_user_last_name_lower'} <= indexes
+    assert any('ix_user_username_lower' in row[-1] for row in plan)
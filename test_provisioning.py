@@ -0,0 +1,75 @@
+import provisioning
+from models import db, Department, Position, User
+from provisioning import provision_users
+
+HEADER = 'username,email,password,first_name,last_name,role,department,position\n'
+
+
+def statuses(result):
+    return {entry['row']: entry.get('error', entry['status']) for entry in result['rows']}
+
+
+def test_valid_rows_are_created_and_invalid_ones_reported(app, make_user):
+    make_user('existente')
+    csv_text = HEADER + (
+        'ana,ana@example.com,clave1,Ana,Ruiz,manager,Ventas,Cajera\n'
+        'luis,luis@example.com,clave2,Luis,Soto,,Ventas,\n'
+        ',sin@example.com,clave,Sin,Nombre,,,\n'
+        'eva,eva@example.com,clave,Eva,Paz,jefa,,\n'
+        'ana,otra@example.com,clave,Ana,Bis,,,\n'
+        'otro,ana@example.com,clave,Otro,Bis,,,\n'
+        'existente,nuevo@example.com,clave,Ya,Existe,,,\n'
+        'nuevo,existente@example.com,clave,Correo,Usado,,,\n'
+    )
+    result = provision_users(csv_text.encode('utf-8-sig'), workers=2)
+
+    assert statuses(result) == {
+        2: 'created',
+        3: 'created',
+        4: 'Campos obligatorios vacíos: username',
+        5: 'Rol inválido: jefa',
+        6: 'Nombre de usuario repetido en el archivo',
+        7: 'Correo electrónico repetido en el archivo',
+        8: 'El nombre de usuario ya existe',
+        9: 'El correo electrónico ya está registrado',
+    }
+    assert (result['total'], result['created'], result['failed']) == (8, 2, 6)
+
+    ana = User.query.filter_by(username='ana').one()
+    luis = User.query.filter_by(username='luis').one()
+    assert ana.role == 'manager' and luis.role == 'employee'
+    assert ana.check_password('clave1') and luis.check_password('clave2')
+    # Departamento compartido creado una sola vez; posición solo si viene
+    assert Department.query.count() == 1 and ana.department_id == luis.department_id
+    assert ana.position_id == Position.query.filter_by(name='Cajera').one().id
+    assert luis.position_id is None
+
+
+def test_conflicting_batch_falls_back_to_row_by_row(app, make_user, monkeypatch):
+    make_user('carla')
+    # Simula que `carla` se creó en paralelo después de la comprobación previa
+    monkeypatch.setattr(provisioning, '_existing_identities', lambda valid: (set(), set()))
+    csv_text = HEADER + (
+        'ana,ana@example.com,clave,Ana,Ruiz,,Ventas,\n'
+        'carla,carla2@example.com,clave,Carla,Gil,,Ventas,\n'
+        'luis,luis@example.com,clave,Luis,Soto,,,\n'
+    )
+    result = provision_users(csv_text, batch_size=2, workers=1)
+
+    assert statuses(result) == {2: 'created', 3: 'El usuario o el correo ya existen', 4: 'created'}
+    assert {user.username for user in User.query} == {'ana', 'carla', 'luis'}
+    assert User.query.filter_by(username='carla').one().email == 'carla@example.com'
+    # El rollback del lote no se llevó el departamento creado antes
+    assert Department.query.filter_by(name='Ventas').count() == 1
+
+
+def test_cli_reports_failed_rows(app, tmp_path):
+    path = tmp_path / 'usuarios.csv'
+    path.write_text(HEADER + 'ana,ana@example.com,clave,Ana,Ruiz,,,\nana,x@example.com,clave,A,B,,,\n',
+                    encoding='utf-8')
+    result = app.test_cli_runner().invoke(args=['provision-users', str(path)])
+    assert result.exit_code == 0, result.output
+    assert 'Fila 3 (ana): Nombre de usuario repetido en el archivo' in result.output
+    assert '1 usuarios creados, 1 con errores' in result.output
+    db.session.remove()
+    assert User.query.filter_by(username='ana').count() == 1
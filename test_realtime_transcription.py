@@ -0,0 +1,72 @@
+import json
+import queue
+
+from realtime_transcription import StreamingTranscriber, relay
+
+# Medio segundo de PCM de 16 bits a 16 kHz: el falso envía un parcial por bloque
+HALF_SECOND = b'\x00' * 16000
+
+
+class FakeBrowser:
+    """WebSocket de flask-sock: entrega `messages` y guarda lo que se le envía"""
+
+    def __init__(self, messages):
+        self._incoming = queue.Queue()
+        for message in messages:
+            self._incoming.put(message)
+        self.sent = []
+
+    def receive(self, timeout=None):
+        try:
+            return self._incoming.get(timeout=5)
+        except queue.Empty:
+            return None
+
+    def send(self, data):
+        self.sent.append(json.loads(data))
+
+
+def test_session_events_against_the_fake_api(fake_assemblyai):
+    session = StreamingTranscriber('test', url=fake_assemblyai.streaming_url).connect()
+    try:
+        for _ in range(3):
+            session.send_audio(HALF_SECOND)
+        session.terminate()
+        events = list(session.events())
+    finally:
+        session.close()
+
+    kinds = [event['type'] for event in events]
+    assert kinds[0] == 'begin'
+    assert kinds[-1] == 'end'
+    assert kinds.count('final') == 1
+    assert 'partial' in kinds
+    # Con format_turns solo cuenta como final el turno formateado
+    final = next(event for event in events if event['type'] == 'final')
+    assert final['text'] == fake_assemblyai.text
+    assert events[-1]['duration'] == 1.5
+
+
+def test_relay_forwards_audio_and_interprets_finals(fake_assemblyai):
+    session = StreamingTranscriber('test', url=fake_assemblyai.streaming_url).connect()
+    browser = FakeBrowser([HALF_SECOND, HALF_SECOND, json.dumps({'type': 'stop'})])
+
+    def on_final(event):
+        return {'type': 'final', 'field': 'nombre', 'value': event['text'].upper()}
+
+    relay(browser, session, on_final)
+
+    kinds = [event['type'] for event in browser.sent]
+    assert kinds[0] == 'begin' and kinds[-1] == 'end'
+    finals = [event for event in browser.sent if event['type'] == 'final']
+    assert finals == [{'type': 'final', 'field': 'nombre', 'value': fake_assemblyai.text.upper()}]
+    assert all(event['text'] for event in browser.sent if event['type'] == 'partial')
+
+
+def test_rejected_connection_reports_an_error(fake_assemblyai):
+    session = StreamingTranscriber('', url=fake_assemblyai.streaming_url).connect()
+    try:
+        events = list(session.events())
+    finally:
+        session.close()
+    assert events == [{'type': 'error', 'error': 'Missing Authorization'}]
@@ -0,0 +1,63 @@
+from datetime import date, datetime, timedelta
+
+from app import AttendanceManager
+from conftest import login
+from models import db, Attendance
+
+
+def add_attendance(user, day, check_in=None, status='present'):
+    attendance = Attendance(user_id=user.id, date=day, status=status,
+                            check_in_time=datetime.combine(day, check_in) if check_in else None)
+    db.session.add(attendance)
+    return attendance
+
+
+def test_records_are_paged_by_cursor(app, make_user):
+    admin = make_user('jefa', role='admin')
+    users = [make_user(f'empleado{i}') for i in range(3)]
+    today = date.today()
+    nine = datetime.strptime('09:00', '%H:%M').time()
+    for offset in range(4):
+        day = today - timedelta(days=offset)
+        # Misma hora de entrada para dos personas y una ausencia sin hora
+        add_attendance(users[0], day, nine)
+        add_attendance(users[1], day, nine)
+        add_attendance(users[2], day, status='absent')
+    db.session.commit()
+
+    client = login(app.test_client(), 'jefa')
+    pages, cursor = [], None
+    while True:
+        url = '/api/records?limit=5' + (f'&before={cursor}' if cursor else '')
+        data = client.get(url).get_json()
+        assert data['total'] <= 5
+        pages.append(data['records'])
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert sum(pages, []) == AttendanceManager.get_records(admin)
+    # Las ausencias van al final de cada día
+    first_day = [record['Estado'] for record in sum(pages, [])[:3]]
+    assert first_day == ['present', 'present', 'absent']
+
+
+def test_records_respect_permissions_and_default_page(app, make_user):
+    ana = make_user('ana')
+    otro = make_user('otro')
+    for offset in range(60):
+        add_attendance(ana, date.today() - timedelta(days=offset), datetime.now().time())
+    add_attendance(otro, date.today(), datetime.now().time())
+    db.session.commit()
+
+    client = login(app.test_client(), 'ana')
+    data = client.get('/api/records').get_json()
+    assert data['total'] == 50
+    assert {record['Correo'] for record in data['records']} == {'ana@example.com'}
+    rest = client.get(f"/api/records?before={data['next_cursor']}").get_json()
+    assert rest['total'] == 10 and rest['next_cursor'] is None
+
+    # La página de inicio incrusta la primera página con su cursor
+    page = client.get('/').get_data(as_text=True)
+    assert f'"next_cursor": {data["next_cursor"]}' in page
@@ -0,0 +1,72 @@
+from sqlalchemy import text
+
+from app import create_app
+from models import db, Department
+from refdata import RefSnapshot, department_cache, position_cache
+from state_store import create_store
+
+
+def test_get_or_create_reuses_existing_rows(app):
+    created = department_cache.get_or_create('Ventas')
+    db.session.commit()
+    assert department_cache.get_or_create('Ventas') == created
+    assert Department.query.count() == 1
+    assert department_cache.get_name(created) == 'Ventas'
+    assert position_cache.get_id('Ventas') is None
+
+
+def test_new_rows_are_published_only_on_commit(app):
+    assert department_cache.all() == []
+    department_cache.get_or_create('Ventas')
+    db.session.rollback()
+    assert department_cache.get_id('Ventas') is None
+
+    row_id = department_cache.get_or_create('Ventas')
+    db.session.commit()
+    assert department_cache.all() == [RefSnapshot(row_id, 'Ventas')]
+
+
+def test_row_created_concurrently_is_not_inserted_twice(app):
+    assert department_cache.get_id('Ventas') is None  # Catálogo ya cargado, sin la fila
+    # Otra petición la crea sin pasar por esta caché
+    with db.engine.begin() as connection:
+        connection.execute(text("INSERT INTO department (name) VALUES ('Ventas')"))
+    row_id = department_cache.get_or_create('Ventas')
+    db.session.commit()
+    assert Department.query.one().id == row_id
+
+
+def test_rename_and_delete_invalidate_the_catalog(app):
+    sales = Department(name='Ventas')
+    db.session.add(sales)
+    db.session.commit()
+    assert department_cache.get_id('Ventas') == sales.id
+
+    sales.name = 'Comercial'
+    db.session.commit()
+    assert department_cache.get_id('Ventas') is None
+    assert department_cache.get_name(sales.id) == 'Comercial'
+
+    db.session.delete(sales)
+    db.session.commit()
+    assert department_cache.all() == []
+
+
+def test_row_created_by_another_worker_is_seen(tmp_path):
+    state_path = str(tmp_path / 'state.db')
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                      'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                      'STATE_BACKEND': 'sqlite', 'STATE_PATH': state_path,
+                      'CACHE_SYNC_INTERVAL': 0})
+    department_cache.invalidate()
+    with app.app_context():
+        db.create_all()
+        assert department_cache.all() == []
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO department (name) VALUES ('Ventas')"))
+        assert department_cache.get_id('Ventas') is None  # Aún no se ha publicado
+
+        create_store('sqlite', path=state_path).set(department_cache.version.key, 'otro-worker', ttl=60)
+        assert department_cache.get_id('Ventas') is not None
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,84 @@
+from datetime import date, datetime, time, timedelta
+
+from models import db, Attendance, Department, Position, Shift
+from schedule import shift_schedule
+
+MONDAY = date(2026, 10, 19)
+SATURDAY = MONDAY + timedelta(days=5)
+
+
+def add_shift(start, grace=0, department=None, position=None, weekdays='1111100', is_active=True):
+    shift = Shift(name='Turno', start_time=start, grace_minutes=grace, weekdays=weekdays, is_active=is_active,
+                  department_id=department.id if department else None,
+                  position_id=position.id if position else None)
+    db.session.add(shift)
+    db.session.commit()
+    return shift
+
+
+def at(day, hour, minute, second=0):
+    return datetime.combine(day, time(hour, minute, second))
+
+
+def catalog(name):
+    department, position = Department(name=name), Position(name=name)
+    db.session.add_all([department, position])
+    db.session.commit()
+    return department, position
+
+
+def test_classify_late_after_the_grace_minute(app):
+    sales, _ = catalog('Ventas')
+    add_shift(time(9, 0), grace=10, department=sales)
+
+    assert shift_schedule.classify(sales.id, None, at(MONDAY, 9, 10)) == 'present'
+    # Dentro del minuto límite todavía no es tarde
+    assert shift_schedule.classify(sales.id, None, at(MONDAY, 9, 10, 59)) == 'present'
+    assert shift_schedule.classify(sales.id, None, at(MONDAY, 9, 11)) == 'late'
+    # Sábado sin turno, u otro departamento sin turno: nunca tarde
+    assert shift_schedule.classify(sales.id, None, at(SATURDAY, 12, 0)) == 'present'
+    assert shift_schedule.classify(None, None, at(MONDAY, 12, 0)) == 'present'
+
+
+def test_most_specific_shift_wins(app):
+    sales, cashier = catalog('Ventas')
+    add_shift(time(8, 0))  # General
+    add_shift(time(9, 0), department=sales)
+    add_shift(time(10, 0), department=sales, position=cashier)
+    add_shift(time(7, 0), department=sales, weekdays='1111111', is_active=False)
+
+    assert shift_schedule.classify(sales.id, cashier.id, at(MONDAY, 9, 30)) == 'present'
+    assert shift_schedule.classify(sales.id, None, at(MONDAY, 9, 30)) == 'late'
+    assert shift_schedule.classify(None, None, at(MONDAY, 8, 30)) == 'late'
+
+
+def test_schedule_is_recompiled_after_shift_changes(app):
+    shift = add_shift(time(9, 0))
+    assert shift_schedule.classify(None, None, at(MONDAY, 9, 30)) == 'late'
+    shift.start_time = time(10, 0)
+    db.session.commit()
+    assert shift_schedule.classify(None, None, at(MONDAY, 9, 30)) == 'present'
+    db.session.delete(shift)
+    db.session.commit()
+    assert shift_schedule.classify(None, None, at(MONDAY, 11, 0)) == 'present'
+
+
+def test_mark_absences_only_once_for_scheduled_users_without_record(app, make_user):
+    sales, _ = catalog('Ventas')
+    warehouse, _ = catalog('Almacén')
+    add_shift(time(9, 0), department=sales)
+    present = make_user('presente', department_id=sales.id)
+    missing = make_user('ausente', department_id=sales.id)
+    make_user('inactivo', department_id=sales.id, is_active=False)
+    make_user('sin_turno', department_id=warehouse.id)
+    db.session.add(Attendance(user_id=present.id, date=MONDAY, check_in_time=at(MONDAY, 9, 5), status='present'))
+    db.session.commit()
+
+    assert shift_schedule.mark_absences(MONDAY) == 1
+    absences = Attendance.query.filter_by(date=MONDAY, status='absent').all()
+    assert [absence.user_id for absence in absences] == [missing.id]
+    # Volver a ejecutarlo no duplica ausencias
+    assert shift_schedule.mark_absences(MONDAY) == 0
+    assert Attendance.query.filter_by(date=MONDAY).count() == 2
+    # Sin turno ese día no hay ausencias
+    assert shift_schedule.mark_absences(SATURDAY) == 0
@@ -0,0 +1,56 @@
+from flask import Flask, jsonify
+
+from app import create_app
+from circuit_breaker import CircuitBreaker
+from conftest import serve_app
+from transcription import SimpleTranscriber, TranscriptionService
+from transport import HttpTransport, default_transport
+
+
+def flaky_api():
+    """AssemblyAI caído para subidas pero que sigue respondiendo a las consultas"""
+    api = Flask(__name__)
+
+    @api.post('/v2/upload')
+    def upload():
+        return jsonify({'error': 'saturado'}), 503
+
+    @api.get('/v2/transcript/<transcript_id>')
+    def status(transcript_id):
+        return jsonify({'id': transcript_id, 'status': 'processing'})
+
+    return api
+
+
+def test_each_service_has_its_own_breaker_and_transport(tmp_path):
+    def service():
+        app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                          'TRANSCRIPTION_CACHE_PATH': str(tmp_path / 'cache.db')})
+        return TranscriptionService(app.config)
+
+    first, second = service(), service()
+    assert first.client.transport is not default_transport
+    assert first.client.transport.breaker is first.breaker
+    assert second.client.transport.breaker is second.breaker
+    assert first.breaker is not second.breaker
+    assert default_transport.breaker is None
+
+
+def test_status_polls_do_not_dilute_upload_failures(tmp_path):
+    server, base_url = serve_app(flaky_api())
+    try:
+        breaker = CircuitBreaker('AssemblyAI', min_calls=3, failure_rate=0.5)
+        client = SimpleTranscriber('test', base_url=base_url, preprocess=False,
+                                   transport=HttpTransport(retries=0, breaker=breaker))
+        audio = tmp_path / 'a.wav'
+        audio.write_bytes(b'RIFF')
+        for _ in range(3):
+            assert 'error' in client.start_transcription(str(audio))
+            # Los trabajos ya enviados siguen consultando su estado con normalidad
+            for _ in range(10):
+                assert client.check_transcription('tr-1') is None
+        assert breaker.state == breaker.OPEN
+        # Con el circuito abierto las consultas de estado siguen pasando
+        assert client.check_transcription('tr-1') is None
+    finally:
+        server.shutdown()
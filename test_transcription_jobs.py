@@ -0,0 +1,155 @@
+import io
+import time
+
+from app import create_app
+from circuit_breaker import ConcurrencyLimiter
+from conftest import serve_app
+from transcription import SimpleTranscriber, VoiceFormManager
+from transcription_jobs import TranscriptionQueue
+from transport import HttpTransport
+
+
+class StubTranscriber:
+    """Transcriptor sin red: cada audio termina en la primera consulta con `result`"""
+
+    def __init__(self, result):
+        self.result = result
+
+    def start_transcription(self, audio_path):
+        return {'transcript_id': f'tr-{audio_path.rsplit("/", 1)[-1]}'}
+
+    def check_transcription(self, transcript_id):
+        return self.result
+
+
+class EchoVoiceManager:
+    def interpret(self, result, field):
+        return dict(result, field=field)
+
+
+class LockedCache:
+    """Caché cuyo put falla como un SQLite compartido bloqueado"""
+
+    def get(self, key):
+        return None
+
+    def put(self, key, result, elapsed=0.0):
+        raise RuntimeError('database is locked')
+
+
+def wait_for(queue, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        state = queue.get(job_id)
+        if state['status'] in ('completed', 'error'):
+            return state
+        time.sleep(0.01)
+    raise AssertionError(f'{job_id} sigue en curso: {queue.get(job_id)}')
+
+
+def audio(tmp_path, name):
+    path = tmp_path / name
+    path.write_bytes(b'RIFF\0\0\0\0WAVE')
+    return str(path)
+
+
+def test_cache_failure_does_not_stop_the_poller(tmp_path):
+    limiter = ConcurrencyLimiter(1)
+    queue = TranscriptionQueue(StubTranscriber({'success': True, 'text': 'hola'}), EchoVoiceManager(),
+                               cache=LockedCache(), poll_interval=0.01, limiter=limiter)
+    first = queue.submit(audio(tmp_path, 'a.wav'), field='nombre', cache_key='a')
+    assert wait_for(queue, first.id)['text'] == 'hola'
+    assert limiter.in_flight == 0
+    # El hilo sigue vivo y la plaza quedó libre para el siguiente
+    second = queue.submit(audio(tmp_path, 'b.wav'), field='nombre', cache_key='b')
+    assert wait_for(queue, second.id)['status'] == 'completed'
+
+
+def test_unexpected_error_closes_the_job_and_frees_its_slot(tmp_path):
+    limiter = ConcurrencyLimiter(1)
+    transcriber = StubTranscriber(42)  # respuesta que no es un dict
+    queue = TranscriptionQueue(transcriber, EchoVoiceManager(), poll_interval=0.01, limiter=limiter)
+    job = queue.submit(audio(tmp_path, 'a.wav'))
+    state = wait_for(queue, job.id)
+    assert state['status'] == 'error'
+    assert limiter.in_flight == 0
+
+    transcriber.result = {'success': True, 'text': 'otra vez'}
+    job = queue.submit(audio(tmp_path, 'b.wav'))
+    assert wait_for(queue, job.id)['text'] == 'otra vez'
+
+
+def test_queue_transcribes_against_the_fake_api(fake_assemblyai, tmp_path):
+    client = SimpleTranscriber('test', base_url=fake_assemblyai.base_url, preprocess=False,
+                               transport=HttpTransport(retries=0))
+    queue = TranscriptionQueue(client, VoiceFormManager(client), poll_interval=0.05)
+    path = tmp_path / 'a.wav'
+    path.write_bytes(b'TEXT:mi nombre es juan perez')
+
+    job = queue.submit(str(path))
+    seen = set()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        state = queue.get(job.id)
+        seen.add(state['status'])
+        if state['status'] in ('completed', 'error'):
+            break
+        time.sleep(0.01)
+    assert state['status'] == 'completed', state
+    assert state['field'] == 'nombre'
+    assert state['value'] == 'Juan Perez'
+    assert 'processing' in seen
+    # La cola se queda con el audio y lo borra tras subirlo
+    assert not path.exists()
+
+
+def wav_bytes():
+    return b'RIFF\x24\x00\x00\x00WAVEfmt ' + b'\x00' * 64
+
+
+def test_webhook_received_by_another_worker_completes_the_job(fake_assemblyai, tmp_path):
+    # Dos apps con el mismo almacén compartido hacen de dos workers
+    def worker(webhook_url):
+        return create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+            'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+            'STATE_BACKEND': 'sqlite',
+            'STATE_PATH': str(tmp_path / 'state.db'),
+            'ASSEMBLYAI_API_KEY': 'test',
+            'ASSEMBLYAI_BASE_URL': fake_assemblyai.base_url,
+            'ASSEMBLYAI_WEBHOOK_URL': webhook_url,
+            'ASSEMBLYAI_WEBHOOK_SECRET': 'secreto-compartido',
+            'AUDIO_PREPROCESS': False,
+            # Sin el aviso, la primera consulta llegaría a los 30 s
+            'TRANSCRIBE_FALLBACK_POLL': 30,
+        })
+
+    receiver = worker('http://127.0.0.1/placeholder')
+    server, receiver_url = serve_app(receiver)
+    try:
+        webhook_url = f'{receiver_url}/api/assemblyai/webhook'
+        receiver.config['ASSEMBLYAI_WEBHOOK_URL'] = webhook_url
+        owner = worker(webhook_url)
+
+        forged = receiver.test_client().post('/api/assemblyai/webhook', json={'transcript_id': 'x'},
+                                             headers={'X-Webhook-Secret': 'otro'})
+        assert forged.status_code == 401
+
+        started = time.time()
+        client = owner.test_client()
+        response = client.post('/api/transcribe', data={'audio': (io.BytesIO(wav_bytes()), 'a.wav')})
+        assert response.status_code == 202, response.get_json()
+        status_url = response.get_json()['status_url']
+        deadline = started + 10
+        while time.time() < deadline:
+            state = client.get(status_url).get_json()
+            if state['status'] in ('completed', 'error'):
+                break
+            time.sleep(0.05)
+        # Terminado mucho antes de la primera consulta de respaldo: el aviso llegó
+        # al receptor, que no tiene el trabajo, y pasó al dueño por el almacén compartido
+        assert state['status'] == 'completed', state
+        assert state['original_text'] == fake_assemblyai.text.lower()
+    finally:
+        server.shutdown()
@@ -0,0 +1,86 @@
+from sqlalchemy import text
+
+from app import create_app
+from models import db, Department, User
+from state_store import create_store
+from user_cache import user_cache
+
+
+def test_snapshot_is_served_from_cache(app, make_user):
+    user = make_user('ana')
+    first = user_cache.get(user.id)
+    hits = user_cache.hits
+    assert user_cache.get(user.id) is first
+    assert user_cache.hits == hits + 1
+    assert first.full_name == 'Ana Prueba'
+    assert user_cache.get(999) is None
+
+
+def test_user_writes_invalidate_the_snapshot(app, make_user):
+    user = make_user('ana')
+    assert user_cache.get(user.id).role == 'employee'
+
+    user.role = 'manager'
+    db.session.commit()
+    assert user_cache.get(user.id).role == 'manager'
+
+    user.is_active = False
+    db.session.commit()
+    assert user_cache.get(user.id).is_active is False
+
+    user_id = user.id
+    db.session.delete(user)
+    db.session.commit()
+    assert user_cache.get(user_id) is None
+
+
+def test_department_rename_refreshes_every_snapshot(app, make_user):
+    sales = Department(name='Ventas')
+    db.session.add(sales)
+    db.session.commit()
+    ana = make_user('ana', department_id=sales.id)
+    luis = make_user('luis', department_id=sales.id)
+    assert user_cache.get(ana.id).department.name == 'Ventas'
+    assert user_cache.get(luis.id).department.name == 'Ventas'
+
+    sales.name = 'Comercial'
+    db.session.commit()
+    assert user_cache.get(ana.id).department.name == 'Comercial'
+    assert user_cache.get(luis.id).department.name == 'Comercial'
+
+
+def test_rolled_back_write_keeps_serving_committed_data(app, make_user):
+    user = make_user('ana')
+    user.first_name = 'Temporal'
+    db.session.flush()
+    db.session.rollback()
+    assert user_cache.get(user.id).first_name == 'Ana'
+
+
+def test_change_committed_by_another_worker_is_seen(tmp_path):
+    state_path = str(tmp_path / 'state.db')
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                      'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+                      'STATE_BACKEND': 'sqlite', 'STATE_PATH': state_path,
+                      'CACHE_SYNC_INTERVAL': 0})
+    user_cache.clear()
+    with app.app_context():
+        db.create_all()
+        user = User(username='ana', email='ana@example.com', first_name='Ana', last_name='Ruiz')
+        user.set_password('secreto')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        assert user_cache.get(user_id).role == 'employee'
+        db.session.remove()  # Fin de la petición
+
+        # Otro worker cambia el rol: sus eventos de ORM no se disparan en este proceso
+        with db.engine.begin() as connection:
+            connection.execute(text("UPDATE user SET role = 'admin' WHERE id = :id"), {'id': user_id})
+        assert user_cache.get(user_id).role == 'employee'  # Aún no se ha publicado
+
+        # ... y al confirmar publica una versión nueva en el almacén compartido
+        create_store('sqlite', path=state_path).set(user_cache.version.key, 'otro-worker', ttl=60)
+        assert user_cache.get(user_id).role == 'admin'
+        db.session.remove()
+        db.drop_all()
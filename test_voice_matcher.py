@@ -0,0 +1,79 @@
+import pytest
+
+from voice_matcher import VoiceMatcher, extract_email, extract_number, extract_phone, spoken_numbers
+
+
+@pytest.mark.parametrize('text, numbers', [
+    ('veinticinco', [25]),
+    ('treinta y dos', [32]),
+    ('noventa y ocho', [98]),
+    ('ciento veinte', [120]),
+    ('dos mil veinticuatro', [2024]),
+    ('tengo 41 años', [41]),
+    ('nueve ocho siete', [9, 8, 7]),
+    ('hola buenos días', []),
+])
+def test_spoken_numbers(text, numbers):
+    assert spoken_numbers(text) == numbers
+
+
+def test_extract_number_takes_the_first():
+    assert extract_number('diecinueve o veinte') == 19
+    assert extract_number('no sé') is None
+
+
+@pytest.mark.parametrize('text, phone', [
+    ('nueve ocho siete seis cinco cuatro tres dos uno', '987654321'),
+    ('987 654 321', '987654321'),
+    ('nueve 8 siete seis cinco 4 tres dos uno', '987654321'),
+    ('no tengo', None),
+])
+def test_extract_phone(text, phone):
+    assert extract_phone(text) == phone
+
+
+@pytest.mark.parametrize('text, email', [
+    ('juan punto perez arroba gmail punto com', 'juan.perez@gmail.com'),
+    ('MLopez Arroba Empresa Punto PE', 'mlopez@empresa.pe'),
+    ('ana guion bajo ruiz arroba correo punto com punto pe', 'ana_ruiz@correo.com.pe'),
+    ('jose guión lopez arroba mail punto com', 'jose-lopez@mail.com'),
+    ('ana.ruiz@example.com', 'ana.ruiz@example.com'),
+    ('juan en gmail', None),
+])
+def test_extract_email(text, email):
+    assert extract_email(text) == email
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('tengo veinticinco años', {'field': 'edad', 'value': '25', 'action': 'fill_field'}),
+    ('mi edad es treinta y dos', {'field': 'edad', 'value': '32', 'action': 'fill_field'}),
+    # El número va antes de la frase clave
+    ('41 años', {'field': 'edad', 'value': '41', 'action': 'fill_field'}),
+    ('mi número es nueve ocho siete seis cinco cuatro tres dos uno',
+     {'field': 'celular', 'value': '987654321', 'action': 'fill_field'}),
+    ('mi correo es mlopez arroba gmail punto com',
+     {'field': 'correo', 'value': 'mlopez@gmail.com', 'action': 'fill_field'}),
+    ('mi nombre es juan pérez', {'field': 'nombre', 'value': 'Juan Pérez', 'action': 'fill_field'}),
+])
+def test_match_extracts_typed_values(text, expected):
+    assert VoiceMatcher().match(text) == expected
+
+
+def test_detection_needs_whole_words_and_prefers_longer_phrases():
+    matcher = VoiceMatcher()
+    # "soy" dentro de "soyuz" y "mail" dentro de "mailing" no cuentan
+    assert matcher.detect_field('el soyuz despegó') is None
+    assert matcher.detect_field('la lista de mailing') is None
+    # "correo" (6) gana a "tengo" (5) aunque vaya después
+    assert matcher.detect_field('tengo un correo juan arroba gmail punto com')[0] == 'correo'
+    assert matcher.detect_field('mi nombre es ana') == ('nombre', 'mi nombre es', 'ana')
+    # Un comando manda sobre los campos
+    assert matcher.match('siguiente, mi nombre es ana') == {'action': 'next_field'}
+    assert matcher.detect_command('Volver ATRÁS') == 'previous_field'
+    assert matcher.match('hola buenos días')['action'] == 'unknown'
+
+
+def test_current_field_uses_its_extractor():
+    matcher = VoiceMatcher()
+    assert matcher.match('treinta y dos', current_field='edad') == {'field': 'edad', 'value': '32'}
+    assert matcher.match('ana ruiz', current_field='nombre') == {'field': 'nombre', 'value': 'Ana Ruiz'}
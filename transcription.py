@@ -0,0 +1,323 @@
+import hmac
+import os
+import time
+
+import requests
+
+from audio_preprocessing import preprocess_wav
+from circuit_breaker import CircuitBreaker, ConcurrencyLimiter
+from realtime_transcription import StreamingTranscriber
+from transcription_cache import TranscriptionCache, audio_digest
+from transcription_jobs import TranscriptionQueue
+from transport import API_TIMEOUT, UPLOAD_TIMEOUT, HttpTransport, StreamingBody, default_transport
+from voice_matcher import clean_text, default_matcher
+
+ASSEMBLYAI_BASE_URL = 'https://api.assemblyai.com'
+
+
+# Cliente AssemblyAI personalizado
+class SimpleTranscriber:
+    WEBHOOK_HEADER = 'X-Webhook-Secret'
+
+    def __init__(self, api_key=None, base_url=None, webhook_url=None, webhook_secret=None, transport=None,
+                 preprocess=True):
+        self.api_key = api_key
+        # WAV a mono 16 kHz sin silencios antes de subir (otros formatos van tal cual)
+        self.preprocess = preprocess
+        self.language_code = 'es'
+        # Sesión HTTP compartida: keep-alive y reintentos en 429/5xx
+        self.transport = transport or default_transport
+        # Configurable para poder probar contra fake_assemblyai.py
+        self.base_url = (base_url or ASSEMBLYAI_BASE_URL).rstrip('/')
+        # Con webhook AssemblyAI avisa al terminar y el polling queda de respaldo
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.enabled = bool(api_key and api_key != "tu_api_key_aqui")
+        print(f"🔧 AssemblyAI configurado: {self.enabled}")
+    
+    def verify_webhook(self, headers):
+        """Comprobar que la llamada al webhook trae nuestro secreto"""
+        received = headers.get(self.WEBHOOK_HEADER, '')
+        return bool(self.webhook_secret) and hmac.compare_digest(received, self.webhook_secret)
+    
+    def transcribe_audio(self, audio_source):
+        """Transcripción simple usando la API REST de AssemblyAI"""
+        started = self.start_transcription(audio_source)
+        if "error" in started:
+            return started
+        
+        # Polling para obtener resultado
+        return self.wait_for_transcription(started['transcript_id'])
+    
+    def start_transcription(self, audio_source):
+        """Subir el audio (ruta o stream) y solicitar la transcripción sin esperar el resultado"""
+        if not self.enabled:
+            return {"error": "AssemblyAI no configurado"}
+        
+        prepared_path = None
+        try:
+            if self.preprocess and isinstance(audio_source, (str, os.PathLike)):
+                prepared_path = preprocess_wav(audio_source)
+            
+            print("📤 Subiendo audio a AssemblyAI...")
+            
+            # Subir archivo por bloques, sin cargarlo entero en memoria
+            upload_response = self.transport.post(
+                f'{self.base_url}/v2/upload',
+                headers={'authorization': self.api_key},
+                data=StreamingBody(prepared_path or audio_source),
+                timeout=UPLOAD_TIMEOUT,
+                idempotent=True  # Repetir la subida solo deja un archivo sin usar
+            )
+                
+            if upload_response.status_code != 200:
+                error_msg = f"Error en upload ({upload_response.status_code}): {upload_response.text}"
+                print(f"❌ {error_msg}")
+                return {"error": error_msg}
+            
+            upload_url = upload_response.json()['upload_url']
+            print("✅ Audio subido correctamente")
+            
+            # Solicitar transcripción
+            transcript_response = self.transport.post(
+                f'{self.base_url}/v2/transcript',
+                headers={
+                    'authorization': self.api_key,
+                    'content-type': 'application/json'
+                },
+                json=self.transcript_request(upload_url),
+                timeout=API_TIMEOUT
+            )
+            
+            if transcript_response.status_code != 200:
+                error_msg = f"Error en transcripción ({transcript_response.status_code}): {transcript_response.text}"
+                print(f"❌ {error_msg}")
+                return {"error": error_msg}
+            
+            transcript_id = transcript_response.json()['id']
+            print(f"🆔 ID de transcripción: {transcript_id}")
+            return {'transcript_id': transcript_id}
+                
+        except requests.exceptions.Timeout:
+            error_msg = "Timeout en la conexión con AssemblyAI"
+            print(f"❌ {error_msg}")
+            return {"error": error_msg}
+        except Exception as e:
+            error_msg = f"Error en transcripción: {str(e)}"
+            print(f"❌ {error_msg}")
+            return {"error": error_msg}
+        finally:
+            if prepared_path and os.path.exists(prepared_path):
+                os.remove(prepared_path)
+    
+    def cache_options(self):
+        """Opciones que cambian el resultado (forman parte de la clave de caché)"""
+        return {'preprocess': self.preprocess}
+    
+    def transcript_request(self, upload_url):
+        """Cuerpo de la petición de transcripción (con webhook si está configurado)"""
+        payload = {
+            'audio_url': upload_url,
+            'language_code': self.language_code
+        }
+        if self.webhook_url:
+            payload.update({
+                'webhook_url': self.webhook_url,
+                'webhook_auth_header_name': self.WEBHOOK_HEADER,
+                'webhook_auth_header_value': self.webhook_secret
+            })
+        return payload
+    
+    def check_transcription(self, transcript_id):
+        """Consultar una vez el estado; None mientras siga en cola o procesando"""
+        polling_response = self.transport.get(
+            f'{self.base_url}/v2/transcript/{transcript_id}',
+            headers={'authorization': self.api_key},
+            timeout=API_TIMEOUT,
+            # El circuito mide subidas y creaciones; con él abierto los trabajos
+            # ya enviados pueden seguir consultando su estado
+            guarded=False
+        )
+        
+        if polling_response.status_code != 200:
+            return {"error": f"Error en polling: {polling_response.text}"}
+        
+        polling_result = polling_response.json()
+        status = polling_result['status']
+        
+        if status == 'completed':
+            print("✅ Transcripción completada")
+            return {
+                'success': True,
+                'text': polling_result['text'],
+                'confidence': polling_result.get('confidence', 1.0),
+                'duration': polling_result.get('audio_duration', 0)
+            }
+        elif status == 'error':
+            error_msg = polling_result.get('error', 'Error desconocido en transcripción')
+            print(f"❌ Error en transcripción: {error_msg}")
+            return {"error": error_msg}
+        return None
+    
+    def wait_for_transcription(self, transcript_id, timeout=60):
+        """Esperar a que la transcripción esté lista"""
+        start_time = time.time()
+        polling_interval = 2
+        
+        while time.time() - start_time < timeout:
+            try:
+                result = self.check_transcription(transcript_id)
+                if result is not None:
+                    return result
+                print("⏳ Procesando audio...")
+                
+                time.sleep(polling_interval)
+                polling_interval = min(polling_interval * 1.5, 5)  # Backoff exponencial
+                
+            except requests.exceptions.Timeout:
+                print("⏰ Timeout en polling, reintentando...")
+                time.sleep(polling_interval)
+            except Exception as e:
+                return {"error": f"Error en polling: {str(e)}"}
+        
+        return {"error": f"Timeout después de {timeout} segundos"}
+
+class VoiceFormManager:
+    def __init__(self, assemblyai_client, cache=None):
+        self.client = assemblyai_client
+        self.cache = cache
+        self.matcher = default_matcher
+    
+    def process_voice_input(self, audio_file_path, current_field=None, audio_hash=None):
+        """Procesar entrada de voz y extraer información relevante"""
+        if not self.client.enabled:
+            return {"error": "AssemblyAI no disponible"}
+        
+        # Un clip repetido (reintento del usuario) sale de la caché
+        cache_key = self.cache_key(audio_file_path, audio_hash)
+        result = self.cache.get(cache_key) if cache_key else None
+        if result is None:
+            # Transcribir audio
+            started = time.time()
+            result = self.client.transcribe_audio(audio_file_path)
+            if cache_key:
+                self.cache.put(cache_key, result, elapsed=time.time() - started)
+        return self.interpret(result, current_field)
+    
+    def cache_key(self, audio_file_path=None, audio_hash=None):
+        """Clave de caché del audio, o None si no hay caché"""
+        if self.cache is None:
+            return None
+        if audio_hash is None:
+            audio_hash = audio_digest(audio_file_path)
+        return self.cache.key_for(audio_hash, self.client.language_code, self.client.cache_options())
+    
+    def interpret(self, result, current_field=None):
+        """Convertir el resultado de una transcripción en campo/valor o comando"""
+        if "error" in result:
+            return result
+        
+        text = result["text"].lower().strip()
+        print(f"📝 Texto transcrito: {text}")
+        
+        # Comandos, campo y valor en una sola pasada del matcher precompilado
+        match = self.matcher.match(text, current_field)
+        if 'field' not in match:
+            return {'success': True, 'action': match['action']}
+        match.update({
+            'success': True,
+            'confidence': result.get('confidence', 1.0),
+            'original_text': text
+        })
+        return match
+    
+    def detect_commands(self, text):
+        """Detectar comandos de voz especiales"""
+        action = self.matcher.detect_command(text)
+        return {'success': True, 'action': action} if action else None
+    
+    def auto_detect_field(self, text, confidence):
+        """Detectar automáticamente el campo basado en palabras clave"""
+        match = self.matcher.match(text)
+        match.update({'success': True, 'confidence': confidence, 'original_text': text})
+        return match
+    
+    def clean_text(self, text):
+        """Limpiar y formatear texto"""
+        return clean_text(text)
+
+
+class TranscriptionService:
+    """Todo lo necesario para la entrada por voz, montado a partir de `app.config`.
+
+    La aplicación lo crea en la primera petición que lo usa: hasta entonces
+    no se cargan NumPy ni websockets ni se abre la caché en disco. `shared`
+    es el almacén de estado común a todos los workers.
+    """
+
+    def __init__(self, config, shared=None):
+        # Si AssemblyAI falla o va lento se deja de llamar durante un rato (fallo
+        # rápido con 503) en lugar de ocupar hilos que necesitan las entradas/salidas
+        self.breaker = CircuitBreaker(
+            'AssemblyAI',
+            window=config['ASSEMBLYAI_BREAKER_WINDOW'],
+            min_calls=config['ASSEMBLYAI_BREAKER_MIN_CALLS'],
+            failure_rate=config['ASSEMBLYAI_BREAKER_FAILURE_RATE'],
+            reset_timeout=config['ASSEMBLYAI_BREAKER_RESET']
+        )
+        # Transcripciones en cola a la vez, y sesiones en vivo (cada una ocupa un hilo de gunicorn)
+        self.limiter = ConcurrencyLimiter(config['TRANSCRIBE_MAX_IN_FLIGHT'])
+        self.realtime_limiter = ConcurrencyLimiter(config['REALTIME_MAX_SESSIONS'], name='sesiones de voz en vivo')
+
+        webhook_url = config['ASSEMBLYAI_WEBHOOK_URL']
+        self.client = SimpleTranscriber(
+            config['ASSEMBLYAI_API_KEY'],
+            base_url=config['ASSEMBLYAI_BASE_URL'],
+            preprocess=config['AUDIO_PREPROCESS'],
+            webhook_url=webhook_url,
+            webhook_secret=config['ASSEMBLYAI_WEBHOOK_SECRET'],
+            # Transporte propio: el circuito de esta app no toca el compartido del proceso
+            transport=HttpTransport(breaker=self.breaker)
+        )
+        self.cache = TranscriptionCache(
+            maxsize=config['TRANSCRIPTION_CACHE_SIZE'],
+            ttl=config['TRANSCRIPTION_CACHE_TTL'],
+            path=config['TRANSCRIPTION_CACHE_PATH']
+        )
+        self.voice_manager = VoiceFormManager(self.client, cache=self.cache)
+        self.streaming = StreamingTranscriber(
+            config['ASSEMBLYAI_API_KEY'],
+            url=config['ASSEMBLYAI_STREAMING_URL'],
+            params={'speech_model': config['ASSEMBLYAI_STREAMING_MODEL']},
+            breaker=self.breaker
+        )
+        fallback_poll = config['TRANSCRIBE_FALLBACK_POLL']
+        self.queue = TranscriptionQueue(
+            self.client, self.voice_manager, cache=self.cache,
+            upload_workers=config['TRANSCRIBE_UPLOAD_WORKERS'],
+            timeout=config['TRANSCRIBE_TIMEOUT'],
+            # Con webhook el polling es solo de respaldo, mucho más espaciado
+            poll_interval=fallback_poll if webhook_url else 1.0,
+            max_poll_interval=fallback_poll if webhook_url else 5.0,
+            breaker=self.breaker,
+            limiter=self.limiter,
+            shared=shared,
+            webhook=bool(webhook_url)
+        )
+
+    @property
+    def enabled(self):
+        return self.client.enabled
+
+    def realtime_available(self):
+        return self.client.enabled and self.breaker.state != CircuitBreaker.OPEN
+
+    def stats(self):
+        return {
+            'transcriptions_pending': self.queue.pending(),
+            'assemblyai_circuit': self.breaker.stats(),
+            'transcriptions_in_flight': self.limiter.stats(),
+            'realtime_sessions': self.realtime_limiter.stats(),
+            'assemblyai_http': self.client.transport.stats(),
+            'transcription_cache': self.cache.stats(),
+        }
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CHUNK_SIZE = 64 * 1024
+
+
+def audio_digest(audio_path):
+    """SHA-256 de un archivo de audio, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(audio_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """Caché de transcripciones por hash del audio, idioma y opciones.
+
+    Un reintento con el mismo clip devuelve el resultado sin volver a subirlo.
+    En memoria es un LRU acotado con TTL; con `path` se persiste además en
+    SQLite para sobrevivir a reinicios. Solo se guardan transcripciones
+    correctas, y el resultado es el texto en bruto (antes de interpretar el
+    campo), así que sirve para cualquier campo del formulario.
+    """
+
+    def __init__(self, maxsize=256, ttl=86400, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # key -> (expires_at, result, elapsed)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS transcriptions (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    elapsed REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+
+    @staticmethod
+    def key_for(audio_hash, language_code='es', options=None):
+        options = json.dumps(options or {}, sort_keys=True)
+        return hashlib.sha256(f"{audio_hash}:{language_code}:{options}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    'SELECT expires_at, result, elapsed FROM transcriptions WHERE key = ? AND expires_at > ?',
+                    (key, now)
+                ).fetchone()
+                if row:
+                    entry = (row[0], json.loads(row[1]), row[2])
+                    self._store(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[2]
+            return dict(entry[1])
+
+    def put(self, key, result, elapsed=0.0):
+        """Guardar una transcripción correcta; `elapsed` es lo que costó obtenerla"""
+        if 'error' in result:
+            return
+        entry = (time.time() + self.ttl, dict(result), elapsed)
+        with self._lock:
+            self._store(key, entry)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO transcriptions (key, result, elapsed, expires_at) VALUES (?, ?, ?, ?)',
+                        (key, json.dumps(entry[1]), elapsed, entry[0])
+                    )
+                    self._db.execute('DELETE FROM transcriptions WHERE expires_at <= ?', (time.time(),))
+                    self._db.commit()
+                except sqlite3.Error:
+                    # p. ej. "database is locked" con varios workers: no dejar la transacción abierta
+                    self._db.rollback()
+                    raise
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 1),
+            }
@@ -0,0 +1,329 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit_breaker import ServiceUnavailable
+
+
+class TranscriptionJob:
+    """Estado de una transcripción encolada"""
+
+    def __init__(self, audio_path, field=None, cache_key=None):
+        self.id = uuid.uuid4().hex
+        self.audio_path = audio_path
+        self.field = field
+        self.cache_key = cache_key
+        self.status = 'queued'  # queued -> processing -> completed | error
+        self.transcript_id = None
+        self.result = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.next_poll = None
+        self.poll_interval = None
+        self.holds_slot = False
+
+    def to_dict(self):
+        data = {'job_id': self.id, 'status': self.status}
+        if self.result is not None:
+            data.update(self.result)
+        return data
+
+
+class TranscriptionQueue:
+    """Cola de transcripciones con un único hilo de polling para todos los trabajos.
+
+    La subida del audio a AssemblyAI se hace en un pool pequeño de hilos; a
+    partir de ahí un solo hilo consulta por turnos todas las transcripciones
+    pendientes, de modo que ninguna petición HTTP queda bloqueada esperando.
+    Si AssemblyAI avisa por webhook (`notify`), la consulta se adelanta y el
+    polling periódico queda solo como respaldo. Los resultados se guardan en
+    memoria hasta `result_ttl` segundos.
+
+    Con `breaker` abierto o sin plaza en `limiter` (ConcurrencyLimiter),
+    `submit` rechaza el trabajo al instante con ServiceUnavailable en vez de
+    acumular audios que no se van a poder transcribir a tiempo.
+
+    Con varios workers, la consulta del estado puede llegar a un proceso
+    distinto del que tiene el trabajo: con `shared` (un almacén de
+    state_store) cada cambio de estado se publica ahí y `get` lo consulta
+    si el trabajo no es de este proceso. Lo mismo con el webhook: si llega a
+    otro worker, `notify` deja el aviso en `shared` y, con `webhook=True`,
+    el hilo de polling del dueño lo mira cada `shared_check_interval`
+    segundos mientras tenga trabajos en curso.
+    """
+
+    def __init__(self, transcriber, voice_manager, cache=None, upload_workers=2, poll_interval=1.0,
+                 max_poll_interval=5.0, timeout=120, result_ttl=600, breaker=None, limiter=None,
+                 shared=None, webhook=False, shared_check_interval=0.5):
+        self.transcriber = transcriber
+        self.voice_manager = voice_manager
+        self.cache = cache
+        self.breaker = breaker
+        self.limiter = limiter
+        self.shared = shared
+        self.webhook = webhook
+        self.shared_check_interval = shared_check_interval
+        self.upload_workers = upload_workers
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._by_transcript = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = None
+        self._poller = None
+
+    def _start(self):
+        if self._poller is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.upload_workers,
+                                                thread_name_prefix='transcribe-upload')
+            self._poller = threading.Thread(target=self._run, daemon=True, name='transcribe-poller')
+            self._poller.start()
+
+    def submit(self, audio_path, field=None, cache_key=None):
+        """Encolar un audio ya guardado en disco; el archivo pasa a ser de la cola"""
+        job = TranscriptionJob(audio_path, field, cache_key)
+        cached = self.cache.get(cache_key) if self.cache is not None and cache_key else None
+        if cached is None:
+            try:
+                self._admit(job)
+            except ServiceUnavailable:
+                self._discard_audio(job)
+                raise
+        with self._lock:
+            self._start()
+            self._jobs[job.id] = job
+        self._publish(job)
+        if cached is not None:
+            # Mismo audio ya transcrito: sin subida ni polling
+            self._discard_audio(job)
+            self._finish(job, cached)
+        else:
+            self._executor.submit(self._upload, job)
+        return job
+
+    def _admit(self, job):
+        # Con el circuito abierto ni siquiera se ocupa plaza
+        if self.breaker is not None and self.breaker.state == self.breaker.OPEN:
+            raise ServiceUnavailable(
+                'El servicio de transcripción no responde; inténtelo de nuevo en unos segundos',
+                'circuit_open', self.breaker.retry_after()
+            )
+        if self.limiter is not None:
+            self.limiter.acquire()
+            job.holds_slot = True
+
+    def _release(self, job):
+        """Liberar la plaza del trabajo; se llama con el lock tomado al cerrarlo"""
+        if job.holds_slot:
+            job.holds_slot = False
+            self.limiter.release()
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.to_dict()
+        # Trabajo de otro worker
+        return self.shared.get(self._shared_key(job_id)) if self.shared is not None else None
+
+    @staticmethod
+    def _shared_key(job_id):
+        return f'transcription:{job_id}'
+
+    @staticmethod
+    def _ready_key(transcript_id):
+        return f'transcript-ready:{transcript_id}'
+
+    def _publish(self, job):
+        if self.shared is None:
+            return
+        with self._lock:
+            snapshot = job.to_dict()
+        try:
+            self.shared.set(self._shared_key(job.id), snapshot, ttl=self.timeout + self.result_ttl)
+        except Exception as e:
+            print(f"⚠️ No se pudo publicar el estado del trabajo {job.id}: {e}")
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status in ('queued', 'processing'))
+
+    def notify(self, transcript_id):
+        """Webhook: la transcripción terminó, consultarla ya en vez de esperar al siguiente turno.
+
+        Si no es de este proceso se deja el aviso en `shared` para el worker
+        que la tenga; devuelve False solo si no hay a quién avisar.
+        """
+        with self._lock:
+            job = self._by_transcript.get(transcript_id)
+            if job is not None and job.finished_at is None:
+                job.next_poll = time.time()
+        if job is not None:
+            if job.finished_at is not None:
+                return False
+            self._wake.set()
+            return True
+        if self.shared is None:
+            return False
+        try:
+            self.shared.set(self._ready_key(transcript_id), {'at': time.time()}, ttl=self.timeout)
+        except Exception as e:
+            print(f"⚠️ No se pudo publicar el aviso de {transcript_id}: {e}")
+            return False
+        return True
+
+    def _notified_elsewhere(self, due):
+        """Trabajos en curso cuyo webhook recibió otro worker"""
+        if not self.webhook or self.shared is None:
+            return []
+        with self._lock:
+            waiting = [job for job in self._jobs.values()
+                       if job.status == 'processing' and job.finished_at is None and job not in due]
+        ready = []
+        for job in waiting:
+            key = self._ready_key(job.transcript_id)
+            try:
+                if self.shared.get(key) is None:
+                    continue
+                self.shared.delete(key)
+            except Exception as e:
+                print(f"⚠️ No se pudo leer el aviso de {job.transcript_id}: {e}")
+                continue
+            ready.append(job)
+        return ready
+
+    def _upload(self, job):
+        try:
+            started = self.transcriber.start_transcription(job.audio_path)
+        except Exception as e:
+            started = {'error': f'Error en transcripción: {str(e)}'}
+        finally:
+            self._discard_audio(job)
+
+        if 'error' in started:
+            self._finish(job, started)
+            return
+        with self._lock:
+            if job.finished_at is not None:
+                return  # Caducó mientras se subía
+            job.transcript_id = started['transcript_id']
+            self._by_transcript[job.transcript_id] = job
+            job.status = 'processing'
+            job.poll_interval = self.poll_interval
+            job.next_poll = time.time() + job.poll_interval
+        self._publish(job)
+        self._wake.set()
+
+    def _discard_audio(self, job):
+        try:
+            os.remove(job.audio_path)
+        except OSError:
+            pass
+
+    def _finish(self, job, result):
+        if self.cache is not None and job.cache_key and job.transcript_id:
+            try:
+                self.cache.put(job.cache_key, result, elapsed=time.time() - job.created_at)
+            except Exception as e:
+                # Sin caché la transcripción sigue siendo válida
+                print(f"⚠️ No se pudo guardar en caché la transcripción {job.transcript_id}: {e}")
+        if 'error' not in result:
+            try:
+                result = self.voice_manager.interpret(result, job.field)
+            except Exception as e:
+                result = {'error': f'Error procesando audio: {str(e)}'}
+        self._close(job, result)
+
+    def _close(self, job, result):
+        with self._lock:
+            if job.finished_at is not None:
+                return
+            job.result = result
+            job.status = 'error' if 'error' in result else 'completed'
+            job.finished_at = time.time()
+            self._release(job)
+        self._publish(job)
+
+    def _due_jobs(self, now):
+        """Trabajos a consultar ahora y segundos hasta el siguiente"""
+        due = []
+        expired = []
+        wait = None
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished_at is not None:
+                    if now - job.finished_at > self.result_ttl:
+                        del self._jobs[job_id]
+                        self._by_transcript.pop(job.transcript_id, None)
+                    continue
+                if now - job.created_at > self.timeout:
+                    job.result = {'error': f'Timeout después de {self.timeout} segundos'}
+                    job.status = 'error'
+                    job.finished_at = now
+                    self._release(job)
+                    expired.append(job)
+                    continue
+                if job.status != 'processing':
+                    continue
+                if job.next_poll <= now:
+                    due.append(job)
+                else:
+                    remaining = job.next_poll - now
+                    wait = remaining if wait is None else min(wait, remaining)
+        for job in expired:
+            self._publish(job)
+        return due, wait
+
+    def _poll(self, job):
+        """Consultar un trabajo; devuelve los segundos hasta la siguiente consulta, o None si terminó"""
+        try:
+            result = self.transcriber.check_transcription(job.transcript_id)
+        except Exception as e:
+            print(f"⏰ Error consultando transcripción {job.transcript_id}, reintentando: {e}")
+            result = None
+        if result is not None:
+            self._finish(job, result)
+            return None
+        with self._lock:
+            job.poll_interval = min(job.poll_interval * 1.5, self.max_poll_interval)
+            job.next_poll = time.time() + job.poll_interval
+        return job.poll_interval
+
+    def _cycle(self):
+        """Una vuelta del hilo de polling; devuelve los segundos a esperar hasta la siguiente"""
+        due, wait = self._due_jobs(time.time())
+        due += self._notified_elsewhere(due)
+        for job in due:
+            try:
+                retry_in = self._poll(job)
+            except Exception as e:
+                # Fallo inesperado con este trabajo: se cierra y libera su plaza
+                print(f"❌ Error procesando la transcripción {job.transcript_id}: {e}")
+                self._close(job, {'error': f'Error procesando transcripción: {str(e)}'})
+                continue
+            if retry_in is not None:
+                wait = retry_in if wait is None else min(wait, retry_in)
+        if due:
+            return 0
+        if self.webhook and self.shared is not None and self.pending():
+            # Avisos recibidos por otros workers
+            wait = self.shared_check_interval if wait is None else min(wait, self.shared_check_interval)
+        # Sin trabajos en curso se despierta igualmente para caducar resultados
+        return wait if wait is not None else self.poll_interval * 10
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                wait = self._cycle()
+            except Exception as e:
+                # Es el único hilo que consulta: un error no puede dejar colgados los trabajos
+                print(f"❌ Error en el hilo de transcripciones: {e}")
+                wait = self.poll_interval
+            if wait > 0:
+                self._wake.wait(wait)
@@ -0,0 +1,191 @@
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Respuestas que merece la pena reintentar: límite de peticiones y errores del servidor
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# En métodos no idempotentes un 5xx puede llegar después de crear el recurso;
+# un 429 garantiza que la petición no se procesó
+UNPROCESSED_STATUSES = frozenset({429})
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+# Timeouts (conexión, lectura) por tipo de llamada
+API_TIMEOUT = (5, 30)
+UPLOAD_TIMEOUT = (5, 120)
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class StreamingBody:
+    """Cuerpo de subida por bloques a partir de una ruta o un objeto tipo archivo.
+
+    Cada llamada devuelve un generador nuevo desde el principio, de modo que
+    el transporte puede reintentar sin haber leído el archivo entero en
+    memoria. Un stream sin `seek` (p. ej. el de la petición entrante) solo se
+    puede enviar una vez: `replayable` es False y no se reintenta.
+    """
+
+    def __init__(self, source, chunk_size=UPLOAD_CHUNK_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self._is_path = isinstance(source, (str, bytes, os.PathLike))
+        self._start = None
+        if not self._is_path:
+            try:
+                self._start = source.tell() if source.seekable() else None
+            except (AttributeError, OSError):
+                self._start = None
+        self.replayable = self._is_path or self._start is not None
+        self._used = False
+
+    def __call__(self):
+        if self._used and not self.replayable:
+            raise RuntimeError('El cuerpo de la subida no se puede volver a enviar')
+        self._used = True
+        if self._is_path:
+            return self._read_path()
+        if self._start is not None:
+            self.source.seek(self._start)
+        return self._read_stream(self.source)
+
+    def _read_path(self):
+        with open(self.source, 'rb') as f:
+            yield from self._read_stream(f)
+
+    def _read_stream(self, stream):
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def failed_to_connect(error):
+    """¿Falló la conexión antes de enviar la petición? Entonces es seguro repetirla"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # requests envuelve el MaxRetryError de urllib3, cuyo `reason` es la causa real
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+class HttpTransport:
+    """Sesión HTTP compartida por los clientes de AssemblyAI.
+
+    Mantiene las conexiones abiertas (keep-alive) en un pool de urllib3, así
+    que subida, creación y polling reutilizan la misma conexión TLS.
+    Reintenta con backoff exponencial y jitter. Los métodos idempotentes se
+    reintentan ante 429/5xx, timeouts y cualquier fallo de conexión; los
+    demás (POST) solo si la conexión no llegó a establecerse o ante un 429,
+    para no crear dos veces la misma transcripción. `idempotent=True` marca
+    un POST que se puede repetir sin efectos (p. ej. la subida del audio).
+
+    Con un `breaker` (CircuitBreaker) cada petición, con sus reintentos,
+    cuenta como un éxito o un fallo, y con el circuito abierto se lanza
+    ServiceUnavailable sin llegar a conectar. `guarded=False` deja una
+    petición fuera del circuito: las consultas de estado son muchas y baratas
+    y, si contaran, sus éxitos diluirían los fallos de subidas y creaciones.
+    """
+
+    def __init__(self, pool_size=10, retries=3, backoff=0.5, max_backoff=8.0, timeout=API_TIMEOUT,
+                 breaker=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.breaker = breaker
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'retries': 0, 'failures': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _delay(self, attempt, response=None):
+        """Espera antes del reintento: Retry-After si lo hay, si no backoff con jitter"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def request(self, method, url, timeout=None, retries=None, idempotent=None, guarded=True, **kwargs):
+        if self.breaker is None or not guarded:
+            return self._request(method, url, timeout, retries, idempotent, **kwargs)
+        self.breaker.check()
+        try:
+            response = self._request(method, url, timeout, retries, idempotent, **kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        if response.status_code in RETRY_STATUSES:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _request(self, method, url, timeout=None, retries=None, idempotent=None, **kwargs):
+        method = method.upper()
+        retries = self.retries if retries is None else retries
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        # Un StreamingBody se vuelve a generar en cada intento
+        body = kwargs.pop('data', None)
+        if isinstance(body, StreamingBody) and not body.replayable:
+            retries = 0
+        for attempt in range(retries + 1):
+            self._count('requests')
+            if isinstance(body, StreamingBody):
+                kwargs['data'] = body()
+            elif body is not None:
+                kwargs['data'] = body
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                retryable = idempotent or failed_to_connect(e)
+                if attempt >= retries or not retryable:
+                    self._count('failures')
+                    raise
+                delay = self._delay(attempt)
+            else:
+                if response.status_code not in retry_statuses or attempt >= retries:
+                    return response
+                delay = self._delay(attempt, response)
+                response.close()
+            self._count('retries')
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """Contadores de peticiones, reintentos y reutilización de conexiones"""
+        with self._lock:
+            stats = dict(self._counters)
+        opened = sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                sent += pool.num_requests
+        stats['connections_opened'] = opened
+        stats['connections_reused'] = max(sent - opened, 0)
+        return stats
+
+
+# Instancia compartida por todos los clientes del proceso
+default_transport = HttpTransport()
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import re
+import threading
+import time
+
+# Nombres por contenido (`<sha256>...`) y variantes (`<stem>.<size>.<fmt>`)
+CONTENT_ADDRESSED_PREFIX = re.compile(r'^[0-9a-f]{64}')
+DERIVATIVE_NAME = re.compile(r'^(?P<stem>.+)\.(thumb|display)\.(webp|jpeg)$')
+TEMP_PREFIX = '.upload-'
+
+
+def owner_stem(file_name):
+    """Nombre base (sin extensión) del archivo original al que pertenece un archivo"""
+    match = DERIVATIVE_NAME.match(file_name)
+    if match:
+        return match.group('stem')
+    return os.path.splitext(file_name)[0]
+
+
+def shard_dir(file_name):
+    """Subcarpeta `ab/cd` de un archivo; las variantes caen junto a su original"""
+    if CONTENT_ADDRESSED_PREFIX.match(file_name):
+        key = file_name[:4]
+    else:
+        key = hashlib.sha256(owner_stem(file_name).encode('utf-8')).hexdigest()[:4]
+    return os.path.join(key[:2], key[2:4])
+
+
+def sharded_path(upload_folder, file_name):
+    """Ruta donde se escriben los archivos nuevos"""
+    return os.path.join(upload_folder, shard_dir(file_name), file_name)
+
+
+def stored_name(file_path):
+    """Nombre de archivo de un `Evidence.file_path`.
+
+    Las filas antiguas guardaban la ruta completa (`uploads/foo.jpg`, o con
+    barras invertidas en Windows); las nuevas, solo el nombre.
+    """
+    return (file_path or '').replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def resolve(upload_folder, file_name):
+    """Ruta existente de un archivo, en el esquema por carpetas o en el plano antiguo"""
+    if not file_name or '/' in file_name or '\\' in file_name or file_name.startswith('.'):
+        return None
+    sharded = sharded_path(upload_folder, file_name)
+    if os.path.isfile(sharded):
+        return sharded
+    flat = os.path.join(upload_folder, file_name)
+    if os.path.isfile(flat):
+        return flat
+    # Puede haberse movido entre las dos comprobaciones durante la migración
+    return sharded if os.path.isfile(sharded) else None
+
+
+def migrate_flat_uploads(upload_folder, batch_size=500, pause=0.0, stop_event=None):
+    """Mover los archivos de la carpeta plana al esquema `ab/cd/<nombre>`.
+
+    Es reanudable: lo que queda en la raíz es lo pendiente, así que se puede
+    interrumpir y volver a lanzar. Devuelve el número de archivos movidos.
+    """
+    moved = 0
+    while stop_event is None or not stop_event.is_set():
+        batch = []
+        with os.scandir(upload_folder) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and not entry.name.startswith('.'):
+                    batch.append(entry.name)
+                    if len(batch) >= batch_size:
+                        break
+        if not batch:
+            break
+
+        for file_name in batch:
+            target = sharded_path(upload_folder, file_name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            try:
+                os.replace(os.path.join(upload_folder, file_name), target)
+                moved += 1
+            except FileNotFoundError:
+                pass  # Borrado mientras tanto
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def start_background_migration(upload_folder, batch_size=500, pause=0.5):
+    """Lanzar la migración en un hilo daemon (para arrancar con la app)"""
+    def run():
+        moved = migrate_flat_uploads(upload_folder, batch_size=batch_size, pause=pause)
+        if moved:
+            print(f"✅ Migración de subidas: {moved} archivos movidos a subcarpetas")
+
+    thread = threading.Thread(target=run, daemon=True, name='upload-migration')
+    thread.start()
+    return thread
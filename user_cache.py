@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload, object_session
+
+from cache_sync import SharedVersion
+from models import db, User, Department, Position
+from refdata import RefSnapshot
+
+
+class UserSnapshot:
+    """Copia ligera de un usuario para Flask-Login.
+
+    No está ligada a la sesión de SQLAlchemy: leerla no dispara consultas.
+    Para modificar el perfil hay que cargar el `User` real.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.role = user.role
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+        self.phone = user.phone
+        self.department_id = user.department_id
+        self.position_id = user.position_id
+        self.department = RefSnapshot(user.department.id, user.department.name) if user.department else None
+        self.position = RefSnapshot(user.position.id, user.position.name) if user.position else None
+        self.is_active = bool(user.is_active)
+
+    def get_id(self):
+        return str(self.id)
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def is_manager(self):
+        return self.role in ['admin', 'manager']
+
+    @property
+    def full_name(self):
+        return f"{self.first_name} {self.last_name}"
+
+
+class UserCache:
+    """Caché LRU con TTL de `UserSnapshot` por id de usuario.
+
+    Los cambios confirmados en otro worker se ven a través de `version`
+    (ver cache_sync): cualquier cambio de usuario descarta todas las
+    entradas cargadas con la versión anterior.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = SharedVersion('users')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        """Devolver el snapshot del usuario, consultando la base solo si no está en caché"""
+        now = time.monotonic()
+        version = self.version.current()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now and entry[2] == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = db.session.execute(
+            db.select(User)
+            .options(joinedload(User.department), joinedload(User.position))
+            .where(User.id == user_id)
+        ).scalar_one_or_none()
+        if user is None:
+            return None
+
+        snapshot = UserSnapshot(user)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, snapshot, version)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_user(mapper, connection, target):
+    # Cubre cambios de perfil, rol y desactivación. Se repite tras el commit
+    # para no dejar en caché una lectura hecha entre el flush y el commit.
+    user_cache.invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('stale_user_ids', set()).add(target.id)
+    # Y en los demás workers
+    user_cache.version.bump_on_commit(session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop('stale_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Department, 'after_update')
+@event.listens_for(Department, 'after_delete')
+@event.listens_for(Position, 'after_update')
+@event.listens_for(Position, 'after_delete')
+def _invalidate_all_users(mapper, connection, target):
+    # Los snapshots llevan el nombre del departamento/posición
+    user_cache.clear()
+    user_cache.version.bump_on_commit(object_session(target))
@@ -0,0 +1,335 @@
+"""Reconocimiento de comandos y campos en el texto transcrito.
+
+Las frases clave se buscan de forma lineal con `str.find`, exigiendo límite
+de palabra; con tan pocas frases es lo más rápido (una alternancia compilada
+resultó más lenta). Entre las coincidencias gana la frase más larga: en
+"tengo un correo ..." manda "correo" y no "tengo".
+
+Incluye extractores tipados, con expresiones precompiladas, para lo que se
+dicta en el formulario: números en palabras ("veinticinco"), teléfonos
+dígito a dígito y correos con "arroba" y "punto".
+
+`python voice_matcher.py` ejecuta un benchmark sobre un corpus sintético.
+"""
+import re
+import unicodedata
+
+FIELD_KEYWORDS = {
+    'nombre': ['nombre', 'llámame', 'me llamo', 'mi nombre es', 'soy'],
+    'apellido': ['apellido', 'apellidos', 'mis apellidos'],
+    'edad': ['edad', 'años', 'tengo', 'mi edad es'],
+    'correo': ['correo', 'email', 'mail', 'correo electrónico'],
+    'celular': ['celular', 'teléfono', 'número', 'contacto', 'móvil'],
+}
+
+COMMANDS = {
+    'next_field': ['siguiente', 'continuar', 'next', 'adelante'],
+    'previous_field': ['anterior', 'atrás', 'back', 'regresar'],
+    'submit_form': ['enviar', 'registrar', 'finalizar', 'terminar'],
+    'clear_form': ['limpiar', 'borrar', 'reset', 'empezar de nuevo'],
+    'show_help': ['ayuda', 'help', 'asistencia'],
+}
+
+STOPWORDS = frozenset(['es', 'de', 'el', 'la', 'los', 'las', 'un', 'una', 'y', 'o', 'que', 'en'])
+# Palabras de relleno entre la frase clave y el valor ("mi correo ES ...")
+LEADING_FILLERS = STOPWORDS | {'son', 'mi', 'mis', 'sería', 'seria'}
+_PUNCTUATION = str.maketrans('', '', '.,')
+
+UNITS = {
+    'cero': 0, 'uno': 1, 'un': 1, 'una': 1, 'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5,
+    'seis': 6, 'siete': 7, 'ocho': 8, 'nueve': 9,
+}
+TEENS = {
+    'diez': 10, 'once': 11, 'doce': 12, 'trece': 13, 'catorce': 14, 'quince': 15,
+    'dieciséis': 16, 'dieciseis': 16, 'diecisiete': 17, 'dieciocho': 18, 'diecinueve': 19,
+    'veinte': 20, 'veintiuno': 21, 'veintiún': 21, 'veintiun': 21, 'veintidós': 22, 'veintidos': 22,
+    'veintitrés': 23, 'veintitres': 23, 'veinticuatro': 24, 'veinticinco': 25,
+    'veintiséis': 26, 'veintiseis': 26, 'veintisiete': 27, 'veintiocho': 28, 'veintinueve': 29,
+}
+TENS = {
+    'treinta': 30, 'cuarenta': 40, 'cincuenta': 50, 'sesenta': 60,
+    'setenta': 70, 'ochenta': 80, 'noventa': 90,
+}
+HUNDREDS = {
+    'cien': 100, 'ciento': 100, 'doscientos': 200, 'trescientos': 300, 'cuatrocientos': 400,
+    'quinientos': 500, 'seiscientos': 600, 'setecientos': 700, 'ochocientos': 800,
+    'novecientos': 900,
+}
+EMAIL_WORDS = [
+    ('guion bajo', '_'), ('guión bajo', '_'), ('arroba', '@'), ('punto', '.'),
+    ('guion', '-'), ('guión', '-'),
+]
+EMAIL_PATTERN = re.compile(r'[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)+')
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+class PhraseMatcher:
+    """Frases etiquetadas buscadas una a una con `str.find`.
+
+    Con unas decenas de frases cortas, recorrer la lista con `find` (en C)
+    y parar en la primera que aparece es más rápido que una alternancia
+    compilada. Solo cuentan apariciones con límite de palabra a ambos lados
+    ("soy" no salta dentro de otra palabra).
+    """
+
+    def __init__(self, phrases_by_label):
+        labels = {}
+        for label, phrases in phrases_by_label.items():
+            for phrase in phrases:
+                labels.setdefault(phrase.lower(), label)
+        # De más larga a más corta: la primera que aparece es la mejor
+        self._phrases = sorted(((phrase, len(phrase), label) for phrase, label in labels.items()),
+                               key=lambda item: item[1], reverse=True)
+
+    def best(self, text):
+        """(etiqueta, frase, inicio, fin) de la frase más larga; a igual longitud, la primera"""
+        text = text.lower()
+        find = text.find
+        best = None
+        for phrase, length, label in self._phrases:
+            if best is not None and length < len(best[1]):
+                break
+            start = find(phrase)
+            while start != -1:
+                end = start + length
+                if _word_boundary(text, start - 1) and _word_boundary(text, end):
+                    if best is None or start < best[2]:
+                        best = (label, phrase, start, end)
+                    break
+                start = find(phrase, start + 1)
+        return best
+
+
+def _word_boundary(text, index):
+    """¿Está `index` fuera de una palabra (o fuera del texto)?"""
+    if index < 0 or index >= len(text):
+        return True
+    char = text[index]
+    return not (char.isalnum() or char == '_')
+
+
+def strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+
+def spoken_numbers(text):
+    """Números de un texto, en cifras o en palabras, en orden de aparición.
+
+    Las palabras se agrupan mientras formen un mismo número ("noventa y
+    ocho", "ciento veinte"); una unidad tras otra empieza un número nuevo,
+    como al dictar un teléfono ("nueve ocho siete").
+    """
+    numbers = []
+    current = None
+    last_kind = None
+    pending_y = False
+
+    def flush():
+        nonlocal current, last_kind, pending_y
+        if current is not None:
+            numbers.append(current)
+        current, last_kind, pending_y = None, None, False
+
+    for token in _TOKEN.findall(text.lower()):
+        if token.isdigit():
+            flush()
+            numbers.append(int(token))
+            continue
+        if token == 'y' and last_kind == 'tens':
+            pending_y = True
+            continue
+        if token in UNITS:
+            if current is not None and (last_kind in ('hundreds', 'thousands') or pending_y):
+                current += UNITS[token]
+            else:
+                flush()
+                current = UNITS[token]
+            last_kind = 'units'
+        elif token in TEENS:
+            if current is not None and last_kind in ('hundreds', 'thousands'):
+                current += TEENS[token]
+            else:
+                flush()
+                current = TEENS[token]
+            last_kind = 'teens'
+        elif token in TENS:
+            if current is not None and last_kind in ('hundreds', 'thousands'):
+                current += TENS[token]
+            else:
+                flush()
+                current = TENS[token]
+            last_kind = 'tens'
+        elif token in HUNDREDS:
+            if current is not None and last_kind == 'thousands':
+                current += HUNDREDS[token]
+            else:
+                flush()
+                current = HUNDREDS[token]
+            last_kind = 'hundreds'
+        elif token == 'mil':
+            current = (current or 1) * 1000
+            last_kind = 'thousands'
+        else:
+            flush()
+            continue
+        pending_y = False
+    flush()
+    return numbers
+
+
+def extract_number(text):
+    numbers = spoken_numbers(text)
+    return numbers[0] if numbers else None
+
+
+def extract_phone(text):
+    """Dígitos de un teléfono dictado en cifras o palabras ("nueve ocho siete...")"""
+    digits = ''.join(str(number) for number in spoken_numbers(text))
+    return digits or None
+
+
+def extract_email(text):
+    """Correo dictado: "juan punto perez arroba gmail punto com" -> juan.perez@gmail.com"""
+    spoken = f" {strip_accents(text.lower())} "
+    for word, symbol in EMAIL_WORDS:
+        spoken = spoken.replace(f" {strip_accents(word)} ", f" {symbol} ")
+    compact = re.sub(r'\s+', '', spoken)
+    match = EMAIL_PATTERN.search(compact)
+    return match.group(0) if match else None
+
+
+def clean_text(text):
+    """Quitar palabras vacías y puntuación y capitalizar"""
+    words = [word for word in text.split() if word not in STOPWORDS]
+    return ' '.join(words).title().translate(_PUNCTUATION).strip()
+
+
+class VoiceMatcher:
+    """Comandos, campos y valores tipados a partir del texto transcrito"""
+
+    EXTRACTORS = {
+        'edad': lambda text: _as_text(extract_number(text)),
+        'celular': extract_phone,
+        'correo': extract_email,
+    }
+
+    def __init__(self, field_keywords=FIELD_KEYWORDS, commands=COMMANDS):
+        self._commands = PhraseMatcher(commands)
+        self._fields = PhraseMatcher(field_keywords)
+
+    def scan(self, text):
+        """Mejor comando y mejor campo del texto (cualquiera puede ser None)"""
+        return self._commands.best(text), self._fields.best(text)
+
+    def detect_command(self, text):
+        command = self._commands.best(text)
+        return command[0] if command else None
+
+    def detect_field(self, text):
+        """(campo, frase, texto que sigue a la frase) o None"""
+        match = self._fields.best(text)
+        return self._field_value(text, match) if match else None
+
+    @staticmethod
+    def _field_value(text, match):
+        field, phrase, _, end = match
+        words = text[end:].split()
+        while words and words[0] in LEADING_FILLERS:
+            words.pop(0)
+        return field, phrase, ' '.join(words)
+
+    def extract(self, field, text, fallback_text=None):
+        """Valor del campo: tipado si hay extractor, si no el texto limpio"""
+        extractor = self.EXTRACTORS.get(field)
+        if extractor is not None:
+            value = extractor(text)
+            if value is None and fallback_text:
+                value = extractor(fallback_text)  # p. ej. "25 años": el número va antes
+            if value is not None:
+                return value
+        return clean_text(text)
+
+    def match(self, text, current_field=None):
+        """Interpretar un texto ya en minúsculas; devuelve el dict que espera el formulario"""
+        if current_field:
+            return {'field': current_field, 'value': self.extract(current_field, text)}
+
+        # Como antes: un comando manda sobre cualquier campo
+        command = self._commands.best(text)
+        if command:
+            return {'action': command[0]}
+
+        field_match = self._fields.best(text)
+        if field_match:
+            field, _, rest = self._field_value(text, field_match)
+            return {'field': field, 'value': self.extract(field, rest, text), 'action': 'fill_field'}
+        return {'field': 'unknown', 'value': clean_text(text), 'action': 'unknown'}
+
+    def match_many(self, texts, current_field=None):
+        return [self.match(text.lower().strip(), current_field) for text in texts]
+
+
+def _as_text(number):
+    return None if number is None else str(number)
+
+
+default_matcher = VoiceMatcher()
+
+
+def _legacy_match(text, field_keywords=FIELD_KEYWORDS, commands=COMMANDS):
+    """Búsqueda lineal anterior (solo para comparar en el benchmark)"""
+    for action, keywords in commands.items():
+        if any(keyword in text for keyword in keywords):
+            return {'action': action}
+    for field, keywords in field_keywords.items():
+        for keyword in keywords:
+            if keyword in text:
+                return {'field': field}
+    return {'field': 'unknown'}
+
+
+def benchmark(size=20000):
+    import random
+    import time
+
+    templates = [
+        'mi nombre es {name}', 'me llamo {name}', 'mis apellidos son {surname}',
+        'tengo {age} años', 'mi edad es {age}', 'mi correo es {user} arroba gmail punto com',
+        'tengo un correo {user} punto dev arroba empresa punto pe',
+        'mi número es nueve ocho siete seis cinco cuatro tres dos uno', 'siguiente',
+        'quiero volver atrás', 'por favor enviar el formulario', 'hola buenos días',
+    ]
+    names = ['juan pérez', 'maría lópez', 'carlos ruiz', 'ana torres']
+    ages = ['veinticinco', 'treinta y dos', '41', 'diecinueve']
+    rng = random.Random(42)
+    corpus = [
+        rng.choice(templates).format(name=rng.choice(names), surname=rng.choice(names),
+                                     age=rng.choice(ages), user=rng.choice(['juan', 'mlopez']))
+        for _ in range(size)
+    ]
+
+    start = time.perf_counter()
+    for text in corpus:
+        _legacy_match(text)
+    legacy = time.perf_counter() - start
+
+    matcher = VoiceMatcher()
+    start = time.perf_counter()
+    for text in corpus:
+        matcher.detect_command(text) or matcher.detect_field(text)
+    detection = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = matcher.match_many(corpus)
+    compiled = time.perf_counter() - start
+
+    print(f"Corpus: {size} transcripciones")
+    print(f"Búsqueda lineal (solo detección): {legacy * 1e6 / size:.1f} µs/texto")
+    print(f"VoiceMatcher (solo detección): {detection * 1e6 / size:.1f} µs/texto")
+    print(f"VoiceMatcher (detección + extracción): {compiled * 1e6 / size:.1f} µs/texto")
+    for text, result in list(zip(corpus, results))[:6]:
+        print(f"  {text!r} -> {result}")
+
+
+if __name__ == '__main__':
+    benchmark()
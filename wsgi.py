@@ -0,0 +1,4 @@
+# Punto de entrada de gunicorn (wsgi:app) y de `flask` sin --app
+from app import create_app
+
+app = create_app()